@@ -0,0 +1,101 @@
+# Boot benchmark. Boots the app N times (fresh python process each time, like a new gunicorn worker) against the LOCAL data lake
+# and reports percentiles of the startup profile (see flask_app/dash_app/startup_profiler.py), total and per phase.
+#
+# python benchmark_boot.py --runs 5                         (warm: blob cache/snapshots in place after the first boot)
+# python benchmark_boot.py --runs 5 --cold                  (fresh snapshot dir each boot)
+# python benchmark_boot.py --runs 5 --out boot.json         (save results, e.g. as a baseline)
+# python benchmark_boot.py --runs 5 --baseline boot.json    (exit 1 if p50 boot time regressed more than --tolerance vs the baseline)
+#
+# Needs a local copy of the containers in ATLAS_LOCAL_LAKE_DIR (default ./lake), i.e. lake/titanium/...
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+import tempfile
+import numpy as np
+
+
+def boot_once(env, profile_path):
+    # boot the whole flask + dash app in a new interpreter, return its startup profile
+    env = dict(env)
+    env["ATLAS_STARTUP_PROFILE"] = profile_path
+    subprocess.run([sys.executable, '-c', 'import wsgi'], env=env, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    with open(profile_path) as f:
+        return json.load(f)
+
+
+def percentiles(values):
+    return {"p50": round(float(np.percentile(values, 50)), 3),
+            "p90": round(float(np.percentile(values, 90)), 3),
+            "max": round(float(np.max(values)), 3)}
+
+
+def summarise(profiles):
+    # percentiles of total boot time, peak rss, and wall time of each phase across runs
+    summary = {"runs": len(profiles),
+               "total_s": percentiles([p["total_s"] for p in profiles]),
+               "peak_rss_mb": percentiles([p["peak_rss_mb"] for p in profiles]),
+               "bytes_read_mb": percentiles([p["bytes_read_mb"] for p in profiles]),
+               "phases": {}}
+
+    names = []
+    for p in profiles:
+        for ph in p["phases"]:
+            if ph["phase"] not in names: names.append(ph["phase"])
+
+    for name in names:
+        summary["phases"][name] = percentiles([ph["wall_s"] for p in profiles for ph in p["phases"] if ph["phase"] == name])
+
+    return summary
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Boot the app N times against the local data lake and report startup percentiles")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--lake', default=os.getenv("ATLAS_LOCAL_LAKE_DIR", "lake"), help="local copy of the storage containers")
+    parser.add_argument('--cold', action='store_true', help="use a fresh snapshot dir for every boot")
+    parser.add_argument('--out', help="write the summary json here")
+    parser.add_argument('--baseline', help="summary json from a previous run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed p50 slowdown vs baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='atlas_boot_')
+
+    env = dict(os.environ)
+    env["ATLAS_STORAGE_BACKEND"] = "local"
+    env["ATLAS_LOCAL_LAKE_DIR"] = os.path.abspath(args.lake)
+    env.setdefault("AZURE_STORAGE_ACCOUNT_CONTAINER_NAME", "titanium")
+
+    profiles = []
+    for run in range(args.runs):
+        if args.cold or "ATLAS_SNAPSHOT_DIR" not in os.environ: env["ATLAS_SNAPSHOT_DIR"] = os.path.join(work_dir, 'snapshot' + (str(run) if args.cold else ''))
+        profile = boot_once(env, os.path.join(work_dir, 'profile' + str(run) + '.json'))
+        print('Boot', run + 1, 'of', args.runs, ':', profile["total_s"], 's')
+        profiles.append(profile)
+
+    summary = summarise(profiles)
+
+    print('')
+    print('%-45s %9s %9s %9s' % ('', 'p50', 'p90', 'max'))
+    print('%-45s %9.2f %9.2f %9.2f' % ('TOTAL (s)', summary["total_s"]["p50"], summary["total_s"]["p90"], summary["total_s"]["max"]))
+    print('%-45s %9.0f %9.0f %9.0f' % ('peak RSS (MB)', summary["peak_rss_mb"]["p50"], summary["peak_rss_mb"]["p90"], summary["peak_rss_mb"]["max"]))
+    print('%-45s %9.0f %9.0f %9.0f' % ('read (MB)', summary["bytes_read_mb"]["p50"], summary["bytes_read_mb"]["p90"], summary["bytes_read_mb"]["max"]))
+    for name, pct in summary["phases"].items():
+        print('%-45s %9.2f %9.2f %9.2f' % (name, pct["p50"], pct["p90"], pct["max"]))
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+    # regression check
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        limit = baseline["total_s"]["p50"] * (1 + args.tolerance)
+        if summary["total_s"]["p50"] > limit:
+            print('BOOT TIME REGRESSION: p50', summary["total_s"]["p50"], 's vs baseline', baseline["total_s"]["p50"], 's (limit', round(limit, 3), 's)')
+            sys.exit(1)
+        print('Boot time OK: p50', summary["total_s"]["p50"], 's vs baseline', baseline["total_s"]["p50"], 's')
@@ -50,6 +50,7 @@ GLOBE_JSON_OCEAN_LOW_PATH_TITANIUM = "geojson/globe/ne_110m_ocean.geojson"
 MASTER_STATS_PATH = "statistics/master_stats.parquet" #smelting
 MASTER_META_PATH = "meta/master_meta.parquet" #smelting
 MASTER_CONFIG_PATH = "meta/master_config.csv" #smelting
+MASTER_COUNTRIES_PATH = "meta/master_countries.parquet" #smelting (country dimension, master stats carries only its integer country_id)
 
 
 
@@ -0,0 +1,173 @@
+# Geometry refinement for the map and globe geojson (STAGING > TITANIUM)
+# Natural Earth ships full precision coordinates and dozens of properties per feature, nearly all unused by the app.
+# This strips the unused properties, quantises coordinates to a grid and simplifies the borders (per zoom level),
+# without opening gaps or overlaps between neighbouring countries.
+#
+# Topology is kept the same way TopoJSON does it: after quantising, shared borders have identical vertices, so we cut every
+# ring into arcs at junctions (where the set of rings sharing a vertex changes) and simplify each arc ONCE (Douglas-Peucker),
+# in a canonical direction. Both neighbours then get exactly the same simplified border.
+
+import json
+import numpy as np
+
+# the only feature properties the app reads (map: UN_A3, BRK_NAME, MAPCOLOR*, globe: sr_un_a3, red/green/blue, COUNTRY)
+KEEP_PROPERTIES = ['UN_A3', 'BRK_NAME', 'sr_un_a3', 'COUNTRY', 'MAPCOLOR7', 'MAPCOLOR8', 'MAPCOLOR9', 'red', 'green', 'blue']
+
+# per zoom level: decimal places to quantise to (4 = ~11m at the equator), and simplification tolerance in degrees (None = don't simplify)
+LEVELS = {
+    'low':    {'decimals': 3, 'tolerance': 0.02},    # ne_110m map
+    'medium': {'decimals': 4, 'tolerance': 0.005},   # ne_50m map
+    'high':   {'decimals': 5, 'tolerance': 0.001},   # ne_10m map
+    'globe':  {'decimals': 4, 'tolerance': None},    # globe land/ocean (hand prepared polygons, only strip and quantise)
+}
+
+
+def refine_geojson(geojson: dict, level: str) -> dict:
+    # return a new geojson: unused properties stripped, coordinates quantised and simplified for the zoom level
+
+    decimals = LEVELS[level]['decimals']
+    tolerance = LEVELS[level]['tolerance']
+
+    features = []
+    for feature in geojson['features']:
+        f = dict(feature)
+        f['properties'] = {k: v for k, v in feature.get('properties', {}).items() if k in KEEP_PROPERTIES}
+        f['geometry'] = quantise_geometry(feature['geometry'], decimals)
+        features.append(f)
+
+    if tolerance != None: simplify_features(features, tolerance)
+
+    out = {k: v for k, v in geojson.items() if k != 'features'}
+    out['features'] = features
+    return out
+
+
+def quantise_geometry(geometry: dict, decimals: int) -> dict:
+    # snap every coordinate to the grid and drop consecutive duplicate points this creates
+    if geometry == None: return None
+
+    def ring(coords):
+        out = []
+        for x, y in ((round(c[0], decimals), round(c[1], decimals)) for c in coords):
+            if len(out) == 0 or out[-1] != [x, y]: out.append([x, y])
+        return out
+
+    if geometry['type'] == 'Polygon':
+        coords = [ring(r) for r in geometry['coordinates']]
+    elif geometry['type'] == 'MultiPolygon':
+        coords = [[ring(r) for r in polygon] for polygon in geometry['coordinates']]
+    else:
+        return geometry
+    return {'type': geometry['type'], 'coordinates': coords}
+
+
+def get_rings(features: list) -> list:
+    # every polygon ring in the features as a list we can replace in place: (ring list, index in parent list, parent list)
+    rings = []
+    for f in features:
+        g = f['geometry']
+        if g == None: continue
+        if g['type'] == 'Polygon': polygons = [g['coordinates']]
+        elif g['type'] == 'MultiPolygon': polygons = g['coordinates']
+        else: continue
+        for polygon in polygons:
+            for i in range(len(polygon)):
+                rings.append((polygon, i))
+    return rings
+
+
+def simplify_features(features: list, tolerance: float):
+    # topology preserving simplification of every ring, in place (see top of file)
+
+    rings = get_rings(features)
+
+    # which rings use each vertex
+    owners = {}
+    for n, (polygon, i) in enumerate(rings):
+        for pt in polygon[i][:-1]:
+            owners.setdefault(tuple(pt), set()).add(n)
+
+    # junctions: ring start points, and anywhere the set of rings sharing consecutive vertices changes
+    junctions = set()
+    for polygon, i in rings:
+        r = [tuple(pt) for pt in polygon[i][:-1]]
+        if len(r) == 0: continue
+        junctions.add(r[0])
+        for k in range(len(r)):
+            if owners[r[k]] != owners[r[k-1]]:
+                junctions.add(r[k])
+                junctions.add(r[k-1])
+
+    # cut each ring into arcs at junctions, simplify each distinct arc once, then reassemble
+    done = {}
+    for polygon, i in rings:
+        r = [tuple(pt) for pt in polygon[i]]
+        if len(r) < 4: continue
+
+        out = [r[0]]
+        arc = [r[0]]
+        for pt in r[1:]:
+            arc.append(pt)
+            if pt in junctions or pt == r[-1] and len(arc) > 1:
+                out.extend(simplify_arc(arc, tolerance, done)[1:])
+                arc = [pt]
+
+        # keep the ring if simplification collapsed it (tiny islands), otherwise use the simplified version
+        if len(out) >= 4: polygon[i] = [list(pt) for pt in out]
+
+
+def simplify_arc(arc: list, tolerance: float, done: dict) -> list:
+    # Douglas-Peucker on one arc, computed in a canonical direction and cached, so a border shared by two countries
+    # (walked in opposite directions by each) is simplified identically for both
+
+    reverse = arc[0] > arc[-1] or (arc[0] == arc[-1] and tuple(arc) > tuple(reversed(arc)))
+    key = tuple(reversed(arc)) if reverse else tuple(arc)
+
+    if key not in done:
+        pts = np.array(key, dtype=np.float64)
+        keep = douglas_peucker(pts, tolerance)
+        done[key] = [key[k] for k in np.flatnonzero(keep)]
+
+    return list(reversed(done[key])) if reverse else done[key]
+
+
+def douglas_peucker(pts: np.ndarray, tolerance: float) -> np.ndarray:
+    # boolean mask of points to keep (end points always kept). Iterative, vectorised distance per segment.
+
+    keep = np.zeros(len(pts), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(pts) - 1)]
+
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2: continue
+
+        seg = pts[end] - pts[start]
+        rel = pts[start+1:end] - pts[start]
+        seg_len = np.hypot(seg[0], seg[1])
+
+        # perpendicular distance to the segment (or distance to the point if the arc is closed)
+        if seg_len == 0: dist = np.hypot(rel[:, 0], rel[:, 1])
+        else: dist = np.abs(seg[0] * rel[:, 1] - seg[1] * rel[:, 0]) / seg_len
+
+        k = int(np.argmax(dist))
+        if dist[k] > tolerance:
+            keep[start + 1 + k] = True
+            stack.append((start, start + 1 + k))
+            stack.append((start + 1 + k, end))
+
+    return keep
+
+
+def count_vertices(geojson: dict) -> int:
+    return sum(len(polygon[i]) for polygon, i in get_rings(geojson['features']))
+
+
+def geojson_size_report(name: str, before: dict, after: dict):
+    # print size and vertex count before/after refinement
+    size_before = len(json.dumps(before, separators=(',', ':')))
+    size_after = len(json.dumps(after, separators=(',', ':')))
+    vertices_before = count_vertices(before)
+    vertices_after = count_vertices(after)
+    print(name, ': ', round(size_before/1e6, 2), 'MB >', round(size_after/1e6, 2), 'MB (', round(100*size_after/max(size_before, 1)), '% ),',
+          vertices_before, '>', vertices_after, 'vertices,', len(after['features']), 'features')
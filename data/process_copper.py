@@ -2,27 +2,13 @@
 
 from dotenv import load_dotenv
 import data_paths as paths
+from storage import get_storage
 import json
 import pandas as pd
 import os
 import time
-import datetime
 from io import BytesIO
 
-from azure.storage.blob import (
-    BlobServiceClient,
-    BlobPrefix,
-    ContainerClient,
-    BlobClient,
-    BlobSasPermissions,
-    ContainerSasPermissions,
-    ResourceTypes,
-    AccountSasPermissions,
-    UserDelegationKey,
-    generate_account_sas,
-    generate_container_sas,
-    generate_blob_sas
-)
 
 
 def process_copper(container_name_origin: str, container_name_destination: str):
@@ -40,27 +26,18 @@ def process_copper(container_name_origin: str, container_name_destination: str):
 def get_country_lookup_df(container_name: str, blob_path: str, encoding: str) -> pd.DataFrame():
     # read in country lookup csv file as df
     
-    # build sas URL to the blob (so we can read it)
-    sas_url_blob = 'https://' + account_name+'.blob.core.windows.net/' + container_name + '/' + blob_path + '?' + sas_token 
     
     # read blob into df
-    df = pd.read_csv(sas_url_blob, encoding=encoding, names=["m49_a3_country", "country", "continent", "region_un", "region_wb", "su_a3"])
+    df = pd.read_csv(storage.open(container_name, blob_path), encoding=encoding, names=["m49_a3_country", "country", "continent", "region_un", "region_wb", "su_a3"])
     
     return df
 
 
-def walk_blobs(blob_service_client: object, container_name: str, folder_name: str) -> list: 
+def walk_blobs(storage: object, container_name: str, folder_name: str) -> list: 
     # effectively the equivalent of list contents in a directory on a file system
     # list the names of all blobs in a given blob-directory
     
-    container_client = blob_service_client.get_container_client(container=container_name)
-    blob_list = container_client.walk_blobs(folder_name)
-    
-    blob_lst=[]
-    for blob in blob_list:
-        blob_lst.append(blob.name)
-    
-    return blob_lst
+    return storage.walk(container_name, folder_name)
 
 
 def ironsmith_bigmac(container_name: str, origin_blob_path: str, destination_blob_path: str):
@@ -74,8 +51,7 @@ def ironsmith_bigmac(container_name: str, origin_blob_path: str, destination_blo
     countries = get_country_lookup_df('copper', paths.COUNTRY_LOOKUP_PATH_COPPER, 'utf-8')
     
     #read blob-file into df
-    sas_url_blob = 'https://' + account_name+'.blob.core.windows.net/' + container_name + '/' + origin_blob_path + '?' + sas_token
-    df = pd.read_parquet(sas_url_blob)
+    df = pd.read_parquet(storage.open(container_name, origin_blob_path))
     
     # subset to remove redundant data
     df = df[['date', 'iso_a3', 'dollar_price']]
@@ -120,8 +96,7 @@ def ironsmith_bigmac(container_name: str, origin_blob_path: str, destination_blo
     stream.seek(0) #put pointer back to start of stream
     
     # write the stream to blob
-    blob_client = blob_service_client.get_blob_client(container='iron', blob=destination_blob_path)
-    blob_client.upload_blob(data=stream, overwrite=True, blob_type="BlockBlob")
+    storage.upload('iron', destination_blob_path, stream)
 
     # summary
     toc = time.perf_counter()    
@@ -187,14 +162,13 @@ def ironsmith_world_standards(container_name: str, origin_blob_folder: str, dest
     pop = pd.DataFrame() 
     
     # get file-blob list
-    files = walk_blobs(blob_service_client, container_name, origin_blob_folder)
+    files = walk_blobs(storage, container_name, origin_blob_folder)
     
     for file in files:
         print("Processing data: ", file)    
         
         #read blob-file into df
-        sas_url_blob = 'https://' + account_name+'.blob.core.windows.net/' + container_name + '/' + file + '?' + sas_token
-        df = pd.read_parquet(sas_url_blob)
+        df = pd.read_parquet(storage.open(container_name, file))
         
         # For this data, we must merge UN data on country name (problematic). First do some custom substitutions.
         df = df.replace({"country":country_tweaks})  
@@ -238,8 +212,7 @@ def ironsmith_world_standards(container_name: str, origin_blob_folder: str, dest
     stream.seek(0) #put pointer back to start of stream
     
     # write the stream to blob
-    blob_client = blob_service_client.get_blob_client(container='iron', blob=destination_blob_path)
-    blob_client.upload_blob(data=stream, overwrite=True, blob_type="BlockBlob")
+    storage.upload('iron', destination_blob_path, stream)
     
     # summary
     toc = time.perf_counter()    
@@ -263,14 +236,13 @@ def ironsmith_sdgindicators(container_name: str, origin_blob_folder: str, destin
     pop = pd.DataFrame() 
     
     # get file-blob list
-    files = walk_blobs(blob_service_client, container_name, origin_blob_folder)
+    files = walk_blobs(storage, container_name, origin_blob_folder)
     
     for file in files:
         print("Loading data: ", file)    
         
         #read blob-file into df
-        sas_url_blob = 'https://' + account_name+'.blob.core.windows.net/' + container_name + '/' + file + '?' + sas_token
-        df = pd.read_parquet(sas_url_blob)
+        df = pd.read_parquet(storage.open(container_name, file))
      
         # concatenate the goal/target/indicator to source
         df['curatedSrc'] = 'United Nations Sustainable Development Goals (SDG) Indicators Database. '
@@ -339,8 +311,7 @@ def ironsmith_sdgindicators(container_name: str, origin_blob_folder: str, destin
     stream.seek(0) #put pointer back to start of stream
     
     # write the stream to blob
-    blob_client = blob_service_client.get_blob_client(container='iron', blob=destination_blob_path)
-    blob_client.upload_blob(data=stream, overwrite=True, blob_type="BlockBlob")
+    storage.upload('iron', destination_blob_path, stream)
     
     # summary
     toc = time.perf_counter()    
@@ -361,12 +332,11 @@ def ironsmith_gapminder_fast_track(container_name: str, origin_blob_folder: str,
     #print(countries)
     
     # read in metadata
-    sas_url_blob = 'https://' + account_name+'.blob.core.windows.net/' + container_name + '/' + paths.FASTTRACK_META_COPPER + '?' + sas_token 
-    lookup = pd.read_parquet(sas_url_blob).fillna("Not available")
+    lookup = pd.read_parquet(storage.open(container_name, paths.FASTTRACK_META_COPPER)).fillna("Not available")
     #print(lookup)
     
     # get file-blob list
-    files = walk_blobs(blob_service_client, container_name, origin_blob_folder)
+    files = walk_blobs(storage, container_name, origin_blob_folder)
     
     #declare empty dataframe (which we'll append to)   
     pop = pd.DataFrame() 
@@ -377,8 +347,7 @@ def ironsmith_gapminder_fast_track(container_name: str, origin_blob_folder: str,
         print('Importing', file)
         
         # read file into df
-        sas_url_blob = 'https://' + account_name+'.blob.core.windows.net/' + container_name + '/' + file + '?' + sas_token
-        df = pd.read_parquet(sas_url_blob)
+        df = pd.read_parquet(storage.open(container_name, file))
         
         # extract concept unique series id e.g. "mmr_who" (which can be queried from the concepts)
         concept = df.columns[2]
@@ -445,8 +414,7 @@ def ironsmith_gapminder_fast_track(container_name: str, origin_blob_folder: str,
     stream.seek(0) #put pointer back to start of stream
     
     # write the stream to blob
-    blob_client = blob_service_client.get_blob_client(container='iron', blob=destination_blob_path)
-    blob_client.upload_blob(data=stream, overwrite=True, blob_type="BlockBlob")
+    storage.upload('iron', destination_blob_path, stream)
      
     # summary
     toc = time.perf_counter()    
@@ -466,11 +434,10 @@ def ironsmith_gapminder_systema_globalis(container_name: str, origin_blob_folder
     countries = get_country_lookup_df('copper', paths.COUNTRY_LOOKUP_PATH_COPPER, 'utf-8')
     
     # read in metadata
-    sas_url_blob = 'https://' + account_name+'.blob.core.windows.net/' + container_name + '/' + paths.SYSTEMAGLOBALIS_META_COPPER + '?' + sas_token 
-    lookup = pd.read_parquet(sas_url_blob).fillna("Not available")
+    lookup = pd.read_parquet(storage.open(container_name, paths.SYSTEMAGLOBALIS_META_COPPER)).fillna("Not available")
     
     # get file-blob list
-    files = walk_blobs(blob_service_client, container_name, origin_blob_folder)
+    files = walk_blobs(storage, container_name, origin_blob_folder)
     
     #declare empty dataframe (which we'll append to)   
     pop = pd.DataFrame() 
@@ -481,8 +448,7 @@ def ironsmith_gapminder_systema_globalis(container_name: str, origin_blob_folder
         print('Importing', file)
         
         # read file into df
-        sas_url_blob = 'https://' + account_name+'.blob.core.windows.net/' + container_name + '/' + file + '?' + sas_token
-        df = pd.read_parquet(sas_url_blob)
+        df = pd.read_parquet(storage.open(container_name, file))
         
         # extract concept unique series id e.g. "mmr_who" (which can be queried from the concepts)
         concept = df.columns[2]
@@ -552,8 +518,7 @@ def ironsmith_gapminder_systema_globalis(container_name: str, origin_blob_folder
     stream.seek(0) #put pointer back to start of stream
     
     # write the stream to blob
-    blob_client = blob_service_client.get_blob_client(container='iron', blob=destination_blob_path)
-    blob_client.upload_blob(data=stream, overwrite=True, blob_type="BlockBlob")
+    storage.upload('iron', destination_blob_path, stream)
      
     # summary
     toc = time.perf_counter()    
@@ -573,14 +538,13 @@ def ironsmith_gapminder_world_dev_indicators(container_name: str, origin_blob_fo
     countries = get_country_lookup_df('copper', paths.COUNTRY_LOOKUP_PATH_COPPER, 'utf-8')
     
     # read in metadata
-    sas_url_blob = 'https://' + account_name+'.blob.core.windows.net/' + container_name + '/' + paths.WDINDICATORS_META_COPPER + '?' + sas_token 
-    lookup = pd.read_parquet(sas_url_blob)
+    lookup = pd.read_parquet(storage.open(container_name, paths.WDINDICATORS_META_COPPER))
     
     #declare empty dataframe   
     pop = pd.DataFrame()
     
     # get file-blob list
-    files = walk_blobs(blob_service_client, container_name, origin_blob_folder)
+    files = walk_blobs(storage, container_name, origin_blob_folder)
     
     #Metrics    
     files_num=len(files) 
@@ -625,8 +589,7 @@ def ironsmith_gapminder_world_dev_indicators(container_name: str, origin_blob_fo
             stream = BytesIO() #initialise a stream
             pop.to_parquet(stream, engine='pyarrow', index=False) #write the parquet to the stream
             stream.seek(0) #put pointer back to start of stream
-            blob_client = blob_service_client.get_blob_client(container='iron', blob=destination_filepath)
-            blob_client.upload_blob(data=stream, overwrite=True, blob_type="BlockBlob")  
+            storage.upload('iron', destination_filepath, stream)  
             #pop.to_parquet((destination_filepath[:-8])+str(filewritecount)+".parquet"  )
             
             # batch run logic
@@ -645,8 +608,7 @@ def ironsmith_gapminder_world_dev_indicators(container_name: str, origin_blob_fo
         print("Importing",runcount,"/",files_num," ",file)       
         
         # read in df
-        sas_url_blob = 'https://' + account_name+'.blob.core.windows.net/' + container_name + '/' + file + '?' + sas_token 
-        df = pd.read_parquet(sas_url_blob)
+        df = pd.read_parquet(storage.open(container_name, file))
         
         # extract id
         concept = df.columns[2]      
@@ -726,8 +688,7 @@ def ironsmith_gapminder_world_dev_indicators(container_name: str, origin_blob_fo
     stream = BytesIO() #initialise a stream
     pop.to_parquet(stream, engine='pyarrow', index=False) #write the parquet to the stream
     stream.seek(0) #put pointer back to start of stream
-    blob_client = blob_service_client.get_blob_client(container='iron', blob=destination_filepath)
-    blob_client.upload_blob(data=stream, overwrite=True, blob_type="BlockBlob")  
+    storage.upload('iron', destination_filepath, stream)  
     
     # summary
     toc = time.perf_counter()    
@@ -737,28 +698,6 @@ def ironsmith_gapminder_world_dev_indicators(container_name: str, origin_blob_fo
     return 
 
 
-def create_account_sas(account_name: str, account_key: str):
-    # Create an account SAS that's valid for one day
-    start_time = datetime.datetime.now(datetime.timezone.utc)
-    expiry_time = start_time + datetime.timedelta(days=1)
-
-    # Define the SAS token permissions (root)
-    sas_permissions=AccountSasPermissions(read=True, write=True, delete=True, list=True, add=True, create=True, update=True, process=True, delete_previous_version=True)
-
-    # Define the SAS token resource types (root)
-    sas_resource_types=ResourceTypes(service=True, container=True, object=True)
-
-    sas_token = generate_account_sas(
-        account_name=account_name,
-        account_key=account_key,
-        resource_types=sas_resource_types,
-        permission=sas_permissions,
-        expiry=expiry_time,
-        start=start_time
-    )
-
-    return sas_token
-
 
 
 
@@ -770,15 +709,8 @@ load_dotenv()
 account_name = os.getenv("AZURE_STORAGE_ACCOUNT_NAME")
 account_key = os.getenv("AZURE_STORAGE_ACCOUNT_KEY")
 
-# create account SAS (should have root access to all containers)
-sas_token = create_account_sas(account_name, account_key)
-
-# build URL version in the proper format
-account_sas_url = 'https://' + account_name+'.blob.core.windows.net/' + '?' + sas_token  
-#print(account_sas_url)
-
-# create BlobServiceClient object (we now have the jedi power to do all the admin tasks)
-blob_service_client = BlobServiceClient(account_url=account_sas_url)
+# storage backend (azure blob by default, or a local copy of the lake with ATLAS_STORAGE_BACKEND=local). One pooled client for the whole run.
+storage = get_storage(account_name, account_key)
 
 # trigger the main operation
 process_copper('copper', 'iron')
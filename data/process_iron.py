@@ -2,51 +2,37 @@
 
 from dotenv import load_dotenv
 import data_paths as paths
+from storage import get_storage
 import json
 import pandas as pd
+import numpy as np
 import os
 import time
-import datetime
 from io import BytesIO
 
-from azure.storage.blob import (
-    BlobServiceClient,
-    BlobPrefix,
-    ContainerClient,
-    BlobClient,
-    BlobSasPermissions,
-    ContainerSasPermissions,
-    ResourceTypes,
-    AccountSasPermissions,
-    UserDelegationKey,
-    generate_account_sas,
-    generate_container_sas,
-    generate_blob_sas
-)
 
 
 def process_iron(container_name_origin: str, container_name_destination: str):
     # process data in IRON > TITANIUM
     
-    smelt_iron(paths.IRON_STATS_PATH, paths.MASTER_META_PATH, paths.MASTER_STATS_PATH, container_name_origin, container_name_destination)
+    smelt_iron(paths.IRON_STATS_PATH, paths.MASTER_META_PATH, paths.MASTER_STATS_PATH, paths.MASTER_CONFIG_PATH, paths.MASTER_COUNTRIES_PATH, container_name_origin, container_name_destination)
     update_config(paths.MASTER_META_PATH, paths.MASTER_CONFIG_PATH, 'titanium')
     return
     
 
-def smelt_iron(origin_blob_folder: str, meta_file_path: str, stats_file_path: str, container_name_origin: str, container_name_destination: str):
+def smelt_iron(origin_blob_folder: str, meta_file_path: str, stats_file_path: str, config_file_path: str, countries_file_path: str, container_name_origin: str, container_name_destination: str):
         
     #smelt everything in iron statistics folder to produce master parquet and master meta in TITANIUM
     
     # obtain list of all standardised .parquet files recursively
-    files = walk_blobs_recursive(blob_service_client, container_name_origin, origin_blob_folder)
+    files = walk_blobs_recursive(storage, container_name_origin, origin_blob_folder)
     print('Smelting ',len(files), 'files...')
     print(files)
         
     # read all parquets as dataframe chunks into a list
     chunks=[]
     for file in files:
-        sas_url_blob = 'https://' + account_name+'.blob.core.windows.net/' + container_name_origin + '/' + file + '?' + sas_token
-        chunks.append(pd.read_parquet(sas_url_blob))
+        chunks.append(pd.read_parquet(storage.open(container_name_origin, file)))
     
     # Concatenate df chunks into a master df
     master = pd.DataFrame()
@@ -89,18 +75,28 @@ def smelt_iron(origin_blob_folder: str, meta_file_path: str, stats_file_path: st
     stream.seek(0) #put pointer back to start of stream
     
     # write the stream to blob
-    blob_client = blob_service_client.get_blob_client(container=container_name_destination, blob=meta_file_path)
-    blob_client.upload_blob(data=stream, overwrite=True, blob_type="BlockBlob")
+    storage.upload(container_name_destination, meta_file_path, stream)
     
     
+    # Split the country columns out into a small dimension table, master stats keeps just the integer country_id
+    master, countries = build_country_dimension(master, get_country_lookup_df('copper', paths.COUNTRY_LOOKUP_PATH_COPPER, 'utf-8'))
+    
+    # Write country dimension to blob
+    print("Writing country dimension to blob. Countries: ", len(countries))
+    stream = BytesIO()
+    countries.to_parquet(stream, engine='pyarrow', index=False)
+    stream.seek(0)
+    storage.upload(container_name_destination, countries_file_path, stream)
+    
     # Free up memory and purge master stats before writing to disk
     del chunks
     del meta
     del master['source']
     del master['link']
     del master['note']
-    del master['region_un']
-    del master['region_wb']
+    
+    # Replace the string value column with typed value columns (so the app never has to parse strings at run-time)
+    master = add_typed_value_columns(master, get_discrete_series(config_file_path, container_name_destination))
         
     # Write out master to file    
     print("Attempting to write master stats parquet to blob")
@@ -111,11 +107,85 @@ def smelt_iron(origin_blob_folder: str, meta_file_path: str, stats_file_path: st
     stream.seek(0) #put pointer back to start of stream
     
     # write the stream to blob
-    blob_client = blob_service_client.get_blob_client(container=container_name_destination, blob=stats_file_path)
-    blob_client.upload_blob(data=stream, overwrite=True, blob_type="BlockBlob")
+    storage.upload(container_name_destination, stats_file_path, stream)
         
     return  
 
+def get_country_lookup_df(container_name: str, blob_path: str, encoding: str) -> pd.DataFrame():
+    # read in country lookup csv file as df (same as process_copper.py), without the heading row
+    
+    df = pd.read_csv(storage.open(container_name, blob_path), encoding=encoding, names=["m49_a3_country", "country", "continent", "region_un", "region_wb", "su_a3"], dtype=str)
+    return df[df["m49_a3_country"] != "m49_a3_country"]
+
+
+def build_country_dimension(master: pd.DataFrame, lookup: pd.DataFrame) -> (pd.DataFrame, pd.DataFrame):
+    # Country dimension table: country_id (uint16, in m49 order, and equal to the row position), m49_un_a3, country, su_a3, continent, region_un, region_wb
+    # The fact table (master stats) swaps its repeated country/continent/region categoricals for country_id. Returns (master, countries).
+    
+    columns = ['m49_un_a3', 'country', 'continent', 'region_un', 'region_wb']
+    codes, uniques = pd.factorize(master['m49_un_a3'], sort=True)
+    ids, first_rows = np.unique(codes, return_index=True)
+    
+    countries = master.iloc[first_rows[ids >= 0]][columns].astype(str).reset_index(drop=True)
+    su_a3 = lookup.drop_duplicates(subset=['m49_a3_country']).set_index('m49_a3_country')['su_a3']
+    countries.insert(3, 'su_a3', countries['m49_un_a3'].map(su_a3))
+    countries.insert(0, 'country_id', np.arange(len(countries), dtype='uint16'))
+    
+    # drop any rows without a country code, then key the rest by country_id
+    master = master[codes >= 0].drop(columns=columns)
+    master.insert(0, 'country_id', codes[codes >= 0].astype('uint16'))
+    
+    return master, countries
+
+
+def get_discrete_series(config_blob_path: str, container_name: str) -> list:
+    # return list of dataset_raw that are flagged as var_type 'discrete' in the existing master config
+    # on a fresh lake there is no config yet, in which case discrete series are detected from the values alone
+    
+    try:
+        config = pd.read_csv(storage.open(container_name, config_blob_path))
+    except Exception as error:
+        print("Could not read master config to find discrete series, detecting from values only. Error: ", error)
+        return []
+    
+    return pd.unique(config.loc[config['var_type'] == 'discrete', 'dataset_raw']).tolist()
+
+
+def add_typed_value_columns(master: pd.DataFrame, discrete_series: list) -> pd.DataFrame:
+    # The iron standard stores 'value' as a string. Titanium replaces it with:
+    # value_num: float64 parse of the value (NaN where not numeric)
+    # value_cat: dictionary encoded (category) value, the raw string for every value that isn't a number, plus every value of a
+    # series the config already flags discrete. Non numeric values are kept whatever the config says, so a series set to
+    # var_type 'discrete' later on already has its classes here and doesn't need a re-smelt (the app picks the column, see get_value_column).
+    
+    value_num = pd.to_numeric(master['value'].str.replace(",", "", regex=False), errors='coerce').astype('float64')
+    discrete_series = set(discrete_series)
+    print("Discrete series in config: ", len(discrete_series))
+    
+    discrete_mask = master['dataset_raw'].isin(discrete_series).to_numpy()
+    
+    # values that aren't numbers (e.g. '..' or a class label). They're NaN in value_num and kept as strings in value_cat
+    non_numeric = (value_num.isna() & master['value'].notna() & ~master['value'].isin(['nan', 'None', ''])).to_numpy()
+    
+    # report them for series the config doesn't flag discrete, these are either junk or a series that needs var_type 'discrete'
+    unparsed = non_numeric & ~discrete_mask
+    if unparsed.any():
+        counts = master.loc[unparsed, 'dataset_raw'].value_counts()
+        examples = master.loc[unparsed].drop_duplicates('dataset_raw').set_index('dataset_raw')['value']
+        print("WARNING unparseable values in", len(counts), "non discrete series (NaN in value_num, kept in value_cat):")
+        for series, count in counts.items(): print("   ", series, ":", count, "values, e.g.", repr(examples[series]))
+    
+    value_cat = master['value'].where(discrete_mask | non_numeric).astype('category')
+    
+    # keep value_num where value was, with value_cat right after it
+    position = master.columns.get_loc('value')
+    master = master.drop(columns=['value'])
+    master.insert(position, 'value_num', value_num.to_numpy())
+    master.insert(position+1, 'value_cat', pd.Categorical(value_cat))
+    
+    return master
+
+
 def update_config(meta_blob_path, config_blob_path, container_name):
     # Update master_config file with any new data
     # Housekeeping like remove duplicate dataset_raws from config (no)
@@ -128,13 +198,11 @@ def update_config(meta_blob_path, config_blob_path, container_name):
     print('Updating master config file ...')      
     
     # read master metadata into df
-    sas_url_blob = 'https://' + account_name+'.blob.core.windows.net/' + container_name + '/' + meta_blob_path + '?' + sas_token
-    meta = pd.read_parquet(sas_url_blob)
+    meta = pd.read_parquet(storage.open(container_name, meta_blob_path))
     print('Metadata read from blob. Length: ', len(meta))    
     
     # read master config into df
-    sas_url_blob = 'https://' + account_name+'.blob.core.windows.net/' + container_name + '/' + config_blob_path + '?' + sas_token
-    config = pd.read_csv(sas_url_blob)
+    config = pd.read_csv(storage.open(container_name, config_blob_path))
     print('Config data read from blob. Length: ', len(config))
     
     # Housekeeping
@@ -199,8 +267,7 @@ def update_config(meta_blob_path, config_blob_path, container_name):
     stream = BytesIO() #initialise a stream
     config.to_csv(stream, index=False) #write the csv to the stream
     stream.seek(0) #put pointer back to start of stream 
-    blob_client = blob_service_client.get_blob_client(container=container_name, blob=config_blob_path)
-    blob_client.upload_blob(data=stream, overwrite=True, blob_type="BlockBlob") # write the stream to blob
+    storage.upload(container_name, config_blob_path, stream) # write the stream to blob
     
     #config.to_csv(filepath_config,index=False)
     
@@ -209,36 +276,24 @@ def update_config(meta_blob_path, config_blob_path, container_name):
     return
 
 
-def walk_blobs(blob_service_client: object, container_name: str, folder_name: str) -> list: 
+def walk_blobs(storage: object, container_name: str, folder_name: str) -> list: 
     # effectively the equivalent of list contents in a directory on a file system
     # list the names of all blobs in a given blob-directory
     
-    container_client = blob_service_client.get_container_client(container=container_name)
-    blob_list = container_client.walk_blobs(folder_name)
-    
-    blob_lst=[]
-    for blob in blob_list:
-        blob_lst.append(blob.name)
-    
-    return blob_lst
+    return storage.walk(container_name, folder_name)
 
-def walk_blobs_recursive(blob_service_client: object, container_name: str, folder_name: str) -> list: 
+def walk_blobs_recursive(storage: object, container_name: str, folder_name: str) -> list: 
     # effectively the equivalent of list contents (and subfolders) in a directory on a file system
     # list the names of all blobs in a given blob-directory, including subdirectories
     # Note this needs refinement. It only goes 1 folder deep.
     
-    container_client = blob_service_client.get_container_client(container=container_name)
-    blob_list = container_client.walk_blobs(folder_name)
-    
-    blob_lst=[]
-    for blob in blob_list:
-        blob_lst.append(blob.name)
+    blob_lst = storage.walk(container_name, folder_name)
     
     # grab all blobs in each subdirectory
     files = []
     for folder in blob_lst:
         if folder[-1:] != '/': continue #skip if not folder
-        files.append(walk_blobs(blob_service_client, container_name, folder))
+        files.append(walk_blobs(storage, container_name, folder))
     
     # this returns a list of lists, which we want to convert to a simple list of filenames
     files_clean = []
@@ -248,28 +303,6 @@ def walk_blobs_recursive(blob_service_client: object, container_name: str, folde
     
     return files_clean
 
-def create_account_sas(account_name: str, account_key: str):
-    # Create an account SAS that's valid for one day
-    start_time = datetime.datetime.now(datetime.timezone.utc)
-    expiry_time = start_time + datetime.timedelta(days=1)
-
-    # Define the SAS token permissions (root)
-    sas_permissions=AccountSasPermissions(read=True, write=True, delete=True, list=True, add=True, create=True, update=True, process=True, delete_previous_version=True)
-
-    # Define the SAS token resource types (root)
-    sas_resource_types=ResourceTypes(service=True, container=True, object=True)
-
-    sas_token = generate_account_sas(
-        account_name=account_name,
-        account_key=account_key,
-        resource_types=sas_resource_types,
-        permission=sas_permissions,
-        expiry=expiry_time,
-        start=start_time
-    )
-
-    return sas_token
-
 
 ### RUN ###
 
@@ -278,14 +311,8 @@ load_dotenv()
 account_name = os.getenv("AZURE_STORAGE_ACCOUNT_NAME")
 account_key = os.getenv("AZURE_STORAGE_ACCOUNT_KEY")
 
-# create account SAS (should have root access to all containers)
-sas_token = create_account_sas(account_name, account_key)
-
-# build URL version in the proper format
-account_sas_url = 'https://' + account_name+'.blob.core.windows.net/' + '?' + sas_token  
-
-# create BlobServiceClient object (we now have the jedi power to do all the admin tasks)
-blob_service_client = BlobServiceClient(account_url=account_sas_url)
+# storage backend (azure blob by default, or a local copy of the lake with ATLAS_STORAGE_BACKEND=local). One pooled client for the whole run.
+storage = get_storage(account_name, account_key)
 
 # trigger the main operation
 process_iron('iron', 'titanium')
\ No newline at end of file
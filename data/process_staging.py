@@ -12,26 +12,14 @@
 
 from dotenv import load_dotenv
 import data_paths as paths
+from storage import get_storage
+import geometry
+import json
 import pandas as pd
 import os #get env vars
 import time #tic-toc
-import datetime #sas token expiry
 from io import BytesIO #stream df > blob
 
-from azure.storage.blob import (
-    BlobServiceClient,
-    BlobPrefix,
-    ContainerClient,
-    BlobClient,
-    BlobSasPermissions,
-    ContainerSasPermissions,
-    ResourceTypes,
-    AccountSasPermissions,
-    UserDelegationKey,
-    generate_account_sas,
-    generate_container_sas,
-    generate_blob_sas
-)
 
 
 
@@ -63,11 +51,9 @@ def create_unique_country_list(container_name_origin: str, container_name_destin
     
     print('Processing metadata for country lookup')
     
-    # build sas URL to the blob (so we can read it)
-    sas_url_blob = 'https://' + account_name+'.blob.core.windows.net/' + container_name_origin + '/' + blob_path + '?' + sas_token 
     
     # read blob into df
-    df = pd.read_csv(sas_url_blob, encoding=encoding, names=["m49_a3_country", "country", "continent", "region_un", "region_wb", "su_a3"])
+    df = pd.read_csv(storage.open(container_name_origin, blob_path), encoding=encoding, names=["m49_a3_country", "country", "continent", "region_un", "region_wb", "su_a3"])
     
     #cast to string
     df["m49_a3_country"] = df["m49_a3_country"].astype(str) 
@@ -84,8 +70,7 @@ def create_unique_country_list(container_name_origin: str, container_name_destin
     stream.seek(0) #put pointer back to start of stream
     
     # write the stream to blob
-    blob_client = blob_service_client.get_blob_client(container=container_name_destination, blob=blob_path)
-    blob_client.upload_blob(data=stream, overwrite=True, blob_type="BlockBlob")
+    storage.upload(container_name_destination, blob_path, stream)
 
     return
 
@@ -140,27 +125,23 @@ def coppersmith_sdgindicators(container_name_origin: str, container_name_destina
     
 def coppersmith_map_json(container_name_origin: str, container_name_destination: str):
     #The map json (from memory) was unprocessed, sourced from Natural Earth
-    # Move map json data from STAGING > TITANIUM
-    # https://learn.microsoft.com/en-us/azure/storage/blobs/storage-blob-copy-python
+    # Refine map json data from STAGING > TITANIUM (strip unused properties, quantise and simplify per zoom level, see geometry.py)
     
-    # Copy map json data blobs
-    copy_blob(blob_service_client, container_name_origin, container_name_destination, paths.MAP_JSON_LOW_PATH_STAGING, paths.MAP_JSON_LOW_PATH_TITANIUM, sas_token)
-    copy_blob(blob_service_client, container_name_origin, container_name_destination, paths.MAP_JSON_MED_PATH_STAGING, paths.MAP_JSON_MED_PATH_TITANIUM, sas_token)
-    copy_blob(blob_service_client, container_name_origin, container_name_destination, paths.MAP_JSON_HIGH_PATH_STAGING, paths.MAP_JSON_HIGH_PATH_TITANIUM, sas_token)
+    refine_json_blob(container_name_origin, container_name_destination, paths.MAP_JSON_LOW_PATH_STAGING, paths.MAP_JSON_LOW_PATH_TITANIUM, 'low')
+    refine_json_blob(container_name_origin, container_name_destination, paths.MAP_JSON_MED_PATH_STAGING, paths.MAP_JSON_MED_PATH_TITANIUM, 'medium')
+    refine_json_blob(container_name_origin, container_name_destination, paths.MAP_JSON_HIGH_PATH_STAGING, paths.MAP_JSON_HIGH_PATH_TITANIUM, 'high')
         
     return
 
-def copy_blob(blob_service_client, container_name_origin, container_name_destination, blob_origin, blob_destination, sas_token):
-    # copy blob from one location to another
-    print('Copying ', blob_origin, ' to ', blob_destination)
-
-    # build sas URL to the blob (so we can read it)
-    sas_url_blob = 'https://' + account_name+'.blob.core.windows.net/' + container_name_origin + '/' + blob_origin + '?' + sas_token 
+def refine_json_blob(container_name_origin: str, container_name_destination: str, blob_origin: str, blob_destination: str, level: str):
+    # read a geojson blob, refine it for the given zoom level (geometry.LEVELS), report the size saving and write it to the destination
+    print('Refining ', blob_origin, ' to ', blob_destination, '(', level, ')')
     
-    # copy the blob to target location
-    target_blob = blob_service_client.get_blob_client(container_name_destination, blob_destination)
-    target_blob.start_copy_from_url(sas_url_blob)
-
+    geojson = json.load(storage.open(container_name_origin, blob_origin))
+    refined = geometry.refine_geojson(geojson, level)
+    geometry.geojson_size_report(blob_destination, geojson, refined)
+    
+    storage.upload(container_name_destination, blob_destination, json.dumps(refined, separators=(',', ':')).encode('utf-8'))
     
     return
 
@@ -169,11 +150,11 @@ def coppersmith_globe_json(container_name_origin: str, container_name_destinatio
     # This is really tricky, and some preprocessing was clearly done to prepare data for the cleaner functions. I never saved it.
     # In the interests of time, just storing processed data in staging to conform to the lakehouse architecture, if it ever needs to be processed.
     
-    # Copy map json data blobs
-    copy_blob(blob_service_client, container_name_origin, container_name_destination, paths.GLOBE_JSON_LAND_HIGH_PATH_STAGING, paths.GLOBE_JSON_LAND_HIGH_PATH_TITANIUM, sas_token)
-    copy_blob(blob_service_client, container_name_origin, container_name_destination, paths.GLOBE_JSON_OCEAN_HIGH_PATH_STAGING, paths.GLOBE_JSON_OCEAN_HIGH_PATH_TITANIUM, sas_token)
-    copy_blob(blob_service_client, container_name_origin, container_name_destination, paths.GLOBE_JSON_LAND_LOW_PATH_STAGING, paths.GLOBE_JSON_LAND_LOW_PATH_TITANIUM, sas_token)
-    copy_blob(blob_service_client, container_name_origin, container_name_destination, paths.GLOBE_JSON_OCEAN_LOW_PATH_STAGING, paths.GLOBE_JSON_OCEAN_LOW_PATH_TITANIUM, sas_token)
+    # Refine globe json data blobs (strip unused properties and quantise only, these polygons were hand prepared so aren't simplified)
+    refine_json_blob(container_name_origin, container_name_destination, paths.GLOBE_JSON_LAND_HIGH_PATH_STAGING, paths.GLOBE_JSON_LAND_HIGH_PATH_TITANIUM, 'globe')
+    refine_json_blob(container_name_origin, container_name_destination, paths.GLOBE_JSON_OCEAN_HIGH_PATH_STAGING, paths.GLOBE_JSON_OCEAN_HIGH_PATH_TITANIUM, 'globe')
+    refine_json_blob(container_name_origin, container_name_destination, paths.GLOBE_JSON_LAND_LOW_PATH_STAGING, paths.GLOBE_JSON_LAND_LOW_PATH_TITANIUM, 'globe')
+    refine_json_blob(container_name_origin, container_name_destination, paths.GLOBE_JSON_OCEAN_LOW_PATH_STAGING, paths.GLOBE_JSON_OCEAN_LOW_PATH_TITANIUM, 'globe')
 
     return
 
@@ -183,11 +164,9 @@ def coppersmith_global_power_stations(container_name_origin: str, container_name
     tic = time.perf_counter()
     print("Processing global power station data STAGING > TITANIUIM (special)") 
     
-    # build sas URL to the blob (so we can read it)
-    sas_url_blob = 'https://' + account_name+'.blob.core.windows.net/' + container_name_origin + '/' + blob_path_origin + '?' + sas_token 
     
     # read blob into df
-    df = pd.read_csv(sas_url_blob, encoding=encoding)
+    df = pd.read_csv(storage.open(container_name_origin, blob_path_origin), encoding=encoding)
     
     # write df to stream
     stream = BytesIO() #initialise a stream
@@ -195,8 +174,7 @@ def coppersmith_global_power_stations(container_name_origin: str, container_name
     stream.seek(0) #put pointer back to start of stream
     
     # write the stream to blob
-    blob_client = blob_service_client.get_blob_client(container=container_name_destination, blob=blob_path_destination)
-    blob_client.upload_blob(data=stream, overwrite=True, blob_type="BlockBlob")
+    storage.upload(container_name_destination, blob_path_destination, stream)
     
     toc = time.perf_counter()
     print("Processing time: ",toc-tic," seconds")
@@ -218,11 +196,9 @@ def coppersmith_bigmac(container_name_origin: str, container_name_destination: s
     
     print('Processing BigMac index')
     
-    # build sas URL to the blob (so we can read it)
-    sas_url_blob = 'https://' + account_name+'.blob.core.windows.net/' + container_name_origin + '/' + blob_path + '?' + sas_token 
     
     # read blob into df
-    df = pd.read_csv(sas_url_blob, encoding=encoding)
+    df = pd.read_csv(storage.open(container_name_origin, blob_path), encoding=encoding)
     
     # prepare destination blob path
     blob_path_destination = blob_path[:-3] + 'parquet'
@@ -234,78 +210,37 @@ def coppersmith_bigmac(container_name_origin: str, container_name_destination: s
     stream.seek(0) #put pointer back to start of stream
     
     # write the stream to blob
-    blob_client = blob_service_client.get_blob_client(container=container_name_destination, blob=blob_path_destination)
-    blob_client.upload_blob(data=stream, overwrite=True, blob_type="BlockBlob")
+    storage.upload(container_name_destination, blob_path_destination, stream)
     
     return
 
 
-def create_account_sas(account_name: str, account_key: str):
-    # Create an account SAS that's valid for one day
-    start_time = datetime.datetime.now(datetime.timezone.utc)
-    expiry_time = start_time + datetime.timedelta(days=1)
-
-    # Define the SAS token permissions (root)
-    sas_permissions=AccountSasPermissions(read=True, write=True, delete=True, list=True, add=True, create=True, update=True, process=True, delete_previous_version=True)
-
-    # Define the SAS token resource types (root)
-    sas_resource_types=ResourceTypes(service=True, container=True, object=True)
 
-    sas_token = generate_account_sas(
-        account_name=account_name,
-        account_key=account_key,
-        resource_types=sas_resource_types,
-        permission=sas_permissions,
-        expiry=expiry_time,
-        start=start_time
-    )
-
-    return sas_token
-
-
-def get_blobs(blob_service_client: object, container_name: str) -> list: 
+def get_blobs(storage: object, container_name: str) -> list: 
     # list all filenames (blob.name) in a given container
     
-    container_client = blob_service_client.get_container_client(container=container_name)
-    blob_list = container_client.list_blobs()
-    
-    blob_lst=[]
-    for blob in blob_list:
-        blob_lst.append(blob.name)
-    
-    return blob_lst
+    return storage.list(container_name)
 
-def walk_blobs(blob_service_client: object, container_name: str, folder_name: str) -> list: 
+def walk_blobs(storage: object, container_name: str, folder_name: str) -> list: 
     # effectively the equivalent of list contents in a directory on a file system
     # list the names of all blobs in a given blob-directory
     
-    container_client = blob_service_client.get_container_client(container=container_name)
-    blob_list = container_client.walk_blobs(folder_name)
-    
-    blob_lst=[]
-    for blob in blob_list:
-        blob_lst.append(blob.name)
-    
-    return blob_lst
+    return storage.walk(container_name, folder_name)
 
 
 def convert_folder_csv_to_parquet_blob(container_name_origin: str, container_name_destination: str, blob_folder_origin: str, encoding: str):
     # Transform a blob-folder of csvs in one container to parquet files in a target container
     
     # build list of blob names for this blob-folder
-    blob_list = walk_blobs(blob_service_client, container_name_origin, blob_folder_origin)
+    blob_list = walk_blobs(storage, container_name_origin, blob_folder_origin)
     print('Converting ',len(blob_list),'files')
     
     # iterate the list read in each blob as df and write out to parquet stream to destination blob
     for blob in blob_list:
         print('Processing ', blob)
         
-        # build sas URL to the blob (so we can read it)
-        sas_url_blob = 'https://' + account_name+'.blob.core.windows.net/' + container_name_origin + '/' + blob + '?' + sas_token  
-        #print(sas_url_blob)
-        
         # read in blob as datafame     
-        df = pd.read_csv(sas_url_blob, encoding=encoding)
+        df = pd.read_csv(storage.open(container_name_origin, blob), encoding=encoding)
         #print(df)
         
         # prepare destination blob path
@@ -318,27 +253,22 @@ def convert_folder_csv_to_parquet_blob(container_name_origin: str, container_nam
         stream.seek(0) #put pointer back to start of stream
         
         # write the stream to blob
-        blob_client = blob_service_client.get_blob_client(container=container_name_destination, blob=blob_path_destination)
-        blob_client.upload_blob(data=stream, overwrite=True, blob_type="BlockBlob")
+        storage.upload(container_name_destination, blob_path_destination, stream)
     return
 
 def convert_folder_xlsx_to_parquet_blob(container_name_origin: str, container_name_destination: str, blob_folder_origin: str, encoding: str):
     #Helper function to convert a whole folder of .xlsx files to .parquet with same names in the destination
     
     # build list of blob names for this blob-folder
-    blob_list = walk_blobs(blob_service_client, container_name_origin, blob_folder_origin)
+    blob_list = walk_blobs(storage, container_name_origin, blob_folder_origin)
     print(len(blob_list))
     
     # iterate the list read in each blob as df and write out to parquet stream to destination blob
     for blob in blob_list:
         print('Processing ', blob)
         
-        # build sas URL to the blob (so we can read it)
-        sas_url_blob = 'https://' + account_name+'.blob.core.windows.net/' + container_name_origin + '/' + blob + '?' + sas_token  
-        #print(sas_url_blob)
-        
         # read in blob as datafame     
-        df = pd.read_excel(sas_url_blob)
+        df = pd.read_excel(storage.open(container_name_origin, blob))
         
         # prepare destination blob path
         blob_path_destination = blob[:-4] + 'parquet'
@@ -350,8 +280,7 @@ def convert_folder_xlsx_to_parquet_blob(container_name_origin: str, container_na
         stream.seek(0) #put pointer back to start of stream
         
         # write the stream to blob
-        blob_client = blob_service_client.get_blob_client(container=container_name_destination, blob=blob_path_destination)
-        blob_client.upload_blob(data=stream, overwrite=True, blob_type="BlockBlob")
+        storage.upload(container_name_destination, blob_path_destination, stream)
 
     return
  
@@ -365,15 +294,8 @@ load_dotenv()
 account_name = os.getenv("AZURE_STORAGE_ACCOUNT_NAME")
 account_key = os.getenv("AZURE_STORAGE_ACCOUNT_KEY")
 
-# create account SAS (should have root access to all containers)
-sas_token = create_account_sas(account_name, account_key)
-
-# build URL version in the proper format
-account_sas_url = 'https://' + account_name+'.blob.core.windows.net/' + '?' + sas_token  
-#print(account_sas_url)
-
-# create BlobServiceClient object (we now have the jedi power to do all the admin tasks)
-blob_service_client = BlobServiceClient(account_url=account_sas_url)
+# storage backend (azure blob by default, or a local copy of the lake with ATLAS_STORAGE_BACKEND=local). One pooled client for the whole run.
+storage = get_storage(account_name, account_key)
 
 # trigger the main operation
 process_staging('staging', 'copper')
@@ -0,0 +1,221 @@
+# Storage backends for the data lake (staging > copper > iron > titanium)
+# Used by both the data pipeline scripts (process_staging/copper/iron.py) and the app at run-time (flask_app/dash_app/data_processing_runtime.py)
+#
+# Two interchangeable backends with the same methods:
+#   AzureStorage: the real Azure blob storage account. One pooled BlobServiceClient (shared HTTP connection pool) for the life of the process.
+#   LocalStorage: a folder on local disk that mirrors the containers, i.e. <root>/staging, <root>/copper, <root>/iron, <root>/titanium
+#                 Handy for benchmarking/profiling the app and pipeline offline against identical data (just copy the containers down).
+#
+# Pick the backend with env vars:
+#   ATLAS_STORAGE_BACKEND = 'azure' (default) or 'local'
+#   ATLAS_LOCAL_LAKE_DIR = root folder for the local backend (default ./lake)
+#   ATLAS_STORAGE_POOL_SIZE = max pooled HTTP connections to Azure (default 32, enough for 8 loader threads x 4 ranged downloads each)
+
+import os
+import shutil
+import threading
+from io import BytesIO
+from datetime import datetime, timedelta, timezone
+
+CONTAINERS = ['staging', 'copper', 'iron', 'titanium']
+CHUNK_SIZE = 4*1024*1024 # 4MB chunks for streamed reads (and the range size for parallel azure downloads)
+SINGLE_GET_SIZE = 8*1024*1024 # blobs bigger than this are downloaded in CHUNK_SIZE ranges, max_concurrency at a time
+
+_storage = {} # one storage object per backend/account for the whole process (pooled)
+_storage_lock = threading.Lock()
+
+
+def get_storage(account_name: str = None, account_key: str = None) -> object:
+    # return the shared storage backend for this process (created on first call)
+
+    backend = os.getenv("ATLAS_STORAGE_BACKEND", "azure").lower()
+    key = (backend, account_name)
+
+    with _storage_lock:
+        if key not in _storage:
+            if backend == 'local':
+                _storage[key] = LocalStorage(os.getenv("ATLAS_LOCAL_LAKE_DIR", "lake"))
+            elif backend == 'azure':
+                _storage[key] = AzureStorage(account_name, account_key, int(os.getenv("ATLAS_STORAGE_POOL_SIZE", "32")))
+            else:
+                raise ValueError("Unknown ATLAS_STORAGE_BACKEND: " + backend + " (expected 'azure' or 'local')")
+        return _storage[key]
+
+
+class AzureStorage:
+    # Azure blob storage backend. Builds the BlobServiceClient ONCE (with a sized requests connection pool) and caches container clients,
+    # so every read/write reuses warm HTTPS connections instead of building a new client per call.
+
+    def __init__(self, account_name: str, account_key: str, pool_size: int = 32):
+        import requests
+        from azure.core.pipeline.transport import RequestsTransport
+        from azure.storage.blob import BlobServiceClient
+
+        if account_name == None or account_key == None:
+            raise ValueError("Azure storage backend needs AZURE_STORAGE_ACCOUNT_NAME and AZURE_STORAGE_ACCOUNT_KEY")
+
+        self.account_name = account_name
+        self.account_key = account_key
+
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+
+        constr = 'DefaultEndpointsProtocol=https;AccountName=' + account_name + ';AccountKey=' + account_key + ';EndpointSuffix=core.windows.net'
+        self.client = BlobServiceClient.from_connection_string(constr, transport=RequestsTransport(session=session, session_owner=False),
+                                                               max_single_get_size=SINGLE_GET_SIZE, max_chunk_get_size=CHUNK_SIZE)
+        self._containers = {}
+        self._lock = threading.Lock()
+
+    def container(self, container_name: str) -> object:
+        with self._lock:
+            if container_name not in self._containers:
+                self._containers[container_name] = self.client.get_container_client(container_name)
+            return self._containers[container_name]
+
+    def blob(self, container_name: str, blob_path: str) -> object:
+        return self.container(container_name).get_blob_client(blob_path)
+
+    def local_path(self, container_name: str, blob_path: str) -> str:
+        # no local file for azure blobs (see LocalStorage)
+        return None
+
+    def read_bytes(self, container_name: str, blob_path: str, offset: int = None, length: int = None, max_concurrency: int = 1) -> bytes:
+        # read a whole blob, or a byte range of it (offset/length)
+        return self.blob(container_name, blob_path).download_blob(offset=offset, length=length, max_concurrency=max_concurrency).readall()
+
+    def open(self, container_name: str, blob_path: str) -> BytesIO:
+        # blob as a file-like object (e.g. for pd.read_parquet/read_csv)
+        return BytesIO(self.read_bytes(container_name, blob_path))
+
+    def iter_chunks(self, container_name: str, blob_path: str, offset: int = None, length: int = None):
+        # streamed read, yields the blob (or a range of it) in chunks without holding it all in memory
+        downloader = self.blob(container_name, blob_path).download_blob(offset=offset, length=length)
+        for chunk in downloader.chunks():
+            yield chunk
+
+    def download_to_file(self, container_name: str, blob_path: str, fileobj: object, etag: str = None, max_concurrency: int = 1) -> dict:
+        # stream a blob into an open file. If etag is given this is a conditional request,
+        # and we return None without downloading anything when the blob hasn't changed. Otherwise returns the blob properties.
+        from azure.core import MatchConditions
+        from azure.core.exceptions import ResourceNotModifiedError
+
+        try:
+            if etag != None: downloader = self.blob(container_name, blob_path).download_blob(etag=etag, match_condition=MatchConditions.IfModified, max_concurrency=max_concurrency)
+            else: downloader = self.blob(container_name, blob_path).download_blob(max_concurrency=max_concurrency)
+        except ResourceNotModifiedError:
+            return None
+
+        downloader.readinto(fileobj)
+        return {"etag": downloader.properties.etag, "last_modified": str(downloader.properties.last_modified), "size": downloader.properties.size}
+
+    def get_properties(self, container_name: str, blob_path: str) -> dict:
+        props = self.blob(container_name, blob_path).get_blob_properties()
+        return {"etag": props.etag, "last_modified": str(props.last_modified), "size": props.size}
+
+    def upload(self, container_name: str, blob_path: str, data: object):
+        # write bytes or a stream to a blob (overwrites)
+        self.blob(container_name, blob_path).upload_blob(data=data, overwrite=True, blob_type="BlockBlob")
+
+    def walk(self, container_name: str, folder_name: str) -> list:
+        # list contents of a blob-directory (1 level, sub folders end in '/'), like ls
+        return [blob.name for blob in self.container(container_name).walk_blobs(folder_name)]
+
+    def list(self, container_name: str, folder_name: str = None) -> list:
+        # list every blob name in a container (optionally under a folder), recursively
+        return [blob.name for blob in self.container(container_name).list_blobs(name_starts_with=folder_name)]
+
+    def copy(self, container_name_origin: str, blob_origin: str, container_name_destination: str, blob_destination: str):
+        # server side copy (azure pulls from a short lived SAS url of the origin blob, nothing comes through this machine)
+        from azure.storage.blob import generate_blob_sas, BlobSasPermissions
+
+        sas = generate_blob_sas(account_name=self.account_name,
+                                container_name=container_name_origin,
+                                blob_name=blob_origin,
+                                account_key=self.account_key,
+                                permission=BlobSasPermissions(read=True),
+                                expiry=datetime.now(timezone.utc) + timedelta(hours=1))
+        sas_url = 'https://' + self.account_name + '.blob.core.windows.net/' + container_name_origin + '/' + blob_origin + '?' + sas
+        self.blob(container_name_destination, blob_destination).start_copy_from_url(sas_url)
+
+
+class LocalStorage:
+    # Local filesystem backend. <root>/<container>/<blob path> mirrors the azure containers exactly.
+    # etags are built from file modified time + size so conditional reads behave like azure.
+
+    def __init__(self, root: str):
+        self.root = root
+        for container_name in CONTAINERS:
+            os.makedirs(os.path.join(root, container_name), exist_ok=True)
+
+    def local_path(self, container_name: str, blob_path: str) -> str:
+        return os.path.join(self.root, container_name, blob_path)
+
+    def _etag(self, path: str) -> str:
+        st = os.stat(path)
+        return '"' + format(st.st_mtime_ns, 'x') + '-' + format(st.st_size, 'x') + '"'
+
+    def read_bytes(self, container_name: str, blob_path: str, offset: int = None, length: int = None, max_concurrency: int = 1) -> bytes:
+        with open(self.local_path(container_name, blob_path), 'rb') as f:
+            if offset != None: f.seek(offset)
+            if length != None: return f.read(length)
+            return f.read()
+
+    def open(self, container_name: str, blob_path: str) -> object:
+        return open(self.local_path(container_name, blob_path), 'rb')
+
+    def iter_chunks(self, container_name: str, blob_path: str, offset: int = None, length: int = None):
+        with open(self.local_path(container_name, blob_path), 'rb') as f:
+            if offset != None: f.seek(offset)
+            remaining = length
+            while True:
+                chunk = f.read(CHUNK_SIZE if remaining == None else min(CHUNK_SIZE, remaining))
+                if not chunk: break
+                if remaining != None: remaining = remaining - len(chunk)
+                yield chunk
+
+    def download_to_file(self, container_name: str, blob_path: str, fileobj: object, etag: str = None, max_concurrency: int = 1) -> dict:
+        path = self.local_path(container_name, blob_path)
+        if etag != None and etag == self._etag(path): return None
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, fileobj, CHUNK_SIZE)
+        return self.get_properties(container_name, blob_path)
+
+    def get_properties(self, container_name: str, blob_path: str) -> dict:
+        path = self.local_path(container_name, blob_path)
+        st = os.stat(path)
+        return {"etag": self._etag(path), "last_modified": str(datetime.fromtimestamp(st.st_mtime, timezone.utc)), "size": st.st_size}
+
+    def upload(self, container_name: str, blob_path: str, data: object):
+        path = self.local_path(container_name, blob_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp' + str(os.getpid()) + '_' + str(threading.get_ident())
+        with open(tmp_path, 'wb') as f:
+            if isinstance(data, (bytes, bytearray)): f.write(data)
+            else: shutil.copyfileobj(data, f, CHUNK_SIZE)
+        os.replace(tmp_path, path)
+
+    def walk(self, container_name: str, folder_name: str) -> list:
+        # same naming as azure walk_blobs: '<folder>/<file>' for files and '<folder>/<sub>/' for sub folders
+        folder = os.path.join(self.root, container_name, folder_name)
+        if not os.path.isdir(folder): return []
+        prefix = folder_name if folder_name.endswith('/') else folder_name + '/'
+        names = []
+        for entry in sorted(os.listdir(folder)):
+            if os.path.isdir(os.path.join(folder, entry)): names.append(prefix + entry + '/')
+            else: names.append(prefix + entry)
+        return names
+
+    def list(self, container_name: str, folder_name: str = None) -> list:
+        container_root = os.path.join(self.root, container_name)
+        names = []
+        for dirpath, dirnames, filenames in os.walk(container_root):
+            for filename in filenames:
+                name = os.path.relpath(os.path.join(dirpath, filename), container_root).replace(os.sep, '/')
+                if folder_name == None or name.startswith(folder_name): names.append(name)
+        return sorted(names)
+
+    def copy(self, container_name_origin: str, blob_origin: str, container_name_destination: str, blob_destination: str):
+        destination = self.local_path(container_name_destination, blob_destination)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copyfile(self.local_path(container_name_origin, blob_origin), destination)
@@ -10,8 +10,12 @@ def init_app():
         # Import parts of our core Flask app
         from . import routes
 
-         # Import Dash application
-        from .dash_app.app import init_dashboard
-        app = init_dashboard(app)
+         # Import Dash application (profile the boot, see dash_app/startup_profiler.py)
+        from .dash_app import startup_profiler as sp
+        with sp.phase("import dash app (module level loads)"):
+            from .dash_app.app import init_dashboard
+        with sp.phase("init_dashboard"):
+            app = init_dashboard(app)
+        sp.finish()
 
         return app
\ No newline at end of file
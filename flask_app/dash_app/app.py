@@ -6,9 +6,10 @@ from . import data_processing_runtime as d  # run-time processing
 from . import dash_html #index page
 from . import hovertip_text
 from . import modal_text
+from . import startup_profiler as sp # boot time instrumentation
 import logging
 import dash
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, State, ALL, MATCH
 import dash_core_components as dcc
 import dash_bootstrap_components as dbc
 import dash_html_components as html
@@ -16,6 +17,7 @@ import dash_deck
 from dash_extensions import Download
 from dash_extensions.snippets import send_data_frame, send_bytes, send_file
 from dash.exceptions import PreventUpdate #for raising exception to break out of callbacks
+from dash import no_update #for leaving a callback output as it is (not sent back to the browser)
 import pydeck
 import json
 import copy
@@ -25,13 +27,14 @@ import plotly.express as px
 import plotly.graph_objs as go
 import os
 from dotenv import load_dotenv
-from PIL import ImageColor #colour fun
 from functools import reduce #array fun for year intersects
 import time
 import xlsxwriter #needed for linux Ubuntu server
 import plotly
 import gc
 import sys
+import gzip
+from flask import request, Response, redirect, abort
 
 # add atlas/data folder to path (so we can access all the blobs at runtime from /data/data_paths.py)
 sys.path.append('/usr/src/app/data') #working dir for built container (see /Dockerfile)
@@ -50,6 +53,11 @@ load_dotenv()
 container_name  = os.getenv("AZURE_STORAGE_ACCOUNT_CONTAINER_NAME")
 account_name = os.getenv("AZURE_STORAGE_ACCOUNT_NAME")
 account_key = os.getenv("AZURE_STORAGE_ACCOUNT_KEY")
+snapshot_dir = os.getenv("ATLAS_SNAPSHOT_DIR", "tmp/snapshot") #local memory-mapped copy of master stats, shared by all gunicorn workers
+LOADER_THREADS = int(os.getenv("ATLAS_LOADER_THREADS", "8")) #max threads used to load blobs in parallel at startup
+USE_STATE_SNAPSHOT = os.getenv("ATLAS_STATE_SNAPSHOT", "0").lower() in ["1", "true", "yes"] #boot from a snapshot of fully built startup state (see d.read_state_snapshot)
+CLIENTSIDE_YEAR_SCRUB = os.getenv("ATLAS_CLIENTSIDE_YEAR_SCRUB", "1").lower() in ["1", "true", "yes"] #ship all years of a series with the map so the year slider redraws it in the browser (see js_callback_clientside_year_scrub)
+STATE_SNAPSHOT_FORMAT = 6 #bump when the shape of the startup state changes, so old snapshots are ignored
 #sudo docker run -p 80:8050 -v /home/dan/atlas/.env:/usr/src/app/.env ghcr.io/danny-baker/atlas/atlas_app:latest 
 
 # setup system
@@ -70,19 +78,49 @@ def init_dashboard(server):
         update_title=None          
     )
 
+    # Border geometry endpoint (figures reference this by URL instead of embedding the geojson)
+    server.add_url_rule('/geometry/<resolution>/<version>.geojson', 'geometry', serve_geometry)
+
     # Create Dash Layout
     dash_app._favicon = ("favicon.ico") #must be in /assets/favicon.ico 
     dash_app.title = "WORLD ATLAS 2.0" #browser tab
     dash_app.index_string = dash_html.index_string
-    create_dash_layout(dash_app)
+    with sp.phase("dash: create_dash_layout"):
+        create_dash_layout(dash_app)
 
     # Initialize callbacks after our app is loaded
-    init_callbacks(dash_app)
+    with sp.phase("dash: init_callbacks"):
+        init_callbacks(dash_app)
 
     return dash_app.server
 
 
 
+def serve_geometry(resolution, version):
+    # Serve a border resolution as precompressed geojson. The URL carries the content version, so responses are cached
+    # for a year (immutable) by the browser and nginx. An old version (e.g. a page open across a data update) redirects to the current one.
+
+    asset = geometry_assets.get(resolution)
+    if asset == None: abort(404)
+    if version != asset["etag"]:
+        response = redirect(get_geometry_url(resolution), code=302)
+        response.headers["Cache-Control"] = "no-store" #the current version moves on every data update, so never cache the redirect
+        return response
+
+    headers = {"ETag": '"'+asset["etag"]+'"', "Cache-Control": "public, max-age=31536000, immutable", "Vary": "Accept-Encoding"}
+    if asset["etag"] in request.if_none_match: return Response(status=304, headers=headers)
+
+    if 'gzip' in request.accept_encodings:
+        headers["Content-Encoding"] = "gzip"
+        return Response(asset["gzip"], mimetype="application/json", headers=headers)
+    return Response(gzip.decompress(asset["gzip"]), mimetype="application/json", headers=headers) #rare, any browser accepts gzip
+
+
+def get_geometry_url(resolution):
+    return '/geometry/' + resolution + '/' + geometry_assets[resolution]["etag"] + '.geojson'
+
+
+
 #DECLARE GLOBAL APPLICATION DATA
 
 mapbox_style = ["open-street-map", "carto-positron", "carto-darkmatter", "stamen-terrain", "stamen-toner", "stamen-watercolor"]
@@ -207,36 +245,143 @@ INIT_LOADER_CHART_COMPONENT_COLOR = "#3E3F3A"
 INIT_LOADER_TYPE = 'dot'
 
 
-## LOAD APP DATA ## CONSIDER LOADING THESE IN PARALLEL WITH THREAD POOLING
-
-#Load geojson 2d region data
-geojson_LOWRES = d.read_blob(account_name, account_key, container_name, MAP_JSON_LOW_PATH_TITANIUM, 'json', 'json')
-geojson_MEDRES = d.read_blob(account_name, account_key, container_name, MAP_JSON_MED_PATH_TITANIUM, 'json', 'json')
-geojson_HIRES = d.read_blob(account_name, account_key, container_name, MAP_JSON_HIGH_PATH_TITANIUM, 'json', 'json')
-
-#Load geojson 3d region data
-geojson_globe_land_ne50m = d.read_blob(account_name, account_key, container_name, GLOBE_JSON_LAND_HIGH_PATH_TITANIUM, 'json', 'json') # load contries
-geojson_globe_ocean_ne50m = d.read_blob(account_name, account_key, container_name, GLOBE_JSON_OCEAN_HIGH_PATH_TITANIUM, 'json', 'json') #load oceans
-geojson_globe_land_ne110m = d.read_blob(account_name, account_key, container_name, GLOBE_JSON_LAND_LOW_PATH_TITANIUM, 'json', 'json') # load countries
-geojson_globe_ocean_ne110m = d.read_blob(account_name, account_key, container_name, GLOBE_JSON_OCEAN_LOW_PATH_TITANIUM, 'json', 'json') # load oceans
-del(geojson_globe_ocean_ne110m['features'][0]['geometry']['coordinates'][12]) #americas, also a problem on ne50m. Fix this later in pipeline.
-
-# Load config (Dictionary of all datasets, their metadata and how to display them in the overhead nav menu)
-master_config, master_config_key_datasetid, master_config_key_nav_cat = d.read_master_config(['dataset_raw', 'dataset_id', 'nav_cat'],account_name, account_key, container_name, MASTER_CONFIG_PATH )
-
-#Load master stats dataset
-pop = d.read_blob(account_name, account_key, container_name, MASTER_STATS_PATH, 'parquet', 'dataframe')
-
-# Load experimental datasets
-EXP_POWER_PLANTS = d.read_blob(account_name, account_key, container_name, PWR_STN_PATH_TITANIUM, 'parquet', 'dataframe')
+## LOAD APP DATA ##
+
+# Every titanium blob the app boots from (the etags of these version the startup state snapshot)
+STATE_BLOBS = [MASTER_CONFIG_PATH, MASTER_STATS_PATH, MAP_JSON_LOW_PATH_TITANIUM, MAP_JSON_MED_PATH_TITANIUM, MAP_JSON_HIGH_PATH_TITANIUM,
+               GLOBE_JSON_LAND_HIGH_PATH_TITANIUM, GLOBE_JSON_OCEAN_HIGH_PATH_TITANIUM, GLOBE_JSON_LAND_LOW_PATH_TITANIUM, GLOBE_JSON_OCEAN_LOW_PATH_TITANIUM,
+               PWR_STN_PATH_TITANIUM]
+
+# Startup state snapshot (opt in). Everything derived at boot (config dicts, api dicts, parsed geojson, offsets index, year catalogue, navbar)
+# is written once to snapshot_dir and later workers/restarts just load it. Bump STATE_SNAPSHOT_FORMAT if you change how any of that state is built.
+if USE_STATE_SNAPSHOT:
+    sp.begin("state snapshot: read")
+    state_etags = d.load_in_parallel({blob: (d.get_blob_etag, (account_name, account_key, container_name, blob)) for blob in STATE_BLOBS}, LOADER_THREADS)
+    STATE_VERSION = d.get_state_version(state_etags, STATE_SNAPSHOT_FORMAT, INIT_year_SLIDER_FONTSIZE, INIT_year_SLIDER_FONTCOLOR)
+    state = d.read_state_snapshot(snapshot_dir, 'data', STATE_VERSION)
+    sp.end("state snapshot: read")
+else:
+    STATE_VERSION = None
+    state = None
+
+# 2d border geometry by resolution (settings 0/1/2), served to the browser from /geometry/<resolution>/<version>.geojson
+GEOMETRY_RESOLUTIONS = ["low", "medium", "high"]
+
+if state == None:
+
+    sp.begin("load: master config")
+    # Load config first (Dictionary of all datasets, their metadata and how to display them in the overhead nav menu). It's small, and the master stats snapshot build needs it.
+    master_config, master_config_key_datasetid, master_config_key_nav_cat = d.read_master_config(['dataset_raw', 'dataset_id', 'nav_cat'],account_name, account_key, container_name, MASTER_CONFIG_PATH )
+    
+    sp.end("load: master config")
+    
+    # Load everything else in parallel on a bounded thread pool (raises if anything fails to load)
+    sp.begin("load: blobs + master stats (parallel)")
+    artifacts = d.load_in_parallel({
+        #geojson 2d region data
+        "geojson_LOWRES": (d.read_blob, (account_name, account_key, container_name, MAP_JSON_LOW_PATH_TITANIUM, 'json', 'json')),
+        "geojson_MEDRES": (d.read_blob, (account_name, account_key, container_name, MAP_JSON_MED_PATH_TITANIUM, 'json', 'json')),
+        "geojson_HIRES": (d.read_blob, (account_name, account_key, container_name, MAP_JSON_HIGH_PATH_TITANIUM, 'json', 'json')),
+        #geojson 3d region data
+        "geojson_globe_land_ne50m": (d.read_blob, (account_name, account_key, container_name, GLOBE_JSON_LAND_HIGH_PATH_TITANIUM, 'json', 'json')), # load contries
+        "geojson_globe_ocean_ne50m": (d.read_blob, (account_name, account_key, container_name, GLOBE_JSON_OCEAN_HIGH_PATH_TITANIUM, 'json', 'json')), #load oceans
+        "geojson_globe_land_ne110m": (d.read_blob, (account_name, account_key, container_name, GLOBE_JSON_LAND_LOW_PATH_TITANIUM, 'json', 'json')), # load countries
+        "geojson_globe_ocean_ne110m": (d.read_blob, (account_name, account_key, container_name, GLOBE_JSON_OCEAN_LOW_PATH_TITANIUM, 'json', 'json')), # load oceans
+        #master stats dataset (typed, sorted by series/year/country and memory-mapped from a local arrow snapshot, so all workers share one copy)
+        "pop": (d.read_master_stats, (account_name, account_key, container_name, MASTER_STATS_PATH, MASTER_COUNTRIES_PATH, master_config, snapshot_dir)),
+        #experimental datasets
+        "EXP_POWER_PLANTS": (d.read_blob, (account_name, account_key, container_name, PWR_STN_PATH_TITANIUM, 'parquet', 'dataframe')),
+        }, LOADER_THREADS)
+    
+    geojson_LOWRES = artifacts["geojson_LOWRES"]
+    geojson_MEDRES = artifacts["geojson_MEDRES"]
+    geojson_HIRES = artifacts["geojson_HIRES"]
+    geojson_globe_land_ne50m = artifacts["geojson_globe_land_ne50m"]
+    geojson_globe_ocean_ne50m = artifacts["geojson_globe_ocean_ne50m"]
+    geojson_globe_land_ne110m = artifacts["geojson_globe_land_ne110m"]
+    geojson_globe_ocean_ne110m = artifacts["geojson_globe_ocean_ne110m"]
+    del(geojson_globe_ocean_ne110m['features'][0]['geometry']['coordinates'][12]) #americas, also a problem on ne50m. Fix this later in pipeline.
+    pop, countries = artifacts["pop"]
+    EXP_POWER_PLANTS = artifacts["EXP_POWER_PLANTS"]
+    del artifacts
+    sp.end("load: blobs + master stats (parallel)")
+    
+    # Build the offsets index (all series lookups go through d.get_pop_slice)
+    with sp.phase("build: pop index"):
+        pop, pop_index = d.build_pop_index(pop, countries, presorted=True)
+    
+    # Build per-series year catalogue once (sorted years, slider index lookups, ready-made slider marks)
+    with sp.phase("build: year catalogue"):
+        year_catalogue = d.build_year_catalogue(pop_index, INIT_year_SLIDER_FONTSIZE, INIT_year_SLIDER_FONTCOLOR)
+    
+    # Build the dense series x country value cube for the bubble and sunburst charts (see d.build_value_cube)
+    with sp.phase("build: value cube"):
+        value_cube = d.build_value_cube(pop, pop_index)
+    
+    # set global api lookup dicts (for url path operations)
+    with sp.phase("build: api lookup dicts"):
+        api_dict_raw_to_label, api_dict_label_to_raw = d.create_api_lookup_dicts(master_config)
+
+    # precompressed, content versioned copy of each border resolution (see d.build_geometry_asset and serve_geometry)
+    with sp.phase("build: geometry assets"):
+        geometry_assets = {"low": d.build_geometry_asset(geojson_LOWRES), "medium": d.build_geometry_asset(geojson_MEDRES), "high": d.build_geometry_asset(geojson_HIRES)}
+    
+    if USE_STATE_SNAPSHOT:
+        sp.begin("state snapshot: write")
+        d.write_state_snapshot(snapshot_dir, 'data', STATE_VERSION, {
+            "master_config": master_config, "master_config_key_datasetid": master_config_key_datasetid, "master_config_key_nav_cat": master_config_key_nav_cat,
+            "geojson_LOWRES": geojson_LOWRES, "geojson_MEDRES": geojson_MEDRES, "geojson_HIRES": geojson_HIRES,
+            "geojson_globe_land_ne50m": geojson_globe_land_ne50m, "geojson_globe_ocean_ne50m": geojson_globe_ocean_ne50m,
+            "geojson_globe_land_ne110m": geojson_globe_land_ne110m, "geojson_globe_ocean_ne110m": geojson_globe_ocean_ne110m,
+            "EXP_POWER_PLANTS": EXP_POWER_PLANTS, "pop_index": dict(pop_index, countries=None), "year_catalogue": year_catalogue,
+            "api_dict_raw_to_label": api_dict_raw_to_label, "api_dict_label_to_raw": api_dict_label_to_raw,
+            "geometry_assets": geometry_assets,
+            "value_cube_values": value_cube["values"], "value_cube_mask": value_cube["mask"], "value_cube_rows": value_cube["rows"],
+            })
+        sp.end("state snapshot: write")
+
+else:
+    
+    # Boot from the snapshot. Only master stats is still read, and that is just a memory-map of its (already sorted) arrow snapshot.
+    master_config = state["master_config"]
+    master_config_key_datasetid = state["master_config_key_datasetid"]
+    master_config_key_nav_cat = state["master_config_key_nav_cat"]
+    geojson_LOWRES = state["geojson_LOWRES"]
+    geojson_MEDRES = state["geojson_MEDRES"]
+    geojson_HIRES = state["geojson_HIRES"]
+    geojson_globe_land_ne50m = state["geojson_globe_land_ne50m"]
+    geojson_globe_ocean_ne50m = state["geojson_globe_ocean_ne50m"]
+    geojson_globe_land_ne110m = state["geojson_globe_land_ne110m"]
+    geojson_globe_ocean_ne110m = state["geojson_globe_ocean_ne110m"]
+    EXP_POWER_PLANTS = state["EXP_POWER_PLANTS"]
+    pop_index = state["pop_index"]
+    year_catalogue = state["year_catalogue"]
+    api_dict_raw_to_label = state["api_dict_raw_to_label"]
+    api_dict_label_to_raw = state["api_dict_label_to_raw"]
+    geometry_assets = state["geometry_assets"]
+    with sp.phase("load: master stats"):
+        pop, countries = d.read_master_stats(account_name, account_key, container_name, MASTER_STATS_PATH, MASTER_COUNTRIES_PATH, master_config, snapshot_dir)
+    pop_index["countries"] = countries
+    value_cube = {"values": state["value_cube_values"], "mask": state["value_cube_mask"], "rows": state["value_cube_rows"], "countries": countries}
+
+del state
+
+# Geometry is shared by every request and thread in the worker, so it's frozen (read-only). Renderers build per request overlays on top.
+with sp.phase("build: freeze geometry"):
+    GEOMETRY = {"low": d.freeze_geojson(geojson_LOWRES), "medium": d.freeze_geojson(geojson_MEDRES), "high": d.freeze_geojson(geojson_HIRES)}
+    GLOBE_GEOMETRY = {"land_ne110m": d.freeze_geojson(geojson_globe_land_ne110m), "ocean_ne110m": d.freeze_geojson(geojson_globe_ocean_ne110m),
+                      "land_ne50m": d.freeze_geojson(geojson_globe_land_ne50m), "ocean_ne50m": d.freeze_geojson(geojson_globe_ocean_ne50m)}
+    del geojson_LOWRES, geojson_MEDRES, geojson_HIRES, geojson_globe_land_ne110m, geojson_globe_ocean_ne110m, geojson_globe_land_ne50m, geojson_globe_ocean_ne50m
+
+# feature position <> country_id for every geometry set, so the globe/jigsaw join data to features by lookup (see d.build_feature_index)
+FEATURE_INDEX = {name: d.build_feature_index(gj, 'UN_A3', countries) for name, gj in GEOMETRY.items()}
+GLOBE_FEATURE_INDEX = {name: d.build_feature_index(gj, 'sr_un_a3', countries) for name, gj in GLOBE_GEOMETRY.items()}
 
 #Set global dataset size indicators (for text in search bar)
-DATASETS = len(pd.unique(pop['dataset_raw'])) 
+DATASETS = len(pop_index["series"]) 
 OBSERVATIONS = len(pop.index)
-SERIES = pd.unique(pop['dataset_raw']) #for randomising
-
-# set global api lookup dicts (for url path operations)
-api_dict_raw_to_label, api_dict_label_to_raw = d.create_api_lookup_dicts(master_config)
+SERIES = list(pop_index["series"].keys()) #for randomising
+YEARS = np.unique(np.concatenate([d.get_year_array(year_catalogue, series) for series in SERIES])).tolist() if len(SERIES) > 0 else [] #every year with data in any series (downloads modal)
 
 
 #@cache.memoize(timeout=CACHE_TIMEOUT)
@@ -254,15 +399,14 @@ def create_chart_bar(df, series, dropdown_choices):
     
     #If there is an array of countries to mark, set the colour to black
     if dropdown_choices != None:
-        for i in range(0,len(dropdown_choices)):
-            df.loc[df['country']==dropdown_choices[i], 'color'] = 'black' #discrete_colorscale[i][0][1]        
+        df.loc[df['country_id'].isin(d.get_country_ids(countries, dropdown_choices)), 'color'] = 'black' #discrete_colorscale[i][0][1]                
     
     #GRAPH OBJECT VERSION
     #build using graph object
     fig = go.Figure([
         go.Bar(
             x=df['country'],
-            y=df['value'],            
+            y=df['value_num'],            
             hovertemplate="%{x} %{y:}<extra></extra>",
             opacity=0.7,
             )
@@ -311,26 +455,14 @@ def create_chart_line(df, series, dropdown_choices):
     logger.info("Creating line graph with series %r", series)
           
     #get unique, ordered list of years for selected series
-    chartdata = pd.DataFrame(np.sort(pd.unique(df["year"])), columns=["year"]).copy() #numpy array...fix for pop
+    years = np.sort(pd.unique(df["year"]))
     
-    #loop through dropdown_choices and populate chartdata array    
-    if dropdown_choices != None:
-        for i in range(0,len(dropdown_choices)):
-            
-            #create a new column for each country
-            chartdata[dropdown_choices[i]] = "hello"
-            
-            #for this country, set any vals found in dataset (be sure to do a isin check first)
-            for j in range(0,len(chartdata)):
-                
-                #check to see if data exists for this country and year (avoids a key error)                
-                if chartdata.iloc[j][0] in df[(df['country']==dropdown_choices[i])].year.values:                    
-                    #update chart data with corresponding value for this country and year
-                    chartdata.loc[chartdata.year == chartdata.iloc[j][0], dropdown_choices[i]] = df[(df['country']==dropdown_choices[i]) & (df['year']==chartdata.iloc[j][0])].iloc[0][4]
-                
-                else:                    
-                    #this country must be missing some data points compared to others in the set
-                    chartdata.loc[chartdata.year == chartdata.iloc[j][0], dropdown_choices[i]] = None
+    #pivot the series slice into a year x country matrix (one column per selected country, in dropdown order)
+    #countries missing some data points compared to others in the set just get gaps (NaN)
+    if dropdown_choices == None: dropdown_choices = []
+    country_ids = d.get_country_ids(countries, dropdown_choices)
+    selected = df[df['country_id'].isin(country_ids)].drop_duplicates(['year', 'country_id'])
+    chartdata = selected.pivot(index='year', columns='country_id', values='value_num').reindex(index=years, columns=country_ids)
     
    
     # set line width based on number of countries
@@ -342,15 +474,15 @@ def create_chart_line(df, series, dropdown_choices):
     # now build the figure
     fig = go.Figure()
     
-    if dropdown_choices != None:
+    if len(dropdown_choices) > 0:
         for k in range(0,len(dropdown_choices)):  
             
             #build custom list for hover template (must be country name repeated)
             countryname = [dropdown_choices[k]] * len(chartdata)                        
             
             fig.add_trace(go.Scatter(
-                x=chartdata['year'],
-                y=chartdata[dropdown_choices[k]],
+                x=chartdata.index,
+                y=chartdata.iloc[:, k], #column per country
                 name=dropdown_choices[k], # Style name/legend entry with html tags
                 showlegend=True,
                 customdata=countryname,
@@ -382,30 +514,17 @@ def create_chart_bubble(x, y, z, year, xlog, ylog, zlog):
         fig = px.scatter()
         return fig
     
-    #Build 3 dataframes as precursor to chart data
-    if x != None:
-        dfx = pop[(pop['dataset_raw']==x) & (pop['year']==year)].rename(columns={"value":x})        
-        dfx[x] = dfx[x].astype(float)
-        #d.add_regions(dfx,country_lookup) #add regions
-        seriesX_label = master_config[x].get("dataset_label") 
-    
-    if y != None:
-        dfy = pop[(pop['dataset_raw']==y) & (pop['year']==year)].rename(columns={"value":y})
-        dfy[y] = dfy[y].astype(float)
-        #d.add_regions(dfy,country_lookup) #add regions
-        seriesY_label = master_config[y].get("dataset_label") 
-    
-    if z != None:
-        dfz = pop[(pop['dataset_raw']==z) & (pop['year']==year)].rename(columns={"value":z})
-        dfz[z] = dfz[z].astype(float)
-        #d.add_regions(dfz,country_lookup) #add regions
-        seriesZ_label = master_config[z].get("dataset_label") 
+    #Chart data: the selected series lined up by country for this year (countries present in all of them), sliced from the value cube
+    dfa = d.get_cube_frame(value_cube, [i for i in (x, y, z) if i != None], year)
+    
+    if x != None: seriesX_label = master_config[x].get("dataset_label") 
+    if y != None: seriesY_label = master_config[y].get("dataset_label") 
+    if z != None: seriesZ_label = master_config[z].get("dataset_label") 
     
     #we're gonna need logic for every input combination so user can experience the chart growing dynamically
       
     # x only
     if x!=None and y==None and z==None:
-        dfa = dfx
         #print("x")
         fig = px.scatter(dfa,
                      x=x,
@@ -420,10 +539,6 @@ def create_chart_bubble(x, y, z, year, xlog, ylog, zlog):
     
     # x y only
     elif x!=None and y!=None and z==None:
-        common_countries = reduce(np.intersect1d,(dfx['country'].values,dfy['country'].values))
-        dfx = dfx[dfx['country'].isin(common_countries)]
-        dfy = dfy[dfy['country'].isin(common_countries)]
-        dfa = pd.merge(dfx,dfy[['country',y]],on='country', how='left')
         #print("xy")
         fig = px.scatter(dfa,
                      x=x,
@@ -439,10 +554,6 @@ def create_chart_bubble(x, y, z, year, xlog, ylog, zlog):
         
     # x z only
     elif x!=None and y==None and z!=None:    
-        common_countries = reduce(np.intersect1d,(dfx['country'].values, dfz['country'].values))
-        dfx = dfx[dfx['country'].isin(common_countries)]        
-        dfz = dfz[dfz['country'].isin(common_countries)]
-        dfa = pd.merge(dfx,dfz[['country',z]],on='country', how='left')
         #print("xz")
         
         #custom logic for log z as it is not available in px function
@@ -465,7 +576,6 @@ def create_chart_bubble(x, y, z, year, xlog, ylog, zlog):
         
     # y only    
     elif x==None and y!=None and z==None:
-        dfa = dfy
         #print("y")
         fig = px.scatter(dfa,
                      #x=x,
@@ -481,10 +591,6 @@ def create_chart_bubble(x, y, z, year, xlog, ylog, zlog):
     
     # y z only
     elif x==None and y!=None and z!=None:
-        common_countries = reduce(np.intersect1d,(dfy['country'].values, dfz['country'].values))        
-        dfy = dfy[dfy['country'].isin(common_countries)]
-        dfz = dfz[dfz['country'].isin(common_countries)]
-        dfa = pd.merge(dfy,dfz[['country',z]],on='country', how='left')
         #print("yz")
         
         #custom logic for log z as it is not available in px function
@@ -508,7 +614,6 @@ def create_chart_bubble(x, y, z, year, xlog, ylog, zlog):
         
     # z only    
     elif x==None and y==None and z!=None:
-        dfa = dfz
         #print("z")
         
         #custom logic for log z as it is not available in px function
@@ -530,18 +635,6 @@ def create_chart_bubble(x, y, z, year, xlog, ylog, zlog):
     
     # x y z
     else:
-    
-        #find the unique list of countries that are present in all 3 datasets
-        common_countries = reduce(np.intersect1d,(dfx['country'].values,dfy['country'].values, dfz['country'].values))
-        
-        #strip out non common countries from the 3 datasets before merging
-        dfx = dfx[dfx['country'].isin(common_countries)]
-        dfy = dfy[dfy['country'].isin(common_countries)]
-        dfz = dfz[dfz['country'].isin(common_countries)]
-        
-        #merge the dataframes on country    
-        dfa = pd.merge(dfx,dfy[['country',y]],on='country', how='left')
-        dfa = pd.merge(dfa,dfz[['country',z]],on='country', how='left')
         
         #print("xyz")
         
@@ -624,28 +717,13 @@ def create_chart_sunburst(series, color, year, colorbar_sb):
         return fig
     
     
-    #Build 2 dataframes as precursor to chart data
-    if x != None:
-        dfx = pop[(pop['dataset_raw']==x) & (pop['year']==int(year))].rename(columns={"value":x})        #memory leak?
-        dfx[x] = dfx[x].astype(float)
-        seriesX_label = master_config[x].get("dataset_label") 
-        
-        #Need to revert the categoricals for this to work. TODO
-        dfx['continent'] = dfx['continent'].astype(str)              
-        dfx['country'] = dfx['country'].astype(str)
-    
-    if y != None:
-        dfy = pop[(pop['dataset_raw']==y) & (pop['year']==int(year))].rename(columns={"value":y})             #memory leak?
-        dfy[y] = dfy[y].astype(float)
-        seriesY_label = master_config[y].get("dataset_label") 
-        
-        #Need to revert the categoricals for this to work. TODO
-        dfy['continent'] = dfy['continent'].astype(str)
-        dfy['country'] = dfy['country'].astype(str)
+    #Chart data: slice width (and colour) series lined up by country for this year, sliced from the value cube (country/continent are plain strings)
+    dfa = d.get_cube_frame(value_cube, [i for i in (x, y) if i != None], year)
+    if x != None: seriesX_label = master_config[x].get("dataset_label") 
+    if y != None: seriesY_label = master_config[y].get("dataset_label") 
     
     # x only
     if x!=None and y==None:
-        dfa = dfx
         print("x")
         logger.info("Sunburst chart data. Length %r, Cols %r",len(dfa), dfa.columns)
         fig = px.sunburst(
@@ -659,13 +737,6 @@ def create_chart_sunburst(series, color, year, colorbar_sb):
     # x and y
     if x!=None and y!=None:
         
-        #interesect on country name (and year)
-        common_countries = reduce(np.intersect1d,(dfx['country'].values,dfy['country'].values))
-        #logger.info("common countries %r",common_countries)
-        dfx = dfx[dfx['country'].isin(common_countries)]
-        dfy = dfy[dfy['country'].isin(common_countries)]
-        dfa = pd.merge(dfx,dfy[['country',y]],on='country', how='left')
-        
         print("xy")        
         #logger.info("Sunburst chart data. Length %r, Cols %r",len(dfa), dfa.columns)        
         
@@ -696,80 +767,29 @@ def create_chart_sunburst(series, color, year, colorbar_sb):
     
     return fig
 
-def create_chart_geobar(series, year, colorscale, gj, jellybean):
+def create_chart_geobar(series, year, colorscale, colorscale_reverse, geometry, jellybean):
     
     # subset master dataset     
-    df = pop[(pop["year"] == int(year)) & (pop["dataset_raw"] == series)].copy() #memory leak ?
-    
-    #cast value to float
-    df['value'] = df['value'].astype(float)               
+    df = d.get_pop_slice(pop, pop_index, series, int(year)).copy() #memory leak ?
     
-    #fix for removing note and source columns
-    df['fix1'] = "dummmy"
-    df['fix2'] = "dummy"
-    
-    #add random colours (note moving these will fuck up column indexing that is hardcoded in subsequent statements)
+    #add random colours
     df['r'] = np.random.randint(0, 255, df.shape[0]).astype(str)
     df['g'] = np.random.randint(0, 255, df.shape[0]).astype(str)
     df['b'] = np.random.randint(0, 255, df.shape[0]).astype(str)        
     df['rgb'] = '[' + df['r'].map(str) + ',' + df['g'].map(str) + ',' + df['b'].map(str) + ']' #hoped to use this but as it turns out I need individual R/G/B vals 
     
-    #now try to do proper colour interpolation
-    
-    #Linear               
-    
-    #ratio should be a proportion of the max value in the list                      
-    df['f-linear'] = df['value'] / np.max(df["value"]) #i.e. what proportion is it of the max        
-    #print("fraction linear", df['f-linear'])#should be between 0-1
-    
-    #Logarithmic
-    
-    #drop values below zero (they cannot be displayed on current choropleth style)
-    df = df[df.value > 0]  
-    
-    #transform the data values to log10 (zeros introduced where log not computed)
-    df['value_log10'] = np.log10(df['value'], out=np.zeros_like(df['value']), where=(df['value']!=0))        
-    
-    #now drop any rows with zero vals (or it will be affected by subsequent colour interpolation logic)
-    df = df[df.value_log10 != 0]       
-    
-    #translate data range to positive
-    mn = np.min(df["value_log10"])
-    mx = np.max(df["value_log10"])
-    if mn < 0.0:            
-        print("Color correction, translating log vals")
-        df['value_log10'] = df['value_log10'] + abs(mn)
-    
-    #now calculate the 0-1 ratio (normalise)
-    df['f-log'] = df['value_log10'] / np.max(df["value_log10"]) #i.e. what proportion is it of the max             
-    
-    if colorscale[0][1][0] != "#":
-        #i.e. we have an RGB color array (happens after settings are changed), so convert to hex
-        print("RGB color array found in map data. Converting to hex")
-        for i in range(0,len(colorscale)):              
-            red = d.extractRed(colorscale[i][1])
-            green = d.extractGreen(colorscale[i][1])
-            blue = d.extractBlue(colorscale[i][1])
-            hx = '#{:02x}{:02x}{:02x}'.format(red, green , blue)
-            #print(red, green, blue, hx)
-            colorscale[i][1] = hx #replace rgb string with hex string   
-    
-    #based on the value for each row, obtain the two colours and mixing to interpolate between them!
-    df['c1'] = df.apply(lambda row : d.extractColorPositions(colorscale, row['f-log'])[0], axis =1).astype(str)
-    df['c2'] = df.apply(lambda row : d.extractColorPositions(colorscale, row['f-log'])[1], axis =1).astype(str)
-    df['mix'] = df.apply(lambda row : d.extractColorPositions(colorscale, row['f-log'])[2], axis =1).astype(float)
-    
-    #get hex val by linear interpolation between c1, c2, mix for each row, and also convert this into the component RGB vals (for deck.gl)
-    df['hex'] = df.apply(lambda row : d.colorFader(row['c1'], row['c2'], row['mix']), axis =1) #linear interpolation between two hex colours
+    #now do proper colour interpolation, log10 scale in one vectorised pass (values <= 0 can't be displayed so those rows are dropped). See d.colorize
+    keep, rgb = d.colorize(df['value_num'].to_numpy(), colorscale, "log", colorscale_reverse)
+    df = df[keep]
     
     #leave colours random (previously set) if jellybean is true
     if jellybean == False:
-        df['r'] = df.apply(lambda row : ImageColor.getcolor(row['hex'], "RGB")[0], axis =1).astype(str) #return the red (index 0 of tuple) from the RGB tuble returned by getcolor 
-        df['g'] = df.apply(lambda row : ImageColor.getcolor(row['hex'], "RGB")[1], axis =1).astype(str) #return the greeen (index 0 of tuple) from the RGB tuble returned by getcolor 
-        df['b'] = df.apply(lambda row : ImageColor.getcolor(row['hex'], "RGB")[2], axis =1).astype(str) #return the blue (index 0 of tuple) from the RGB tuble returned by getcolor 
+        df['r'] = rgb[:, 0].astype(str)
+        df['g'] = rgb[:, 1].astype(str)
+        df['b'] = rgb[:, 2].astype(str)
     
     # setup normalisation bins to tame the height of the polygons (target a max of 5000000, it's a map quirk in deck.gl)        
-    mx = np.max(df["value"])
+    mx = np.max(df["value_num"])
     norm = 1 #default normalisation multiplier
     if mx < 10:
         norm = 500000
@@ -793,40 +813,33 @@ def create_chart_geobar(series, year, colorscale, gj, jellybean):
     
     #logger.info("TESTING: Max: %r, Norm: %r, elevation: %r",mx,norm,elevation)   
     
-    #remove antarctica from JSON
-    for i in range(0, len(gj['features'])):
-        try:
-            if gj['features'][i]['properties']['UN_A3'] == '010':
-                print("removing antactica from json!")
-                del gj['features'][i]
-        except IndexError as error:
-            print("Area51: Exception thrown trying to remove antactica")
-    
-    #loop through all geojson features and set the colour value from the df for each
-    for i in range(0, len(gj['features'])):
-        try:                               
-            
-            #At this point, check if country name/val None (i.e. no data in DF), and grab the country name for the properties of the JSON, and set the value to 0
-            
-            #if no data exists for a country in this series, store the country name from json, set val to 0, and set a nice grey colour so it displays on jigsaw
-            if gj['features'][i]['properties']['UN_A3'] not in df["m49_un_a3"].values:
-                #print(gj['features'][i]['properties']['BRK_NAME'])
-                gj['features'][i]['country'] = gj['features'][i]['properties']['BRK_NAME'] #grab country name from json              
-                gj['features'][i]['value'] = "no data"                    
-                gj['features'][i]['properties']['MAPCOLOR7'] = "224" #grey
-                gj['features'][i]['properties']['MAPCOLOR8'] = "224"
-                gj['features'][i]['properties']['MAPCOLOR9'] = "224"
-                
-            else:             
-                #set country name and value (for tooltip, at feature level) and and add the colours from the df
-                gj['features'][i]['country'] = df[df["m49_un_a3"]==gj['features'][i]['properties']['UN_A3']].iloc[0,1] #country name                
-                gj['features'][i]['value'] = df[df["m49_un_a3"]==gj['features'][i]['properties']['UN_A3']].iloc[0,4] #value                      
-                gj['features'][i]['properties']['MAPCOLOR7'] = df[df["m49_un_a3"]==gj['features'][i]['properties']['UN_A3']].iloc[0,10] #Red
-                gj['features'][i]['properties']['MAPCOLOR8'] = df[df["m49_un_a3"]==gj['features'][i]['properties']['UN_A3']].iloc[0,11] #Green
-                gj['features'][i]['properties']['MAPCOLOR9'] = df[df["m49_un_a3"]==gj['features'][i]['properties']['UN_A3']].iloc[0,12] #Blue   
+    #country name, value and colour for each country, keyed by country_id (one pass over the df instead of a scan per feature)
+    rows = d.get_rows_by_country(df, ['country', 'value_num', 'r', 'g', 'b'])
+    
+    #build the jigsaw geojson from the shared map geometry (only the per feature data is new, the geometry is never copied)
+    base = GEOMETRY[geometry]
+    features = []
+    for feature, code, country_id in zip(base['features'], FEATURE_INDEX[geometry]['codes'], FEATURE_INDEX[geometry]['country_ids']):
+        
+        #leave out antarctica
+        if code == '010': continue
+        
+        properties = dict(feature['properties'])
+        row = rows.get(country_id)
         
-        except IndexError as error:
-            print("Area51: Exception thrown attempting to build custom dict from json (expected)")
+        #if no data exists for a country in this series, use the country name from json and set a nice grey colour so it displays on jigsaw
+        if row is None:
+            country, value = properties.get('BRK_NAME'), "no data"
+            properties['MAPCOLOR7'], properties['MAPCOLOR8'], properties['MAPCOLOR9'] = "224", "224", "224" #grey
+        
+        #set country name and value (for tooltip, at feature level) and add the colours from the df
+        else:
+            country, value = row[0], row[1]
+            properties['MAPCOLOR7'], properties['MAPCOLOR8'], properties['MAPCOLOR9'] = row[2], row[3], row[4] #Red, Green, Blue
+        
+        features.append(dict(feature, properties=properties, country=country, value=value))
+    
+    gj = dict(base, features=features)
     
     mapbox_api_token = os.getenv("MAPBOX_ACCESS_TOKEN")      
             
@@ -946,10 +959,10 @@ def create_chart_globe(gj_land, gj_ocean):
 def create_chart_globe_powerstations_xp1():
     # This is dirty. But it works.    
     
-    LAND = geojson_globe_land_ne50m
-    OCEANS = geojson_globe_ocean_ne50m 
+    LAND = GLOBE_GEOMETRY["land_ne50m"]
+    OCEANS = GLOBE_GEOMETRY["ocean_ne50m"]
     
-    df = EXP_POWER_PLANTS
+    df = EXP_POWER_PLANTS.copy() #shared, don't add columns to it
 
     def color_by_fuel(fuel_type):
         if fuel_type.lower() in "nuclear": return [10, 230, 120] #green
@@ -1045,10 +1058,17 @@ def create_map_geomap_empty():
     return fig
     
 
+# geomap hover text (numeric series). Shared with the clientside year scrubber, which rebuilds the trace in the browser
+GEOMAP_HOVERTEMPLATE = "%{customdata} %{text:,.2f}<extra></extra>" 
+GEOMAP_HOVERTEMPLATE_LARGE = "%{customdata} %{text:,d}<extra></extra>" #large number formatting no decmials e.g. 123,000,000
+
+
 #@cache.memoize(timeout=CACHE_TIMEOUT)
-def create_map_geomap(df, geojson, series, zoom, center, selected_map_location, mapstyle, colorbarstyle, colorpalette_reverse):      
-        
+def create_map_geomap(df, geometry, series, zoom, center, selected_map_location, mapstyle, colorbarstyle, colorpalette_reverse):
+
     logger.info("Create Geomap...")
+
+    # geometry is the border resolution name. The browser fetches the borders from its (cached) URL
     
     if series == None: return create_map_geomap_empty()  #speical case for if settings are applied before a dataset is selected. Cmplicated logic.
     
@@ -1060,39 +1080,29 @@ def create_map_geomap(df, geojson, series, zoom, center, selected_map_location,
     if var_type == "discrete":
         #print("Discrete data found. Dataframe length is:", len(df))        
         #print("data types ",df.dtypes)
-        #print("discrete classes found ",len(df['value'].unique()))
+        #print("discrete classes found ",len(df['value_cat'].unique()))
         
         #build figure out here for discrete data        
         hovertemp = "%{customdata}: %{text}<extra></extra>" 
         
         fig = go.Figure()
         
-        #Loop through all the discrete classes and add a coloured trace
-        for i, discrete_classes in enumerate(df['value'].unique()): 
+        #every class trace points at the same geometry (the cached border URL)
+        geometry_ref = get_geometry_url(geometry)
+        
+        #Loop through the discrete classes present in this dataset (observed only, value_cat categories are shared across all series), split in one pass in order of appearance, and add a coloured trace
+        for i, (discrete_classes, t) in enumerate(df.groupby('value_cat', sort=False, observed=True)): 
             #logger.info("Create discrete geomap.Iterator i and type are: %r, %r",i, discrete_classes)
             
-            #subset dataframe to a discrete class
-            t = df[df["value"] == discrete_classes]
-            
-            #optimisation: strip out unneeded json before passing to fig.add            
-            
-            #loop through JSON and pull anything from the mask
-            gj = copy.deepcopy(geojson)
-            gj['features'].clear()
-            for j in range(0,len(geojson['features'])):                
-                if geojson['features'][j]['properties']['UN_A3'] in t.m49_un_a3.values:                    
-                    gj['features'].append(geojson['features'][j])                
-             
-            
-            #add a choroplethmapbox trace passing just the JSON fragments needed for each discrete category
-            fig.add_choroplethmapbox(geojson=gj, #send the bare minimum json each time
+            #add a choroplethmapbox trace per class, carrying only its locations and z (the geometry is shared)
+            fig.add_choroplethmapbox(geojson=geometry_ref,
                                      locations=t.m49_un_a3,
                                      z=[i,] * len(t),                                     
                                      featureidkey="properties.UN_A3", #this is the link to the gejson
                                      showlegend=True,
                                      name=discrete_classes,
                                      customdata=t['country'],  
-                                     text=t['value'],
+                                     text=t['value_cat'],
                                      hovertemplate=hovertemp,
                                      colorscale=discrete_colorscale[i],                                     
                                      showscale=False,
@@ -1116,18 +1126,18 @@ def create_map_geomap(df, geojson, series, zoom, center, selected_map_location,
         logger.info("Create Geomap: 'continuous' or 'ratio' dataset")
                             
         # format numbers in d3 format
-        #print("Mean value is ",df['value'].astype(float).mean())
-        hovertemp = "%{customdata} %{text:,.2f}<extra></extra>" 
-        if df["value"].astype(float).mean() > 1000000: hovertemp = "%{customdata} %{text:,d}<extra></extra>" #large number formatting no decmials e.g. 123,000,000                
+        #print("Mean value is ",df['value_num'].mean())
+        hovertemp = GEOMAP_HOVERTEMPLATE
+        if df["value_num"].mean() > 1000000: hovertemp = GEOMAP_HOVERTEMPLATE_LARGE                
                 
         #Build main figure
         fig = go.Figure(
             go.Choroplethmapbox(
-                geojson=geojson,
+                geojson=get_geometry_url(geometry),
                 locations=df.m49_un_a3, #if you correct and link on the country name, can free up customdata field for the units                
                 featureidkey="properties.UN_A3",                
-                z=np.log10(df['value'].astype(float)),  #use log scale to naturally normalise. 
-                text=df['value'],
+                z=np.log10(df['value_num']),  #use log scale to naturally normalise. 
+                text=df['value_num'],
                 customdata=df['country'],                
                 hoverinfo="location+text",
                 hovertemplate=hovertemp,             
@@ -1151,6 +1161,69 @@ def create_map_geomap(df, geojson, series, zoom, center, selected_map_location,
      
     return fig
 
+
+def get_geomap_settings(settings_json, settings_mapstyle, settings_colorpalette, settings_colorpalette_reverse):
+    # turn the settings dcc stores into what create_map_geomap needs: geometry (border resolution), mapbox style, colour palette and reverse flag
+
+    # border resolution
+    if settings_json is None: geometry = GEOMETRY_RESOLUTIONS[0]
+    else: geometry = GEOMETRY_RESOLUTIONS[int(settings_json)]
+    
+    # map type
+    if settings_mapstyle is None: mapstyle = mapbox_style[1] #default cartoposition        
+    else: mapstyle = mapbox_style[int(settings_mapstyle)]        
+        
+    # colour pallette    
+    if settings_colorpalette is None: colorbarstyle = geomap_colorscale[INIT_COLOR_PALETTE] #39 inferno,  #55 plasma 
+    else:
+        if int(settings_colorpalette) == 0: colorbarstyle = None #this is the only way to get the mapboxchoroplethmap to default to automatic colouring
+        else: colorbarstyle = geomap_colorscale[int(settings_colorpalette)]        
+    if settings_colorpalette_reverse is None: settings_colorpalette_reverse = INIT_COLOR_PALETTE_REVERSE #i.e. set to default if nothing returned from store
+    
+    return geometry, mapstyle, colorbarstyle, settings_colorpalette_reverse
+
+
+def get_geomap_state(series, year, year_slider_marks, geometry, zoom, center, mapstyle, colorbarstyle, colorpalette_reverse):
+    # Everything the browser needs to draw the geomap (see js_callback_clientside_year_scrub): the figure, the year, the year slider marks,
+    # the resolved colorscale (for the globe and jigsaw) and, for numeric series, every year of the series so the year slider can redraw it in the browser
+    
+    if series == None: df = None
+    else: df = d.get_pop_slice(pop, pop_index, series, int(year)).sort_values('country')
+    
+    fig = create_map_geomap(df, geometry, series, zoom, center, "none", mapstyle, colorbarstyle, colorpalette_reverse)
+    
+    frames = None
+    if CLIENTSIDE_YEAR_SCRUB and series != None and master_config[series].get("var_type") != "discrete":
+        frames = d.build_year_frames(pop, pop_index, year_catalogue, series)
+        frames["path"] = api_dict_raw_to_label[series]
+        frames["hovertemplates"] = [GEOMAP_HOVERTEMPLATE, GEOMAP_HOVERTEMPLATE_LARGE]
+    
+    return {"figure": fig, "year": year, "marks": year_slider_marks, "colorscale": get_geomap_colorscale(fig), "frames": frames}
+
+
+def get_geomap_view(map_view):
+    # zoom and centre of the geomap from the my-map-view store (kept up to date in the browser, see js_callback_clientside_mapview)
+    if map_view == None: map_view = {}
+    zoom = map_view.get("zoom", INIT_ZOOM)
+    center = map_view.get("center", {"lat": INIT_LATITUDE, "lon": INIT_LONGITUDE})
+    return zoom, center
+
+
+def get_geomap_colorscale(fig):
+    # The resolved colorscale of the first geomap trace e.g. [[0.0, '#000004'], ...] (not reversed), for the my-map-colorscale store.
+    # The globe and jigsaw colour themselves to match the map from this, instead of uploading the whole map figure to read it.
+    if len(fig.data) == 0 or fig.data[0].colorscale == None: return None
+    return [list(c) for c in fig.data[0].colorscale]
+
+
+def get_sunburst_colorscale(colorbar_style, colorbar_reverse):
+    #Fashion sunburst colour input as a string in the form "blue" or "blue_r" for reverse (defaults if no dcc store states)
+    if colorbar_style == None: colorbar_style = INIT_COLOR_PALETTE        
+    if colorbar_reverse == None: colorbar_reverse = INIT_COLOR_PALETTE_REVERSE
+    if colorbar_reverse == False: return geomap_colorscale[int(colorbar_style)]
+    else: return geomap_colorscale[int(colorbar_style)]+"_r"
+
+
 def create_dash_layout(app):
 
     #CONSTRUCT DASH LAYOUT
@@ -1158,8 +1231,9 @@ def create_dash_layout(app):
     # Header
     header = create_dash_layout_header()
     
-    # Navigation menu    
-    navbar = create_dash_layout_navbar()    
+    # Navigation menu (category headers only, the dataset items are fetched when a category is first opened, see get_navbar_items)
+    with sp.phase("dash: build navbar"):
+        navbar = create_dash_layout_navbar()
     
     # Body (i.e. the map centrepiece, with loaders to overlay ontop)
     body = create_dash_layout_body()     
@@ -1177,6 +1251,12 @@ def create_dash_layout(app):
     js_callback_clientside_blur(app)
     js_callback_clientside_share(app)
     js_callback_clientside_viewport(app) 
+    js_callback_clientside_mapview(app)
+    js_callback_clientside_year_slider(app)
+    js_callback_clientside_year_scrub(app)
+    js_callback_clientside_navfooter(app)
+    js_callback_clientside_navbar(app)
+    js_callback_clientside_modal_content(app)
 
     # enable pathname API queries
     api = dcc.Location(id='url', refresh=False) 
@@ -1187,6 +1267,40 @@ def create_dash_layout(app):
     return app
 
 
+def js_callback_clientside_navbar(dash_app):
+
+        # A navbar category asks the server for its items on the first click only (clicks on items bubble up to the same div, so later ones are ignored here)
+        dash_app.clientside_callback(
+            """
+            function(n_clicks) {
+                if (n_clicks == 1) return true;
+                return window.dash_clientside.no_update;
+            }
+            """,
+            Output({"type": "navcat-request", "index": MATCH}, 'data'),
+            Input({"type": "navcat-toggle", "index": MATCH}, 'n_clicks'),
+            prevent_initial_call=True
+        )
+
+
+def js_callback_clientside_modal_content(dash_app):
+
+        # Each modal asks the server for its static content the first time it opens (see create_dash_layout_modal_content and callback_modal_content)
+        for modal in MODAL_IDS:
+            dash_app.clientside_callback(
+                """
+                function(is_open, requested) {
+                    if (is_open && !requested) return true;
+                    return window.dash_clientside.no_update;
+                }
+                """,
+                Output({"type": "modal-request", "modal": modal}, 'data'),
+                Input(MODAL_IDS[modal], 'is_open'),
+                State({"type": "modal-request", "modal": modal}, 'data'),
+                prevent_initial_call=True
+            )
+
+
 def js_callback_clientside_blur(dash_app):
 
         #Special client side callback that removes unwanted focus on buttons that trigger modals (for hiding tooltip) using embedded javascript function
@@ -1269,6 +1383,200 @@ def js_callback_clientside_viewport(dash_app):
     return
 
 
+def js_callback_clientside_mapview(dash_app):
+    # Track the geomap zoom/centre in a small store, in the browser, every time the user pans or zooms.
+    # The main callback reads this rather than taking the whole geomap figure (geojson and all) as State.
+    dash_app.clientside_callback(        
+                
+        """
+        function(relayout, view) {
+            if (!relayout || (relayout['mapbox.zoom'] === undefined && relayout['mapbox.center'] === undefined)) {
+                return window.dash_clientside.no_update;
+            }
+            view = Object.assign({}, view);
+            if (relayout['mapbox.zoom'] !== undefined) view['zoom'] = relayout['mapbox.zoom'];
+            if (relayout['mapbox.center'] !== undefined) view['center'] = relayout['mapbox.center'];
+            return view;
+        }
+        """,
+        Output('my-map-view', 'data'),               
+        Input('geomap_figure', 'relayoutData'),
+        State('my-map-view', 'data'),
+        prevent_initial_call=True
+    )
+    return
+
+
+def js_callback_clientside_year_slider(dash_app):
+    # Year slider moved. If the current series came with all its years (frames in the latest geomap state) the map is redrawn in the browser
+    # by js_callback_clientside_year_scrub, so do nothing. Otherwise (discrete series, or scrubbing switched off) trigger callback_main_redraw.
+    dash_app.clientside_callback(        
+                
+        """
+        function(year_index, state, redraw, state_time, redraw_time) {
+            if ((redraw_time || -1) > (state_time || -1)) state = redraw;
+            if (state && state.frames) return window.dash_clientside.no_update;
+            return 'dummy';
+        }
+        """,
+        Output('timeslider-hidden-div', 'children'),               
+        Input('year-slider', 'value'),
+        State('my-geomap-state', 'data'),
+        State('my-geomap-redraw', 'data'),
+        State('my-geomap-state', 'modified_timestamp'),
+        State('my-geomap-redraw', 'modified_timestamp'),
+        prevent_initial_call=True
+    )
+    return
+
+
+def js_callback_clientside_year_scrub(dash_app):
+    # The only writer of the geomap figure, selected year, year in the title, the bold slider mark and the map colorscale store.
+    # The main callback (new series) and callback_main_redraw (year without frames, or settings applied) send these as a geomap state
+    # (with the frames of every year for numeric series, see d.build_year_frames). New state from the server is shown as is.
+    # A year slider move with frames swaps the trace data of the latest state in the browser (no server request),
+    # keeping the current zoom/centre from my-map-view, and passes the new url on (my-url-scrub-callback).
+    dash_app.clientside_callback(        
+                
+        """
+        function(state, redraw, year_index, state_time, redraw_time, view, root) {
+            var no_update = window.dash_clientside.no_update;
+            var triggered = window.dash_clientside.callback_context.triggered.map(function(t) { return t.prop_id; });
+            
+            if (triggered.indexOf('my-geomap-state.data') < 0) {
+                if (triggered.indexOf('my-geomap-redraw.data') >= 0 || (redraw_time || -1) > (state_time || -1)) state = redraw;
+            }
+            if (!state) return [no_update, no_update, no_update, no_update, no_update, no_update];
+            
+            if (triggered.indexOf('my-geomap-state.data') >= 0 || triggered.indexOf('my-geomap-redraw.data') >= 0) {
+                return [state.figure, state.year, ' in ' + state.year, state.marks, state.colorscale, no_update];
+            }
+            
+            var frames = state.frames;
+            if (!frames || !frames.frames[year_index]) return [no_update, no_update, no_update, no_update, no_update, no_update];
+            var frame = frames.frames[year_index];
+            var year = frames.years[year_index];
+            
+            var trace = Object.assign({}, state.figure.data[0]);
+            trace.locations = frame.i.map(function(i) { return frames.locations[i]; });
+            trace.customdata = frame.i.map(function(i) { return frames.names[i]; });
+            trace.text = frame.v;
+            trace.z = frame.v.map(function(v) { return v === null ? null : Math.log10(v); });
+            trace.hovertemplate = frame.large ? frames.hovertemplates[1] : frames.hovertemplates[0];
+            
+            var layout = Object.assign({}, state.figure.layout);
+            if (view) layout.mapbox = Object.assign({}, layout.mapbox, view);
+            
+            var marks = {};
+            Object.keys(state.marks).forEach(function(k) {
+                marks[k] = {label: state.marks[k].label, style: Object.assign({}, state.marks[k].style, {fontWeight: k == String(year_index) ? 'bold' : 'normal'})};
+            });
+            
+            var url = root ? root + frames.path + '/' + year + '/map' : no_update;
+            return [Object.assign({}, state.figure, {data: [trace], layout: layout}), year, ' in ' + year, marks, no_update, url];
+        }
+        """,
+        [
+        Output('geomap_figure', 'figure'),
+        Output('my-year', 'data'),
+        Output('my-loader-main-year', 'children'),
+        Output('year-slider', 'marks'),
+        Output('my-map-colorscale', 'data'),
+        Output('my-url-scrub-callback', 'data'),
+        ],
+        [
+        Input('my-geomap-state', 'data'),
+        Input('my-geomap-redraw', 'data'),
+        Input('year-slider', 'value'),
+        ],
+        [
+        State('my-geomap-state', 'modified_timestamp'),
+        State('my-geomap-redraw', 'modified_timestamp'),
+        State('my-map-view', 'data'),
+        State('my-url-root', 'data'),
+        ],
+        prevent_initial_call=True
+    )
+    return
+
+
+def get_navfooter_styles():
+    # the styles of the footer (year slider, source, chart buttons) the browser switches between, see js_callback_clientside_navfooter
+    return {
+        "buttons": {'display': 'block', 'marginLeft': "1vw", 'marginBottom':0, 'opacity':INIT_BUTTON_OPACITY}, #used to hide/display entire button panel
+        "year": {'display': 'block', 'marginBottom':5, 'marginRight':30},
+        "year_discrete": {'display': 'block'},
+        "year_title": {'fontWeight': 'bold', 'color': INIT_year_SLIDER_FONTCOLOR, 'fontSize': INIT_year_TITLE_FONTSIZE, 'align-items': 'center', 'justify-content': 'center','display': 'flex', 'marginBottom':'0.5vmin', 'marginRight':30},
+        "year_title_single": {'fontWeight': 'bold', 'color': INIT_year_SLIDER_FONTCOLOR, 'fontSize': INIT_year_SLIDER_FONTSIZE, 'align-items': 'center', 'justify-content': 'center','display': 'flex', 'marginBottom':'0.5vmin',},
+        "source": {'display': 'inline-block', 'marginBottom':5, 'marginLeft':10, 'marginTop':15, 'paddingRight':50, 'vertical-align':'bottom', 'backgroundColor': 'transparent', 'width':'33%', 'minWidth':INIT_NAVFOOTER_COMPONENT_MINWIDTH},
+        "download": {"marginBottom": 10, 'display': 'inline-block', 'fontSize': INIT_NAVFOOTER_BTN_FONT}, #inline-block is the key to not adding line break!!!
+        "button": {'display': 'inline-block', 'fontSize': INIT_NAVFOOTER_BTN_FONT},
+        "hidden": {'display': 'none'},
+    }
+
+
+def js_callback_clientside_navfooter(dash_app):
+    # Show/hide the footer (year slider, source and chart buttons) in the browser from the flags of the selected series (my-series-meta),
+    # instead of the main callback sending a dozen style dicts back with every response. Discrete series have no bar/line/geobar/sunburst/bubble,
+    # a single year shows as a title instead of the slider, and the experimental datasets have no year at all.
+    dash_app.clientside_callback(        
+                
+        """
+        function(meta, settings_json, series) {
+            var s = NAVFOOTER_STYLES;
+            var triggered = window.dash_clientside.callback_context.triggered.map(function(t) { return t.prop_id; });
+            var yr = s.year, yr_title = s.year_title, title = 'YEAR', source = s.source;
+            var download = s.download, bar = s.button, line = s.button, geobar = s.button, sunburst = s.button, globe = s.button, bubble = s.button;
+            
+            if (triggered.indexOf('my-settings_json_store.data') >= 0) {
+                // settings applied: nothing changes unless there's no dataset on the map, then hide it all
+                if (series) return Array(12).fill(window.dash_clientside.no_update);
+                yr = yr_title = source = download = bar = line = geobar = sunburst = globe = bubble = s.hidden;
+            }
+            else {
+                if (meta.discrete) {
+                    yr = s.year_discrete;
+                    geobar = sunburst = bar = line = bubble = s.hidden;
+                }
+                if (meta.single_year) {
+                    yr = s.hidden;
+                    yr_title = s.year_title_single;
+                    title = 'YEAR: ' + meta.year;
+                }
+                if (meta.experiment) {
+                    yr = s.hidden;
+                    yr_title = s.hidden;
+                }
+            }
+            return [download, bar, line, geobar, sunburst, globe, bubble, s.buttons, yr, source, yr_title, title];
+        }
+        """.replace('NAVFOOTER_STYLES', json.dumps(get_navfooter_styles())),
+        [
+        Output("download-button", "style"),
+        Output("bar-button", "style"),
+        Output("line-button", "style"),
+        Output("geobar-button", "style"),
+        Output("sunburst-button", "style"),
+        Output("globe-button", "style"),
+        Output("bubble-button", "style"),
+        Output('button-panel-style', "style"),
+        Output('year-slider-style', "style"),
+        Output('data-source-style', 'style'),
+        Output("year-slider-title","style"),
+        Output("year-slider-title","children"),
+        ],
+        [
+        Input("my-series-meta", "data"),
+        Input('my-settings_json_store', 'data'),
+        ],
+        [
+        State("my-series", "data"),
+        ],
+        prevent_initial_call=True
+    )
+    return
+
+
 def create_dash_layout_dcc_stores():
     
     dcc_stores = html.Div([
@@ -1307,6 +1615,14 @@ def create_dash_layout_dcc_stores():
         dcc.Store(id="my-url-jigsaw-trigger", storage_type='memory'),
         dcc.Store(id="js-detected-viewport", storage_type='memory'),
         dcc.Store(id="my-experimental-trigger", storage_type='memory'),
+        dcc.Store(id="my-map-view", storage_type='memory'), #geomap zoom and centre
+        dcc.Store(id="my-map-colorscale", storage_type='memory'), #resolved colorscale of the geomap (for globe and jigsaw)
+        dcc.Store(id="my-geomap-state", storage_type='memory'), #geomap figure, year, slider marks and all year frames from the main callback (see js_callback_clientside_year_scrub)
+        dcc.Store(id="my-geomap-redraw", storage_type='memory'), #same, from callback_main_redraw (year change without frames, or settings applied)
+        dcc.Store(id="my-series-meta", storage_type='memory'), #discrete/single year/experiment flags of the selected series (see js_callback_clientside_navfooter)
+        dcc.Store(id="my-url-scrub-callback", storage_type='memory'), #url after a clientside year change
+        dcc.Store(id="my-url-redraw-callback", storage_type='memory'), #url after a server side year change
+        html.Div([dcc.Store(id={"type": "modal-request", "modal": modal}, storage_type='memory') for modal in MODAL_IDS]), #set once per modal on first open (see js_callback_clientside_modal_content)
 
         ]) 
     return dcc_stores
@@ -1314,7 +1630,7 @@ def create_dash_layout_dcc_stores():
 
 def create_dash_hidden_div_triggers():
     triggers = html.Div([
-        html.Div("Test div", id="timeslider-hidden-div", style={"display":"none"}), #CRITICAL. Hidden div for triggering main callback from secondary time-slider callback.
+        html.Div("Test div", id="timeslider-hidden-div", style={"display":"none"}), #CRITICAL. Hidden div for triggering the map redraw (callback_main_redraw) from the clientside year slider callback.
         html.Div("Test div", id="settings-hidden-div", style={"display":"none"}), #CRITICAL. Hidden div for triggering main callback from settings modal updates
         html.Div("Test div", id="blur-hidden-div", style={"display":"none"}),
         html.Div("Test div", id="blur-hidden-div-menu", style={"display":"none"}),
@@ -1354,7 +1670,7 @@ def create_dash_layout_header():
                 dcc.Loading(
                 type=INIT_LOADER_TYPE,
                 color=INIT_LOADER_DATASET_COLOR, #hex colour close match to nav bar ##515A5A
-                children=html.Span("No data selected", id="my-loader-main", style={"marginBottom": 0, "marginTop": 10, "marginLeft": 0, 'textAlign': 'center', 'fontSize': INIT_SELECTION_H, 'fontFamily': 'Helvetica', 'fontWeight': '', 'backgroundColor': INIT_TITLE_BG_COL, 'opacity': INIT_TITLE_OPACITY  },), #style of span
+                children=html.Span([html.Span("No data selected", id="my-loader-main"), html.Span(id="my-loader-main-year")], style={"marginBottom": 0, "marginTop": 10, "marginLeft": 0, 'textAlign': 'center', 'fontSize': INIT_SELECTION_H, 'fontFamily': 'Helvetica', 'fontWeight': '', 'backgroundColor': INIT_TITLE_BG_COL, 'opacity': INIT_TITLE_OPACITY  },), #style of span (series label from the main callback, year from the clientside year scrubber)
                 style={'textAlign': 'center' } #style of loader
                 ),style={'textAlign': 'center', 'marginTop':10, 'marginBottom':10, 'color': INIT_TITLE_COL}, #style of div
     )
@@ -1444,92 +1760,67 @@ def create_dash_layout_navbar():
 def create_dash_layout_navbar_items(nav_cat):
     
     #build dropdown menu items for all instances of the nav_cat from master config
-    #This is pretty inefficient but the logic is super hard, so I haven't wanted to fuck with it
-    #dataframes are built from the robust dictionary in master config, and so changes to master config csv should not be breaking
+    #datasets are grouped by nest in master config order ('root' items go straight in the menu, any other nest becomes a submenu)
         
     #blank list for returning
     items = []       
     
-    # build df from master config using all datasets ids
-    config_list = []
+    # group this category's datasets (id, label) by nest, nests kept in order of first appearance
+    nests = {}
     for key in master_config_key_datasetid:
-        config_list.append(master_config_key_datasetid[key]) #should be whole dict
-    
-    # convert list to df
-    df_test= pd.DataFrame(config_list)
+        config = master_config_key_datasetid[key]
+        if config.get("nav_cat") == nav_cat: nests.setdefault(config.get("nav_cat_nest"), []).append((config.get("dataset_id"), config.get("dataset_label")))
     
-    # subset and reorganise cols to match structure needed for this patch 0 dataset id 1 dataset raw 2 dataset label
-    df_test = df_test[['dataset_id', 'dataset_raw', 'dataset_label', 'nav_cat', 'nav_cat_nest']]
+    logger.info("Creating %r nav items for category: %r", sum(len(nests[nest]) for nest in nests), nav_cat)  
     
-    # cast dataset id col to string (needed for callback creation)
-    df_test['dataset_id'] = df_test['dataset_id'].astype(str)        
-    
-    # subset dataframe
-    df = df_test[df_test['nav_cat']==nav_cat]
-            
-    #extract list of unique nesting cats
-    nests = pd.unique(df['nav_cat_nest'])
-    
-    logger.info("Creating %r nav items for category: %r",len(df), nav_cat)  
-    
-    # case all root nesting, simply add items
-    if len(nests) == 1 and nests[0] == 'root':
-        #print("all roots baby")    
-    
-        #for each occurance in the category, add a dropdownmenu item and id based (ultimately) on master config
-        for i in range(0,len(df)):    
-                items.append(
-                    dbc.DropdownMenuItem(
-                        children=df.iloc[i][2], #dataset_label
-                        id=df.iloc[i][0], #dataset_id        
-                        #style={'marginTop':0, 'marginBottom':0},
-                        ))
-                
-    # add nesting
-    else:
-        #print("not all roots")        
-        
-        #loop through categories and nest if needed
-        for i in range(0,len(nests)):            
-            if nests[i] == 'root':
-                #subsample this nav_cat just to root items and add items menu
-                r = df[df['nav_cat_nest']=='root'] 
-                for j in range(0,len(r)):    
-                    items.append(
-                        dbc.DropdownMenuItem(
-                            children=r.iloc[j][2], #dataset_label
-                            id=r.iloc[j][0] #dataset_id        
-                            ))
+    for nest in nests:
+        if nest == 'root':
+            #root items go straight in the menu
+            items.extend(create_dash_layout_navbar_items_nests(nests[nest]))
                
-            #for anything not root, add nests
-            else:
-                #for each unique nest in this category, add a new submenu and populate
-                items.append(
-                    dbc.DropdownMenu(
-                        label=nests[i],
-                        direction='left',
-                        toggle_style={'color':'grey', 'backgroundColor':'white', 'border': '0px', 'fontSize': INIT_NAVBAR_FONT_H, "marginBottom": 0, "marginTop": 0, "marginLeft": INIT_DROPDOWNITEM_LPAD, "marginRight": INIT_DROPDOWNITEM_RPAD,}, 
-                        children=create_dash_layout_navbar_items_nests(nests[i], df),  
-                    )
-                )          
+        #for anything not root, add a new submenu and populate
+        else:
+            items.append(
+                dbc.DropdownMenu(
+                    label=nest,
+                    direction='left',
+                    toggle_style={'color':'grey', 'backgroundColor':'white', 'border': '0px', 'fontSize': INIT_NAVBAR_FONT_H, "marginBottom": 0, "marginTop": 0, "marginLeft": INIT_DROPDOWNITEM_LPAD, "marginRight": INIT_DROPDOWNITEM_RPAD,}, 
+                    children=create_dash_layout_navbar_items_nests(nests[nest]),  
+                )
+            )          
     
     return items
 
 
-def create_dash_layout_navbar_items_nests(nest, df):
-    #df is just for one particular nav_cat. Loop through and add any items to list
+def create_dash_layout_navbar_items_nests(datasets):
+    #one dropdown menu item per (dataset_id, dataset_label)
     items = []
-    r = df[df['nav_cat_nest']==nest] 
-    for j in range(0,len(r)):    
+    for dataset_id, dataset_label in datasets:    
         items.append(
             dbc.DropdownMenuItem(                
-                children=r.iloc[j][2], #dataset_label
-                id=r.iloc[j][0] #dataset_id        
+                children=dataset_label,
+                id=get_navbar_item_id(dataset_id)
                 ))    
     
     return items
 
 
+def get_navbar_items(nav_cat):
+    # dataset items for a navbar category, built the first time anyone opens it and then kept for the life of the worker.
+    # Keyed by data version (STATE_VERSION) as well, so this never serves items built from other data.
+    key = (STATE_VERSION, nav_cat)
+    if key not in navbar_items_cache: navbar_items_cache[key] = create_dash_layout_navbar_items(nav_cat)
+    return navbar_items_cache[key]
+
+
+navbar_items_cache = {}
+
+
+def get_navbar_item_id(dataset_id):
+    # pattern matching id of a navbar dataset item. The main callback listens to all of them with one Input({"type": "dataset", "id": ALL}, ...)
+    return {"type": "dataset", "id": int(dataset_id)}
+
+
 def create_dash_layout_navbar_menu():    
     
     #construct the entire navbar menu recursively based on master config. Can return a list of dropdown menus, each with children (items) built recursively aswell
@@ -1557,13 +1848,19 @@ def create_dash_layout_navbar_menu():
         #extract colour for menuitem                    
         colour = nav_cats[i].get("colour")
         
-        #add items to this menu list
+        #add the menu header only, wrapped in a div that counts clicks. The first click fetches the items (see js_callback_clientside_navbar and callback_navbar_items)
         menu_list.append(
-            dbc.DropdownMenu(
-                children=create_dash_layout_navbar_items(nav_cats[i].get("nav_cat")),                
-                bs_size="sm",
-                label=nav_cats[i].get("nav_cat"), 
-                toggle_style={"display":display, "color": colour, 'backgroundColor':'#3E3F3A', 'border': '0px', 'fontSize': INIT_NAVBAR_FONT_H, "marginBottom": 0, "marginTop": 0, "marginLeft": INIT_DROPDOWNITEM_LPAD, "marginRight": INIT_DROPDOWNITEM_RPAD,},               
+            html.Div([
+                dbc.DropdownMenu(
+                    children=[dbc.DropdownMenuItem("Loading...", disabled=True)],                
+                    id={"type": "navcat-menu", "index": nav_cats[i].get("nav_cat")},
+                    bs_size="sm",
+                    label=nav_cats[i].get("nav_cat"), 
+                    toggle_style={"display":display, "color": colour, 'backgroundColor':'#3E3F3A', 'border': '0px', 'fontSize': INIT_NAVBAR_FONT_H, "marginBottom": 0, "marginTop": 0, "marginLeft": INIT_DROPDOWNITEM_LPAD, "marginRight": INIT_DROPDOWNITEM_RPAD,},               
+                ),
+                dcc.Store(id={"type": "navcat-request", "index": nav_cats[i].get("nav_cat")}),
+                ],
+                id={"type": "navcat-toggle", "index": nav_cats[i].get("nav_cat")},
             ))
             
     
@@ -1678,12 +1975,28 @@ def create_dash_layout_body():
     
 
 
+def create_dash_layout_modal_content(modal, part):
+    # placeholder for the static content of a modal (text, images, video), filled from MODAL_CONTENT the first time the modal opens.
+    # Anything a callback reads or writes stays in the layout proper: dash won't run a callback while some of its components are missing
+    return html.Div(id={"type": "modal-content", "modal": modal, "part": part})
+
+
+def get_modal_content(modal, part):
+    # built the first time anyone opens the modal and then kept for the life of the worker
+    key = (modal, part)
+    if key not in modal_content_cache: modal_content_cache[key] = MODAL_CONTENT[modal][part]()
+    return modal_content_cache[key]
+
+
+modal_content_cache = {}
+
+
 def create_dash_layout_about_modal():    
        
     m = dbc.Modal(
             [
                 dbc.ModalHeader(html.Div("This site is a front-end to thousands of datasets.", style={"fontFamily":INIT_MODAL_HEADER_FONT_GENERAL, "fontSize": INIT_MODAL_HEADER_FONT_SIZE, "fontWeight": INIT_MODAL_HEADER_FONT_WEIGHT })),
-                dbc.ModalBody(modal_text.about_modal_body),
+                dbc.ModalBody(create_dash_layout_modal_content("about", "body")),
                 dbc.ModalFooter([
                     dcc.Markdown(""" Built with ![Image](/static/img/heart1.png) in Python using [Dash](https://plotly.com/dash/)."""),
                     dbc.Button("Close", id="modal-about-close", className="ml-auto",size=INIT_BUTTON_SIZE)
@@ -1704,7 +2017,7 @@ def create_dash_layout_userguide_modal():
     m = dbc.Modal(
             [
                 #dbc.ModalHeader(dcc.Markdown(""" # User Guide # """), style={"fontFamily":INIT_MODAL_HEADER_FONT_UGUIDE}),                            
-                dbc.ModalBody(html.Video(id='video', src='/static/img/user_guide.mp4', autoPlay=True, loop=False, controls=True, style={"width": "100%", 'height':"100%", "backgroundColor": 'transparent', "color":'transparent'}  ),), 
+                dbc.ModalBody(create_dash_layout_modal_content("uguide", "video"),),  
                 dbc.ModalFooter([dcc.Markdown(""""""),
                     dbc.Button("Close", id="modal-uguide-close", className="ml-auto",size=INIT_BUTTON_SIZE)]
                 ),                
@@ -1731,8 +2044,7 @@ def create_dash_layout_settings_modal():
                 #dbc.Container([    
         
                     #RESOLUTION
-                    dcc.Markdown(""" #### Border Resolution """, style={"marginTop":'1vw'}),
-                    dcc.Markdown(""" The number of individual points used to draw a line around a region."""),
+                    create_dash_layout_modal_content("settings", "resolution"),
              
                     dbc.Row([
                      
@@ -1768,8 +2080,7 @@ def create_dash_layout_settings_modal():
                 #dbc.Container([
                 html.Div([    
                     #MAP STYLE
-                    dcc.Markdown(""" #### Map Style  """, style={"marginTop":'1vw'}),
-                    dcc.Markdown(""" Choose from the free tile-based map styles courtesy of [MapBox](https://www.mapbox.com/) """),                
+                    create_dash_layout_modal_content("settings", "mapstyle"),
                     
                     #Map style
                     dbc.Row([   
@@ -1851,8 +2162,7 @@ def create_dash_layout_settings_modal():
         html.Div([    
         
                 #COLOUR SCHEME
-                dcc.Markdown(""" #### Colour Scheme  """),
-                modal_text.settings_colour_scheme,
+                create_dash_layout_modal_content("settings", "colorscale"),
                                 
                 #Create colorscale buttons recursively by calling a special function
                 html.Div(children=[create_dash_layout_settings_modal_colorscale_button(i) for i in range(0,93)]),
@@ -1891,15 +2201,34 @@ def create_dash_layout_settings_modal():
     return m
   
 
+def create_dash_layout_settings_modal_text(part):
+    if part == "resolution":
+        return html.Div([
+            dcc.Markdown(""" #### Border Resolution """, style={"marginTop":'1vw'}),
+            dcc.Markdown(""" The number of individual points used to draw a line around a region."""),
+        ])
+    elif part == "mapstyle":
+        return html.Div([
+            dcc.Markdown(""" #### Map Style  """, style={"marginTop":'1vw'}),
+            dcc.Markdown(""" Choose from the free tile-based map styles courtesy of [MapBox](https://www.mapbox.com/) """),
+        ])
+    else:
+        return html.Div([
+            dcc.Markdown(""" #### Colour Scheme  """),
+            modal_text.settings_colour_scheme,
+        ])
+
+
 #construct colorscale button
 def create_dash_layout_settings_modal_colorscale_button(i):
     
     #hide the first 'auto' option as this messes with the ability to get the colorwheel
+    #pattern matching id {"type": "colorscale", "index": i}, so the settings callbacks take all of them as one Input/State/Output (ALL)
     if i == 0:
-        return dbc.Button(children=geomap_colorscale[i], color="light", className="mr-1", id=geomap_colorscale[i], style={'display': 'none'})
+        return dbc.Button(children=geomap_colorscale[i], color="light", className="mr-1", id={"type": "colorscale", "index": i}, style={'display': 'none'})
     
     else:
-        return dbc.Button(children=geomap_colorscale[i], color="light", className="mr-1", id=geomap_colorscale[i], size=INIT_BUTTON_SIZE, style={'marginBottom':3})
+        return dbc.Button(children=geomap_colorscale[i], color="light", className="mr-1", id={"type": "colorscale", "index": i}, size=INIT_BUTTON_SIZE, style={'marginBottom':3})
 
 
 def create_dash_layout_bargraph_modal():
@@ -1979,7 +2308,7 @@ def create_dash_layout_bargraph_modal():
                         dbc.Popover(
                             [
                                 dbc.PopoverHeader("Instructions", style={'fontWeight':'bold'}),
-                                dbc.PopoverBody(hovertip_text.bargraph_instructions),
+                                dbc.PopoverBody(create_dash_layout_modal_content("bar", "instructions")),
                             ],
                             #id="modal-bar-instruction-popover",
                             #is_open=False,
@@ -1993,7 +2322,7 @@ def create_dash_layout_bargraph_modal():
                         dbc.Popover(
                             [
                                 dbc.PopoverHeader("About", style={'fontWeight':'bold'}),
-                                dbc.PopoverBody(hovertip_text.bargraph_about)                                    
+                                dbc.PopoverBody(create_dash_layout_modal_content("bar", "about"))                                    
                             ],
                             #id="modal-bar-guide-popover",
                             #is_open=False,
@@ -2117,7 +2446,7 @@ def create_dash_layout_linegraph_modal():
                     dbc.Popover(
                         [
                             dbc.PopoverHeader("Instructions", style={'fontWeight':'bold'}),
-                            dbc.PopoverBody(hovertip_text.linegraph_instructions)
+                            dbc.PopoverBody(create_dash_layout_modal_content("line", "instructions"))
                         ],
                         #id="modal-line-instructions-popover",
                         #is_open=False,
@@ -2131,7 +2460,7 @@ def create_dash_layout_linegraph_modal():
                     dbc.Popover(
                         [
                             dbc.PopoverHeader("About", style={'fontWeight':'bold'}),
-                            dbc.PopoverBody(hovertip_text.linegraph_about),
+                            dbc.PopoverBody(create_dash_layout_modal_content("line", "about")),
                         ],
                         #id="modal-line-guide-popover",
                         #is_open=False,
@@ -2227,7 +2556,7 @@ def create_dash_layout_globe_modal():
                             dbc.Popover(
                             [
                                 dbc.PopoverHeader("Instructions", style={'fontWeight':'bold'}),
-                                dbc.PopoverBody(hovertip_text.globe_instructions),
+                                dbc.PopoverBody(create_dash_layout_modal_content("globe", "instructions")),
                             ],
                             #id="modal-globe-instructions-popover",
                             #is_open=False,
@@ -2241,7 +2570,7 @@ def create_dash_layout_globe_modal():
                             dbc.Popover(
                                 [
                                     dbc.PopoverHeader("About", style={'fontWeight':'bold'}),
-                                    dbc.PopoverBody(hovertip_text.globe_about),                                    
+                                    dbc.PopoverBody(create_dash_layout_modal_content("globe", "about")),                                    
                                 ],
                                 #id="modal-globe-guide-popover",
                                 #is_open=False,
@@ -2310,7 +2639,7 @@ def create_dash_layout_geobar_modal():
                             dbc.Popover(
                                 [
                                 dbc.PopoverHeader("Instructions", style={'fontWeight':'bold'}),
-                                dbc.PopoverBody(hovertip_text.jigsaw_instructions),
+                                dbc.PopoverBody(create_dash_layout_modal_content("geobar", "instructions")),
                                 ],
                                 #id="modal-geobar-instructions-popover",
                                 #is_open=False,
@@ -2324,7 +2653,7 @@ def create_dash_layout_geobar_modal():
                             dbc.Popover(
                                 [
                                 dbc.PopoverHeader("About", style={'fontWeight':'bold'}),
-                                dbc.PopoverBody(hovertip_text.jigsaw_about),
+                                dbc.PopoverBody(create_dash_layout_modal_content("geobar", "about")),
                                 #dbc.PopoverBody(dcc.Markdown(""" Built with ![Image](media/heart1.png) in Python using [Dash](https://plotly.com/dash/)."""), style={'display':'inline-block'}),
                                 ],
                                 #id="modal-geobar-guide-popover",
@@ -2426,7 +2755,7 @@ def create_dash_layout_sunburst_modal():
                     dbc.Popover(
                         [
                             dbc.PopoverHeader("About", style={'fontWeight':'bold'}),
-                            dbc.PopoverBody(hovertip_text.sunburst_about),
+                            dbc.PopoverBody(create_dash_layout_modal_content("sunburst", "about")),
                         ],
                         #id="modal-sunburst-guide-popover",
                         #is_open=False,
@@ -2440,7 +2769,7 @@ def create_dash_layout_sunburst_modal():
                     dbc.Popover(
                         [
                             dbc.PopoverHeader("Instructions", style={'fontWeight':'bold'}),
-                            dbc.PopoverBody(hovertip_text.sunburst_instructions),
+                            dbc.PopoverBody(create_dash_layout_modal_content("sunburst", "instructions")),
                         ],
                         #id="modal-sunburst-instructions-popover",
                         #is_open=False,
@@ -2618,7 +2947,7 @@ def create_dash_layout_bubblegraph_modal():
                     dbc.Popover(
                         [
                             dbc.PopoverHeader("About", style={'fontWeight':'bold'}),
-                            dbc.PopoverBody(hovertip_text.bubblegraph_about),
+                            dbc.PopoverBody(create_dash_layout_modal_content("bubble", "about")),
                         ],
                         #id="modal-bubble-guide-popover",
                         #is_open=False,
@@ -2632,7 +2961,7 @@ def create_dash_layout_bubblegraph_modal():
                     dbc.Popover(
                         [
                             dbc.PopoverHeader("Instructions", style={'fontWeight':'bold'}),
-                            dbc.PopoverBody(hovertip_text.bubblegraph_instructions),
+                            dbc.PopoverBody(create_dash_layout_modal_content("bubble", "instructions")),
                         ],
                         #id="modal-bubble-instructions-popover",
                         #is_open=False,
@@ -2700,17 +3029,7 @@ def create_dash_layout_downloads_modal():
                 
                 dbc.ModalBody([                    
 
-                    dcc.Markdown(""" 
-                        Welcome to a magical place where dreams come true. 
-                        Here you can export larger chunks of data beyond what the other download buttons can do.
-                        For example, you might want all available data just for two regions of the world, or all available data in a given year.
-                        Please be aware the tools below are live-querying the main dataset and preparing a zipped comma-separated-value (CSV) file.                      To minimise file size and query load, I've stripped out source information. 
-                        Please also note you are getting the raw series names as they originally came, and not my curated re-labelled series names.
-                        This area is really intended for advanced users who are comfortable working with datasets larger than 100,000 rows.
-                        
-                        
-                        #### How do you like your data sliced?
-                    """),
+                    create_dash_layout_modal_content("downloads", "intro"),
 
                     dbc.Row([
                         dbc.Card(
@@ -2843,6 +3162,20 @@ def create_dash_layout_downloads_modal():
 
 
 
+def create_dash_layout_downloads_modal_intro():
+    return dcc.Markdown(""" 
+        Welcome to a magical place where dreams come true. 
+        Here you can export larger chunks of data beyond what the other download buttons can do.
+        For example, you might want all available data just for two regions of the world, or all available data in a given year.
+        Please be aware the tools below are live-querying the main dataset and preparing a zipped comma-separated-value (CSV) file.                      To minimise file size and query load, I've stripped out source information. 
+        Please also note you are getting the raw series names as they originally came, and not my curated re-labelled series names.
+        This area is really intended for advanced users who are comfortable working with datasets larger than 100,000 rows.
+        
+        
+        #### How do you like your data sliced?
+    """)
+
+
 def create_dash_layout_experiments_modal():
     m = dbc.Modal(
             [
@@ -2869,6 +3202,24 @@ def create_dash_layout_experiments_modal():
 
 
 
+# modal > dbc.Modal id, and modal > part > builder for its static content (see create_dash_layout_modal_content)
+MODAL_IDS = {"about": "dbc-modal-about", "uguide": "dbc-modal-uguide", "settings": "dbc-modal-settings", "downloads": "dbc-modal-download-land",
+             "bar": "dbc-modal-bar", "line": "dbc-modal-line", "bubble": "dbc-modal-bubble", "sunburst": "dbc-modal-sunburst", "globe": "dbc-modal-globe", "geobar": "dbc-modal-geobar"}
+
+MODAL_CONTENT = {
+    "about": {"body": lambda: modal_text.about_modal_body},
+    "uguide": {"video": lambda: html.Video(id='video', src='/static/img/user_guide.mp4', autoPlay=True, loop=False, controls=True, style={"width": "100%", 'height':"100%", "backgroundColor": 'transparent', "color":'transparent'})},
+    "settings": {"resolution": lambda: create_dash_layout_settings_modal_text("resolution"), "mapstyle": lambda: create_dash_layout_settings_modal_text("mapstyle"), "colorscale": lambda: create_dash_layout_settings_modal_text("colorscale")},
+    "downloads": {"intro": create_dash_layout_downloads_modal_intro},
+    "bar": {"about": lambda: hovertip_text.bargraph_about, "instructions": lambda: hovertip_text.bargraph_instructions},
+    "line": {"about": lambda: hovertip_text.linegraph_about, "instructions": lambda: hovertip_text.linegraph_instructions},
+    "bubble": {"about": lambda: hovertip_text.bubblegraph_about, "instructions": lambda: hovertip_text.bubblegraph_instructions},
+    "sunburst": {"about": lambda: hovertip_text.sunburst_about, "instructions": lambda: hovertip_text.sunburst_instructions},
+    "globe": {"about": lambda: hovertip_text.globe_about, "instructions": lambda: hovertip_text.globe_instructions},
+    "geobar": {"about": lambda: hovertip_text.jigsaw_about, "instructions": lambda: hovertip_text.jigsaw_instructions},
+}
+
+
 def create_dash_layout_nav_footer():
     
     #Builds out the nav footer including all modals
@@ -3121,28 +3472,12 @@ def init_callbacks(dash_app):
 
     #COMPLETE INPUT LIST FOR MAIN CALLBACK
     def callback_main_create_inputs():
-        #this should return the input chain for this callback
+        #this should return the input chain for this callback (dataset selection only, year and settings changes go to callback_main_redraw)
         
         c=[]
         
-        #construct input triggers for timeslider and settings changes   
-        c.append(Input("timeslider-hidden-div", "children"))
-        #c.append(Input('geomap_figure', 'clickData'))
-        c.append(Input('my-settings_json_store', 'data')) #these act purely as triggers after apply button pushed (like the hidden div), to call the main callback
-        c.append(Input('my-settings_mapstyle_store', 'data')) #these act purely as triggers after apply button pushed (like the hidden div), to call the main callback
-              
-        # Don't fuck with this. Some odd parsing going on. Need to cast df to string and then back to numpy.Dash parser issue.
-                
-        # get all dataset ids from master config
-        keysList = list(master_config_key_datasetid.keys())        
-        df = pd.DataFrame(keysList, columns=['dataset_id'])
-        df['dataset_id'] = df['dataset_id'].astype(str)
-        ids=df['dataset_id'].to_numpy()     #critical   
-               
-        #recursively add input ids for all datasets in dataset_lkup
-        for i in range(0,len(ids)):         
-            c.append(Input(ids[i],"n_clicks"))                        
-        #print(c)
+        #every dataset item in the navbar (one pattern matching input, see get_navbar_item_id)
+        c.append(Input({"type": "dataset", "id": ALL}, "n_clicks"))
         
         #add random button
         c.append(Input('random-button', "n_clicks"))
@@ -3156,47 +3491,34 @@ def init_callbacks(dash_app):
         return c
 
 
-    #Main callback for handling dataset selection change
+    #Main callback for handling dataset selection change. Everything that depends on the series is returned here, the
+    #footer styles are set in the browser from my-series-meta (js_callback_clientside_navfooter) and the map is drawn from my-geomap-state (js_callback_clientside_year_scrub)
     @dash_app.callback(
         [
             Output("my-series","data"),
             Output("my-series-label","data"),
-            Output("geomap_figure", "figure"),
+            Output("my-geomap-state", "data"), #figure, year, slider marks and year frames, drawn by js_callback_clientside_year_scrub
             Output("my-source", "children"),
             Output("my-source-link", "href"),         
-            Output("download-button", "style"), #download button                         
-            Output("bar-button", "style"),
-            Output("line-button", "style"),
-            Output("geobar-button", "style"),
-            Output("sunburst-button", "style"),
-            Output("globe-button", "style"),
-            Output("bubble-button", "style"),        
-            Output('my-year', "data"),
             Output('my-loader-main', "children"), #used to trigger loader. Use null string "" as output
-            Output('button-panel-style', "style"), #used to hide initially
-            Output('year-slider-style', "style"), #used to hide initially
-            Output('data-source-style', 'style'), #used to hide initially         
             Output("year-slider", "max"),         
-            Output("year-slider", "marks"),
-            Output("year-slider", "value"),         
-            Output("year-slider-title","style"),
-            Output("year-slider-title","children"),
+            Output("year-slider", "value"),  
+            Output("my-series-meta", "data"), #discrete/single year/experiment flags for the footer styles
             Output("my-selection-m49", "data"), #NEW, to save the m49 location of the selected map
-            #Output("my-series-data","data"),         
             Output("my-url-main-callback","data"), #to set url in another callback
             Output("my-url-bar-trigger", "data"),  # chain to bar
             Output("my-url-line-trigger", "data"), # chain to line
             Output("my-url-globe-trigger", "data"),# chain to globe
             Output("my-url-jigsaw-trigger", "data"),# chain to globe
             Output("source-popover","children"), #popover with explanatory notes
-            Output("my-experimental-trigger", "data") #trigger for experimental modal  
+            Output("my-experimental-trigger", "data"), #trigger for experimental modal  
         
         ],
         
         callback_main_create_inputs(), #build list of input items programmatically 
         
         [
-            State("geomap_figure", "figure"),
+            State("my-map-view", "data"),
             State("year-slider", "marks"),
             State("year-slider", "max"),
             State("year-slider", "value"),
@@ -3227,13 +3549,12 @@ def init_callbacks(dash_app):
         
         #first check triggers and context 
         ctx = dash.callback_context 
-        selection = ctx.triggered[0]["prop_id"].split(".")[0] #this is the series selection (component id from navbar top), except if the year slider is the trigger!!
+        selection = ctx.triggered[0]["prop_id"].split(".")[0] #this is the series selection (component id from navbar top)
         print("Selection triggered is", selection)
         
         # retrieve dcc component states from states dict
         states = ctx.states
-        zoom = states["geomap_figure.figure"]["layout"]["mapbox"]["zoom"]
-        center = states["geomap_figure.figure"]["layout"]["mapbox"]["center"]
+        zoom, center = get_geomap_view(states["my-map-view.data"])
         series = states["my-series.data"] #this is initially "No data selected"   
         series_label = states["my-series-label.data"] 
         year_slider_marks = states["year-slider.marks"]
@@ -3244,61 +3565,21 @@ def init_callbacks(dash_app):
         settings_mapstyle = states['my-settings_mapstyle_store.data']
         settings_colorpalette = states['my-settings_colorbar_store.data']
         settings_colorpalette_reverse = states['my-settings_colorbar_reverse_store.data']
-        selection_m49 = states['my-selection-m49.data'] #Map selection state (For later feature)        
+        selection_m49 = no_update #Map selection state (For later feature)        
         search_query = states['my-url-path.data']              #api
-        #maptrigger = states['my-url-map-trigger.data']  #api signal
-        #url_view = states['my-url-view.data']  #api
-        maptrigger = 'map'
+        maptrigger = no_update #only the url path chains to the other views
         url_view = 'map' #override when necessary
-        url_year = states['my-url-year.data']  #api        
         viewport = states['js-detected-viewport.data'] 
         logger.info('DETECTED VIEWPORT: %r x %r',viewport['width'], viewport['height'])           
         
         # special trigger for experimental data                
         experiment_trigger = "" # trigger for experiments (i.e. the power station globe)
 
-        # load settings data: border 
-        if settings_json is None: geojson = geojson_LOWRES                 
-        else:             
-            if int(settings_json) == 0: geojson = geojson_LOWRES
-            elif int(settings_json)==1: geojson = geojson_MEDRES
-            elif int(settings_json)==2: geojson = geojson_HIRES
+        # load settings data: border, map type, colour pallette
+        geometry, mapstyle, colorbarstyle, settings_colorpalette_reverse = get_geomap_settings(settings_json, settings_mapstyle, settings_colorpalette, settings_colorpalette_reverse)
         
-        # load settings data: map type
-        if settings_mapstyle is None: mapstyle = mapbox_style[1] #default cartoposition        
-        else: mapstyle = mapbox_style[int(settings_mapstyle)]        
-            
-        # load settings data: colour pallette    
-        if settings_colorpalette is None: colorbarstyle = geomap_colorscale[INIT_COLOR_PALETTE] #39 inferno,  #55 plasma 
-        else:
-            if int(settings_colorpalette) == 0: colorbarstyle = None #this is the only way to get the mapboxchoroplethmap to default to automatic colouring
-            else: colorbarstyle = geomap_colorscale[int(settings_colorpalette)]        
-        if settings_colorpalette_reverse is None: settings_colorpalette_reverse = INIT_COLOR_PALETTE_REVERSE #i.e. set to default if nothing returned from store
-        
-        selected_map_location = "none" #default (used in map selection, still in dev!!)  
-        
-        # set display defaults (these are tuned later in logic)
-        navbtm_btns_style = {'display': 'block', 'marginLeft': "1vw", 'marginBottom':0, 'opacity':INIT_BUTTON_OPACITY} #used to hide/display entire button panel
-        navbtm_yr_style = {'display': 'block', 'marginBottom':5, 'marginRight':30} #display
-        navtm_yr_title_style = {'fontWeight': 'bold', 'color': INIT_year_SLIDER_FONTCOLOR, 'fontSize': INIT_year_TITLE_FONTSIZE, 'align-items': 'center', 'justify-content': 'center','display': 'flex', 'marginBottom':'0.5vmin', 'marginRight':30}
-        navbtm_source_style = {'display': 'inline-block', 'marginBottom':5, 'marginLeft':10, 'marginTop':15, 'paddingRight':50, 'vertical-align':'bottom', 'backgroundColor': 'transparent', 'width':'33%', 'minWidth':INIT_NAVFOOTER_COMPONENT_MINWIDTH} #display source     
-        download_btn_style = {"marginBottom": 10, 'display': 'inline-block', 'fontSize': INIT_NAVFOOTER_BTN_FONT} #inline-block is the key to not adding line break!!!
-        bar_btn_style = {'display': 'inline-block', 'fontSize': INIT_NAVFOOTER_BTN_FONT} #display!
-        line_btn_style = {'display': 'inline-block', 'fontSize': INIT_NAVFOOTER_BTN_FONT} #display!
-        geobar_btn_style = {'display': 'inline-block', 'fontSize': INIT_NAVFOOTER_BTN_FONT} #display!
-        sunburst_btn_style = { 'display': 'inline-block', 'fontSize': INIT_NAVFOOTER_BTN_FONT} #display!
-        globe_btn_style = { 'display': 'inline-block', 'fontSize': INIT_NAVFOOTER_BTN_FONT} #display!
-        bubble_btn_style = { 'display': 'inline-block', 'fontSize': INIT_NAVFOOTER_BTN_FONT} #display!
-        
-        #setup source for normal operation
-        if series == None:
-            source = "No data selected"
-            link = ""
-            year=""
-        else:            
-            source = master_config[series].get("source") 
-            link = master_config[series].get("link")    
-            year = int(d.get_years(pop.loc[(pop['dataset_raw'] == series)])[year_slider_selected]) #expensive            
+        year = ""
+        if series != None and len(d.get_years(year_catalogue, series)) > 0: year = int(d.get_years(year_catalogue, series)[year_slider_selected])            
             
         
         #MAIN CALLBACK LOGIC pt1 (Determine what the event was)
@@ -3314,29 +3595,6 @@ def init_callbacks(dash_app):
             #return series, create_map_geomap(pop, geojson, series, years[year], zoom, center, selected_map_location), d.get_source(logger, pop, series, years[year]), "https://www.google.com"
             #This still needs work
         
-        #year SLIDER CHANGE
-        elif selection == "timeslider-hidden-div":  
-            # reset fonts
-            for i in range(0,len(year_slider_marks)):
-                year_slider_marks[str(i)]['style']['fontWeight']='normal'     
-            year_slider_marks[str(year_slider_selected)]['style']['fontWeight']='bold'
-            
-            
-        #SETTINGS CHANGE
-        elif selection == "my-settings_json_store":   
-            #Check if there is a dataset and hide source, slider and buttons if not
-            if series == None:
-                navbtm_yr_style = {'display': 'none'}
-                navtm_yr_title_style = {'fontWeight': 'bold', 'color': INIT_year_SLIDER_FONTCOLOR, 'fontSize': INIT_year_SLIDER_FONTSIZE, 'align-items': 'center', 'justify-content': 'center','display': 'none', 'marginBottom':'0.5vmin',}
-                navbtm_source_style = {'display': 'none'}            
-                download_btn_style = {'display': 'none'}
-                bar_btn_style = {'display': 'none'}
-                line_btn_style = {'display': 'none'}
-                geobar_btn_style = {'display': 'none'}
-                sunburst_btn_style = {'display': 'none'}
-                globe_btn_style = {'display': 'none'}
-                bubble_btn_style = {'display': 'none'}
-        
         # URL PATH SEARCH
         elif selection == "my-url-map-trigger":
             
@@ -3371,23 +3629,21 @@ def init_callbacks(dash_app):
             # special condition if coming from non-specific year modal
             if year != 'x':            
                 # Check to see if year is in dataset for this series                
-                year_check = d.check_year(pop, series, year) #expensive
+                year_check = d.check_year(year_catalogue, series, year)
                 if year_check == False:
                     print("year not found in dataset, breaking out of callback")
                     raise PreventUpdate()       
             else:
                 # grab years and auto select most recent
-                year_dict = d.get_years(pop.loc[(pop['dataset_raw'] == series)])
+                year_dict = d.get_years(year_catalogue, series)
                 year_index = list(year_dict)[-1]
                 year = year_dict[year_index] 
                 
             # update all vars        
             series_label = master_config[series].get("dataset_label")  
-            source = master_config[series].get("source") 
-            link = master_config[series].get("link")    
-            year_slider_marks = d.get_year_slider_marks(series, pop, INIT_year_SLIDER_FONTSIZE, INIT_year_SLIDER_FONTCOLOR, year_slider_selected)
+            year_slider_marks = d.get_year_slider_marks(year_catalogue, series)
             year_slider_max = len(year_slider_marks)-1                        
-            year_slider_selected = d.get_year_slider_index(pop, series, year)
+            year_slider_selected = d.get_year_slider_index(year_catalogue, series, year)
             year_slider_marks[year_slider_selected]['style']['fontWeight']='bold' #mark selected year bold          
         
         
@@ -3399,8 +3655,9 @@ def init_callbacks(dash_app):
             # first check if search menu input, and override series variable if so
             if selection == 'nav-search-menu':            
                 
-                # if we have a value, update the series
-                if search_menu != None and search_menu != '': series = search_menu
+                # if we have a value, update the series (the box is also reset after every selection, see callback_clear_search_menu_helper)
+                if search_menu in master_config: series = search_menu
+                else: raise PreventUpdate()
             
             # next check for random button
             elif selection == 'random-button':            
@@ -3408,87 +3665,64 @@ def init_callbacks(dash_app):
                         
             # it must be from dropdown items
             else:
-                #get series from master config dictionary (using the dataset id integer number as the key)                            
-                series = master_config_key_datasetid[int(selection)].get("dataset_raw")
+                # items added to the layout when a category is first opened (not clicked yet)
+                if ctx.triggered[0]["value"] == None: raise PreventUpdate()
+                
+                #get series from master config dictionary (using the dataset id integer number as the key, from the triggered navbar item id)                            
+                series = master_config_key_datasetid[json.loads(selection)["id"]].get("dataset_raw")
                 
                 #special check for experimental data selected (global power stations thingy)                
                 if series == "Global power stations of the world": experiment_trigger = "Creme freesh" # to trigger the experimental globe modal
             
             #update all vars
             series_label = master_config[series].get("dataset_label")  
-            source = master_config[series].get("source") 
-            link = master_config[series].get("link")     
-            year_dict = d.get_years(pop.loc[(pop['dataset_raw'] == series)])
+            year_dict = d.get_years(year_catalogue, series)
             
             # it the datasets has data in at least 1 year, set the year slider
             if len(year_dict) > 0:
                 year_index = list(year_dict)[-1]
                 year = year_dict[year_index] #what is returned
-                year_slider_marks = d.get_year_slider_marks(series, pop, INIT_year_SLIDER_FONTSIZE, INIT_year_SLIDER_FONTCOLOR, year_slider_selected)
+                year_slider_marks = d.get_year_slider_marks(year_catalogue, series)
                 year_slider_max = len(year_slider_marks)-1
                 year_slider_selected = year_slider_max #select the most recent year by default
                 year_slider_marks[year_slider_selected]['style']['fontWeight']='bold' #mark selected year bold          
             
         #MAIN CALLBACK LOGIC Pt2 (Get ready to return) 
-                        
-        # Check what datatype is selected and hide buttons not applicable for discrete data   
-        if series != None:       
-                
-            if master_config[series].get("var_type")  == "discrete":
-                print("Main callback: discrete dataset found")            
-                navbtm_yr_style = {'display': 'block'}            
-                geobar_btn_style = {'display': 'none'}
-                sunburst_btn_style = {'display': 'none'}
-                bar_btn_style = {'display': 'none'}
-                line_btn_style = {'display': 'none'}
-                bubble_btn_style = {'display': 'none'}        
-        
-        # If only one year is available, do some custom logic to display year (slider has a bug)
-        if len(year_slider_marks) < 2:
-            navbtm_yr_style = {'display': 'none'} #hid
-            navtm_yr_title_style = {'fontWeight': 'bold', 'color': INIT_year_SLIDER_FONTCOLOR, 'fontSize': INIT_year_SLIDER_FONTSIZE, 'align-items': 'center', 'justify-content': 'center','display': 'flex', 'marginBottom':'0.5vmin',}
-            navbtm_yr_title_val = "YEAR: "+str(year)
-        else:
-            navbtm_yr_title_val = "YEAR"
+        
+        source = master_config[series].get("source") 
+        link = master_config[series].get("link")     
+        
+        # flags for the footer styles (set in the browser, see js_callback_clientside_navfooter)
+        series_meta = {"discrete": master_config[series].get("var_type") == "discrete", "single_year": len(year_slider_marks) < 2, "year": year, "experiment": experiment_trigger == "Creme freesh"}
         
         # set URL path to return
         root_path = states['my-url-root.data']    
         if url_view == "": url_view = 'map'  
-        if series != None: path = api_dict_raw_to_label[series]+"/"+str(year)+'/'+url_view #fix for experimental first load 
-        else: path = ""        
+        path = api_dict_raw_to_label[series]+"/"+str(year)+'/'+url_view #fix for experimental first load 
         url = root_path+path                     
         
         # Update source extra information if relevant
-        if series != None:
-            popover_children = [
-            dbc.PopoverHeader("Explanatory Notes"),            
-            dbc.PopoverBody(master_config[series].get("note")), #WORKING
-            ]
-        else: popover_children = []
+        popover_children = [
+        dbc.PopoverHeader("Explanatory Notes"),            
+        dbc.PopoverBody(master_config[series].get("note")), #WORKING
+        ]
         
         print('SELECTION is ',selection)
         # Finally, check for experimental dataset and reset base map and view if necessary.
         if experiment_trigger == "Creme freesh":
             print('EXPERIMENT FOUND. Series label is',series_label)
             series = None #to ensure empty geomap is built
-            df = None #just so can return without error
-            navbtm_yr_style = {'display': 'none'} #hide
-            navtm_yr_title_style = {'display':'none'}
             year = ''
-
-        else:
-            #subset master dataset to selected series and selected year (used to build new geomap) being careful to avoid experimental datasets      
-            df = pop.loc[(pop['dataset_raw'] == series) & (pop['year'] == int(year))].sort_values('country')   
+        
+        geomap_state = get_geomap_state(series, year, year_slider_marks, geometry, zoom, center, mapstyle, colorbarstyle, settings_colorpalette_reverse)
         
         return \
         series, series_label, \
-        create_map_geomap(df, geojson, series, zoom, center, selected_map_location, mapstyle, colorbarstyle, settings_colorpalette_reverse), \
+        geomap_state, \
         source, link, \
-        download_btn_style, bar_btn_style, line_btn_style, geobar_btn_style, sunburst_btn_style, globe_btn_style, bubble_btn_style, \
-        year, \
-        series_label+" in "+str(year), \
-        navbtm_btns_style, navbtm_yr_style, navbtm_source_style,\
-        year_slider_max, year_slider_marks, year_slider_selected, navtm_yr_title_style, navbtm_yr_title_val, \
+        series_label, \
+        year_slider_max, year_slider_selected, \
+        series_meta, \
         selection_m49, \
         url, \
         maptrigger, maptrigger, maptrigger, maptrigger, \
@@ -3496,6 +3730,54 @@ def init_callbacks(dash_app):
         experiment_trigger
 
 
+    #Redraw the geomap for the current series when the year changes (series without year frames, see js_callback_clientside_year_slider) or the settings are applied.
+    #Only the map (and the url for a year change) changes, so this is all that comes back.
+    @dash_app.callback(
+        [
+            Output("my-geomap-redraw", "data"), #same as my-geomap-state, drawn by js_callback_clientside_year_scrub
+            Output("my-url-redraw-callback", "data"),
+        ],
+        [
+            Input("timeslider-hidden-div", "children"),
+            Input('my-settings_json_store', 'data'), #these act purely as triggers after apply button pushed, to redraw the map
+            Input('my-settings_mapstyle_store', 'data'),
+        ],
+        [
+            State("my-series", "data"),
+            State("year-slider", "marks"),
+            State("year-slider", "value"),
+            State("my-map-view", "data"),
+            State("my-settings_colorbar_store", 'data'),
+            State("my-settings_colorbar_reverse_store", 'data'),
+            State("my-url-root", 'data'),
+        ],
+        prevent_initial_call=True
+    )
+    def callback_main_redraw(timeslider, settings_json, settings_mapstyle, series, year_slider_marks, year_slider_selected, map_view, settings_colorpalette, settings_colorpalette_reverse, root_path):
+        logger.info("MAIN REDRAW CALLBACK")
+        
+        ctx = dash.callback_context 
+        trigger = ctx.triggered[0]["prop_id"].split(".")[0]
+        
+        zoom, center = get_geomap_view(map_view)
+        geometry, mapstyle, colorbarstyle, settings_colorpalette_reverse = get_geomap_settings(settings_json, settings_mapstyle, settings_colorpalette, settings_colorpalette_reverse)
+        
+        #settings applied before a dataset is selected (or after the experimental dataset): empty map
+        if series == None: return get_geomap_state(None, "", year_slider_marks, geometry, zoom, center, mapstyle, colorbarstyle, settings_colorpalette_reverse), no_update
+        
+        year = int(d.get_years(year_catalogue, series)[year_slider_selected])
+        url = no_update
+        
+        #year SLIDER CHANGE
+        if trigger == "timeslider-hidden-div":  
+            # reset fonts
+            for i in range(0,len(year_slider_marks)):
+                year_slider_marks[str(i)]['style']['fontWeight']='normal'     
+            year_slider_marks[str(year_slider_selected)]['style']['fontWeight']='bold'
+            url = root_path+api_dict_raw_to_label[series]+"/"+str(year)+'/map'
+        
+        return get_geomap_state(series, year, year_slider_marks, geometry, zoom, center, mapstyle, colorbarstyle, settings_colorpalette_reverse), url
+
 
     # Receive URL path from variouos inputs
     @dash_app.callback(               
@@ -3509,11 +3791,11 @@ def init_callbacks(dash_app):
                 Input("my-url-line-callback","data"),
                 Input("my-url-globe-callback","data"),
                 Input("my-url-jigsaw-callback","data"),
-                
-                
+                Input("my-url-scrub-callback","data"),
+                Input("my-url-redraw-callback","data"),
                 ],  
                 prevent_initial_call=True)
-    def callback_api_set_URL(url_maincb, url_bar, url_line, url_globe, url_jigsaw):    
+    def callback_api_set_URL(url_maincb, url_bar, url_line, url_globe, url_jigsaw, url_scrub, url_redraw):            
         
         # determine each input trigger, and return the relevant URL    
         ctx = dash.callback_context 
@@ -3526,6 +3808,8 @@ def init_callbacks(dash_app):
         elif trigger == 'my-url-line-callback': return url_line, url_line
         elif trigger == 'my-url-globe-callback': return url_globe, url_line
         elif trigger == 'my-url-jigsaw-callback': return url_jigsaw, url_jigsaw        
+        elif trigger == 'my-url-scrub-callback': return url_scrub, url_scrub
+        elif trigger == 'my-url-redraw-callback': return url_redraw, url_redraw
         
         return None
     
@@ -3646,8 +3930,7 @@ def init_callbacks(dash_app):
         c.append(Output('settingsbtn-mapstyle-stamen-watercolor', "active"))
         
         #Add the coloscale outputs    
-        for i in geomap_colorscale:
-            c.append(Output(i,"active"))
+        c.append(Output({"type": "colorscale", "index": ALL}, "active"))
         
         #Add reverse toggles
         c.append(Output('settingsbtn-reverse-colorscale', "active"))
@@ -3674,9 +3957,7 @@ def init_callbacks(dash_app):
         c.append(Input('settingsbtn-mapstyle-stamen-watercolor', "n_clicks"))    
         c.append(Input("dbc-modal-settings", "is_open")) #bool for understanding if modal has just been opened
         
-        for i in geomap_colorscale:         
-            c.append(Input(i,"n_clicks"))                        
-        #print(c)
+        c.append(Input({"type": "colorscale", "index": ALL}, "n_clicks"))
         
         #Add reverse button
         c.append(Input('settingsbtn-reverse-colorscale', "n_clicks"))
@@ -3705,9 +3986,7 @@ def init_callbacks(dash_app):
         c.append(State("my-settings_colorbar_reverse_store", 'data'))
 
         #Add the coloscale states    
-        for i in geomap_colorscale:
-            c.append(State(i,"active"))
-        #print(c)
+        c.append(State({"type": "colorscale", "index": ALL}, "active"))
         
         #Add reverse button
         c.append(State('settingsbtn-reverse-colorscale', "active"))
@@ -3730,12 +4009,12 @@ def init_callbacks(dash_app):
     def callback_settings(nbtn_low, nbtn_med, nbtn_high, 
                                 nbtn_ms_1, nbtn_ms_2, nbtn_ms_3, nbtn_ms_4, nbtn_ms_5, nbtn_ms_6,
                                 settings_modal_open,
-                                nc1, nc2, nc3, nc4, nc5, nc6, nc7, nc8, nc9, nc10, nc11, nc12, nc13, nc14, nc15, nc16, nc17, nc18, nc19, nc20, nc21, nc22, nc23, nc24, nc25, nc26, nc27, nc28, nc29, nc30, nc31, nc32, nc33, nc34, nc35, nc36, nc37, nc38, nc39, nc40, nc41, nc42, nc43, nc44, nc45, nc46, nc47, nc48, nc49, nc50, nc51, nc52, nc53, nc54, nc55, nc56, nc57, nc58, nc59, nc60, nc61, nc62, nc63, nc64, nc65, nc66, nc67, nc68, nc69, nc70, nc71, nc72, nc73, nc74, nc75, nc76, nc77, nc78, nc79, nc80, nc81, nc82, nc83, nc84, nc85, nc86, nc87, nc88, nc89, nc90, nc91, nc92, nc93, \
+                                colorscale_clicks,
                                 nbtn_reverse, nbtn_normal,
                                 btn_low_active, btn_med_active, btn_high_active,
                                 btn_openstreetmap_active, btn_cartopositron_active, btn_darkmatter_active, btn_stamenterrain_active, btn_stamentoner_active, btn_stamenwatercolor_active,                             
                                 settings_json_store, settings_mapstyle_store, settings_colorbar_store, settings_colorbar_reverse_store,
-                                nc1a, nc2a, nc3a, nc4a, nc5a, nc6a, nc7a, nc8a, nc9a, nc10a, nc11a, nc12a, nc13a, nc14a, nc15a, nc16a, nc17a, nc18a, nc19a, nc20a, nc21a, nc22a, nc23a, nc24a, nc25a, nc26a, nc27a, nc28a, nc29a, nc30a, nc31a, nc32a, nc33a, nc34a, nc35a, nc36a, nc37a, nc38a, nc39a, nc40a, nc41a, nc42a, nc43a, nc44a, nc45a, nc46a, nc47a, nc48a, nc49a, nc50a, nc51a, nc52a, nc53a, nc54a, nc55a, nc56a, nc57a, nc58a, nc59a, nc60a, nc61a, nc62a, nc63a, nc64a, nc65a, nc66a, nc67a, nc68a, nc69a, nc70a, nc71a, nc72a, nc73a, nc74a, nc75a, nc76a, nc77a, nc78a, nc79a, nc80a, nc81a, nc82a, nc83a, nc84a, nc85a, nc86a, nc87a, nc88a, nc89a, nc90a, nc91a, nc92a, nc93a, \
+                                colorscale_active,
                                 btn_reverse_active, btn_normal_active
                                 ):
         
@@ -3967,292 +4246,13 @@ def init_callbacks(dash_app):
         else:
             print("Settings Callback: Input detected for colorpallete, setting active state for palette:",selection)
             
-            #set all to false
-            nc1a=False
-            nc2a=False
-            nc3a=False
-            nc4a=False
-            nc5a=False
-            nc6a=False
-            nc7a=False
-            nc8a=False
-            nc9a=False
-            nc10a=False
-            nc11a=False
-            nc12a=False
-            nc13a=False
-            nc14a=False
-            nc15a=False
-            nc16a=False
-            nc17a=False
-            nc18a=False
-            nc19a=False
-            nc20a=False
-            nc21a=False
-            nc22a=False
-            nc23a=False
-            nc24a=False
-            nc25a=False
-            nc26a=False
-            nc27a=False
-            nc28a=False
-            nc29a=False
-            nc30a=False
-            nc31a=False
-            nc32a=False
-            nc33a=False
-            nc34a=False
-            nc35a=False
-            nc36a=False
-            nc37a=False
-            nc38a=False
-            nc39a=False
-            nc40a=False
-            nc41a=False
-            nc42a=False
-            nc43a=False
-            nc44a=False
-            nc45a=False
-            nc46a=False
-            nc47a=False
-            nc48a=False
-            nc49a=False
-            nc50a=False
-            nc51a=False
-            nc52a=False
-            nc53a=False
-            nc54a=False
-            nc55a=False
-            nc56a=False
-            nc57a=False
-            nc58a=False
-            nc59a=False
-            nc60a=False
-            nc61a=False
-            nc62a=False
-            nc63a=False
-            nc64a=False
-            nc65a=False
-            nc66a=False
-            nc67a=False
-            nc68a=False
-            nc69a=False
-            nc70a=False
-            nc71a=False
-            nc72a=False
-            nc73a=False
-            nc74a=False
-            nc75a=False
-            nc76a=False
-            nc77a=False
-            nc78a=False
-            nc79a=False
-            nc80a=False
-            nc81a=False
-            nc82a=False
-            nc83a=False
-            nc84a=False
-            nc85a=False
-            nc86a=False
-            nc87a=False
-            nc88a=False
-            nc89a=False
-            nc90a=False
-            nc91a=False
-            nc92a=False
-            nc93a=False
-            
-            #conditional ifs 
-            if selection == "auto":
-                nc1a=True
-            elif selection == "aggrnyl":
-                nc2a=True
-            elif selection == "agsunset":
-                nc3a=True
-            elif selection == "algae":
-                nc4a=True
-            elif selection == "amp":
-                nc5a=True
-            elif selection == "armyrose":
-                nc6a=True
-            elif selection == "balance":
-                nc7a=True
-            elif selection == "blackbody":
-                nc8a=True
-            elif selection == "bluered":
-                nc9a=True
-            elif selection == "blues":
-                nc10a=True
-            elif selection == "blugrn":
-                nc11a=True
-            elif selection == "bluyl":
-                nc12a=True
-            elif selection == "brbg":
-                nc13a=True
-            elif selection == "brwnyl":
-                nc14a=True
-            elif selection == "bugn":
-                nc15a=True
-            elif selection == "bupu":
-                nc16a=True
-            elif selection == "burg":
-                nc17a=True
-            elif selection == "burgyl":
-                nc18a=True
-            elif selection == "cividis":
-                nc19a=True
-            elif selection == "curl":
-                nc20a=True
-            elif selection == "darkmint":
-                nc21a=True
-            elif selection == "deep":
-                nc22a=True
-            elif selection == "delta":
-                nc23a=True
-            elif selection == "dense":
-                nc24a=True
-            elif selection == "earth":
-                nc25a=True
-            elif selection == "edge":
-                nc26a=True
-            elif selection == "electric":
-                nc27a=True
-            elif selection == "emrld":
-                nc28a=True
-            elif selection == "fall":
-                nc29a=True
-            elif selection == "geyser":
-                nc30a=True
-            elif selection == "gnbu":
-                nc31a=True
-            elif selection == "gray":
-                nc32a=True
-            elif selection == "greens":
-                nc33a=True
-            elif selection == "greys":
-                nc34a=True
-            elif selection == "haline":
-                nc35a=True
-            elif selection == "hot":
-                nc36a=True
-            elif selection == "hsv":
-                nc37a=True
-            elif selection == "ice":
-                nc38a=True
-            elif selection == "icefire":
-                nc39a=True
-            elif selection == "inferno":
-                nc40a=True
-            elif selection == "jet":
-                nc41a=True
-            elif selection == "magenta":
-                nc42a=True
-            elif selection == "magma":
-                nc43a=True
-            elif selection == "matter":
-                nc44a=True
-            elif selection == "mint":
-                nc45a=True
-            elif selection == "mrybm":
-                nc46a=True
-            elif selection == "mygbm":
-                nc47a=True
-            elif selection == "oranges":
-                nc48a=True
-            elif selection == "orrd":
-                nc49a=True
-            elif selection == "oryel":
-                nc50a=True
-            elif selection == "peach":
-                nc51a=True
-            elif selection == "phase":
-                nc52a=True
-            elif selection == "picnic":
-                nc53a=True
-            elif selection == "pinkyl":
-                nc54a=True
-            elif selection == "piyg":
-                nc55a=True
-            elif selection == "plasma":
-                nc56a=True
-            elif selection == "plotly3":
-                nc57a=True
-            elif selection == "portland":
-                nc58a=True
-            elif selection == "prgn":
-                nc59a=True
-            elif selection == "pubu":
-                nc60a=True
-            elif selection == "pubugn":
-                nc61a=True
-            elif selection == "puor":
-                nc62a=True
-            elif selection == "purd":
-                nc63a=True
-            elif selection == "purp":
-                nc64a=True
-            elif selection == "purples":
-                nc65a=True
-            elif selection == "purpor":
-                nc66a=True
-            elif selection == "rainbow":
-                nc67a=True
-            elif selection == "rdbu":
-                nc68a=True
-            elif selection == "rdgy":
-                nc69a=True
-            elif selection == "rdpu":
-                nc70a=True
-            elif selection == "rdylbu":
-                nc71a=True
-            elif selection == "rdylgn":
-                nc72a=True
-            elif selection == "redor":
-                nc73a=True
-            elif selection == "reds":
-                nc74a=True
-            elif selection == "solar":
-                nc75a=True
-            elif selection == "spectral":
-                nc76a=True
-            elif selection == "speed":
-                nc77a=True
-            elif selection == "sunset":
-                nc78a=True
-            elif selection == "sunsetdark":
-                nc79a=True
-            elif selection == "teal":
-                nc80a=True
-            elif selection == "tealgrn":
-                nc81a=True
-            elif selection == "tealrose":
-                nc82a=True
-            elif selection == "tempo":
-                nc83a=True
-            elif selection == "temps":
-                nc84a=True
-            elif selection == "thermal":
-                nc85a=True
-            elif selection == "tropic":
-                nc86a=True
-            elif selection == "turbid":
-                nc87a=True
-            elif selection == "twilight":
-                nc88a=True
-            elif selection == "viridis":
-                nc89a=True
-            elif selection == "ylgn":
-                nc90a=True
-            elif selection == "ylgnbu":
-                nc91a=True
-            elif selection == "ylorbr":
-                nc92a=True
-            elif selection == "ylorrd":
-                nc93a=True     
+            #only the clicked palette is active (selection is the pattern matching id of the button)
+            index = json.loads(selection)["index"]
+            colorscale_active = [i == index for i in range(len(geomap_colorscale))]
             
 
         return btn_low_active, btn_med_active, btn_high_active, btn_openstreetmap_active, btn_cartopositron_active, btn_darkmatter_active, btn_stamenterrain_active, btn_stamentoner_active, btn_stamenwatercolor_active, \
-            nc1a, nc2a, nc3a, nc4a, nc5a, nc6a, nc7a, nc8a, nc9a, nc10a, nc11a, nc12a, nc13a, nc14a, nc15a, nc16a, nc17a, nc18a, nc19a, nc20a, nc21a, nc22a, nc23a, nc24a, nc25a, nc26a, nc27a, nc28a, nc29a, nc30a, nc31a, nc32a, nc33a, nc34a, nc35a, nc36a, nc37a, nc38a, nc39a, nc40a, nc41a, nc42a, nc43a, nc44a, nc45a, nc46a, nc47a, nc48a, nc49a, nc50a, nc51a, nc52a, nc53a, nc54a, nc55a, nc56a, nc57a, nc58a, nc59a, nc60a, nc61a, nc62a, nc63a, nc64a, nc65a, nc66a, nc67a, nc68a, nc69a, nc70a, nc71a, nc72a, nc73a, nc74a, nc75a, nc76a, nc77a, nc78a, nc79a, nc80a, nc81a, nc82a, nc83a, nc84a, nc85a, nc86a, nc87a, nc88a, nc89a, nc90a, nc91a, nc92a, nc93a, \
+            colorscale_active, \
                 btn_reverse_active, btn_normal_active
     
 
@@ -4273,9 +4273,7 @@ def init_callbacks(dash_app):
         c.append(State('settingsbtn-mapstyle-stamen-watercolor', "active"))
         
         #now add colorscale states
-        for i in geomap_colorscale:
-            c.append(State(i,"active"))
-        #print(c)
+        c.append(State({"type": "colorscale", "index": ALL}, "active"))
         
         #Add reverse button
         c.append(State('settingsbtn-reverse-colorscale', "active"))
@@ -4301,7 +4299,7 @@ def init_callbacks(dash_app):
     def callback_settings_modal_apply(n1,
                                     btn_low_active, btn_med_active, btn_high_active,
                                     btn_openstreetmap_active, btn_cartopositron_active, btn_darkmatter_active, btn_stamenterrain_active, btn_stamentoner_active, btn_stamenwatercolor_active,
-                                    nc1a, nc2a, nc3a, nc4a, nc5a, nc6a, nc7a, nc8a, nc9a, nc10a, nc11a, nc12a, nc13a, nc14a, nc15a, nc16a, nc17a, nc18a, nc19a, nc20a, nc21a, nc22a, nc23a, nc24a, nc25a, nc26a, nc27a, nc28a, nc29a, nc30a, nc31a, nc32a, nc33a, nc34a, nc35a, nc36a, nc37a, nc38a, nc39a, nc40a, nc41a, nc42a, nc43a, nc44a, nc45a, nc46a, nc47a, nc48a, nc49a, nc50a, nc51a, nc52a, nc53a, nc54a, nc55a, nc56a, nc57a, nc58a, nc59a, nc60a, nc61a, nc62a, nc63a, nc64a, nc65a, nc66a, nc67a, nc68a, nc69a, nc70a, nc71a, nc72a, nc73a, nc74a, nc75a, nc76a, nc77a, nc78a, nc79a, nc80a, nc81a, nc82a, nc83a, nc84a, nc85a, nc86a, nc87a, nc88a, nc89a, nc90a, nc91a, nc92a, nc93a,
+                                    colorscale_active,
                                     btn_reverse_active, btn_normal_active
                                     ):
         #This callback must be separate as year slider is created from main callback, so this acts as a trigger for the main
@@ -4346,100 +4344,8 @@ def init_callbacks(dash_app):
             print("Setting dcc store setting mapstyle to stamenwatercolour")
             dcc_settings_mapstyle = 5
     
-        #logic for colorbar
-        if nc1a==True: dcc_settings_colorbar = 0
-        elif nc2a==True: dcc_settings_colorbar = 1 
-        elif nc3a==True: dcc_settings_colorbar = 2
-        elif nc4a==True: dcc_settings_colorbar = 3
-        elif nc5a==True: dcc_settings_colorbar = 4
-        elif nc6a==True: dcc_settings_colorbar = 5
-        elif nc7a==True: dcc_settings_colorbar = 6
-        elif nc8a==True: dcc_settings_colorbar = 7
-        elif nc9a==True: dcc_settings_colorbar = 8
-        elif nc10a==True: dcc_settings_colorbar = 9
-        elif nc11a==True: dcc_settings_colorbar = 10
-        elif nc12a==True: dcc_settings_colorbar = 11
-        elif nc13a==True: dcc_settings_colorbar = 12
-        elif nc14a==True: dcc_settings_colorbar = 13
-        elif nc15a==True: dcc_settings_colorbar = 14
-        elif nc16a==True: dcc_settings_colorbar = 15
-        elif nc17a==True: dcc_settings_colorbar = 16
-        elif nc18a==True: dcc_settings_colorbar = 17
-        elif nc19a==True: dcc_settings_colorbar = 18
-        elif nc20a==True: dcc_settings_colorbar = 19
-        elif nc21a==True: dcc_settings_colorbar = 20
-        elif nc22a==True: dcc_settings_colorbar = 21
-        elif nc23a==True: dcc_settings_colorbar = 22
-        elif nc24a==True: dcc_settings_colorbar = 23
-        elif nc25a==True: dcc_settings_colorbar = 24
-        elif nc26a==True: dcc_settings_colorbar = 25
-        elif nc27a==True: dcc_settings_colorbar = 26
-        elif nc28a==True: dcc_settings_colorbar = 27
-        elif nc29a==True: dcc_settings_colorbar = 28
-        elif nc30a==True: dcc_settings_colorbar = 29
-        elif nc31a==True: dcc_settings_colorbar = 30
-        elif nc32a==True: dcc_settings_colorbar = 31
-        elif nc33a==True: dcc_settings_colorbar = 32
-        elif nc34a==True: dcc_settings_colorbar = 33
-        elif nc35a==True: dcc_settings_colorbar = 34
-        elif nc36a==True: dcc_settings_colorbar = 35
-        elif nc37a==True: dcc_settings_colorbar = 36
-        elif nc38a==True: dcc_settings_colorbar = 37
-        elif nc39a==True: dcc_settings_colorbar = 38
-        elif nc40a==True: dcc_settings_colorbar = 39
-        elif nc41a==True: dcc_settings_colorbar = 40
-        elif nc42a==True: dcc_settings_colorbar = 41
-        elif nc43a==True: dcc_settings_colorbar = 42
-        elif nc44a==True: dcc_settings_colorbar = 43
-        elif nc45a==True: dcc_settings_colorbar = 44
-        elif nc46a==True: dcc_settings_colorbar = 45
-        elif nc47a==True: dcc_settings_colorbar = 46
-        elif nc48a==True: dcc_settings_colorbar = 47
-        elif nc49a==True: dcc_settings_colorbar = 48
-        elif nc50a==True: dcc_settings_colorbar = 49
-        elif nc51a==True: dcc_settings_colorbar = 50
-        elif nc52a==True: dcc_settings_colorbar = 51
-        elif nc53a==True: dcc_settings_colorbar = 52
-        elif nc54a==True: dcc_settings_colorbar = 53
-        elif nc55a==True: dcc_settings_colorbar = 54
-        elif nc56a==True: dcc_settings_colorbar = 55
-        elif nc57a==True: dcc_settings_colorbar = 56
-        elif nc58a==True: dcc_settings_colorbar = 57
-        elif nc59a==True: dcc_settings_colorbar = 58
-        elif nc60a==True: dcc_settings_colorbar = 59
-        elif nc61a==True: dcc_settings_colorbar = 60
-        elif nc62a==True: dcc_settings_colorbar = 61
-        elif nc63a==True: dcc_settings_colorbar = 62
-        elif nc64a==True: dcc_settings_colorbar = 63
-        elif nc65a==True: dcc_settings_colorbar = 64
-        elif nc66a==True: dcc_settings_colorbar = 65
-        elif nc67a==True: dcc_settings_colorbar = 66
-        elif nc68a==True: dcc_settings_colorbar = 67
-        elif nc69a==True: dcc_settings_colorbar = 68
-        elif nc70a==True: dcc_settings_colorbar = 69
-        elif nc71a==True: dcc_settings_colorbar = 70
-        elif nc72a==True: dcc_settings_colorbar = 71
-        elif nc73a==True: dcc_settings_colorbar = 72
-        elif nc74a==True: dcc_settings_colorbar = 73
-        elif nc75a==True: dcc_settings_colorbar = 74
-        elif nc76a==True: dcc_settings_colorbar = 75
-        elif nc77a==True: dcc_settings_colorbar = 76
-        elif nc78a==True: dcc_settings_colorbar = 77
-        elif nc79a==True: dcc_settings_colorbar = 78
-        elif nc80a==True: dcc_settings_colorbar = 79
-        elif nc81a==True: dcc_settings_colorbar = 80
-        elif nc82a==True: dcc_settings_colorbar = 81
-        elif nc83a==True: dcc_settings_colorbar = 82
-        elif nc84a==True: dcc_settings_colorbar = 83
-        elif nc85a==True: dcc_settings_colorbar = 84
-        elif nc86a==True: dcc_settings_colorbar = 85
-        elif nc87a==True: dcc_settings_colorbar = 86
-        elif nc88a==True: dcc_settings_colorbar = 87
-        elif nc89a==True: dcc_settings_colorbar = 88
-        elif nc90a==True: dcc_settings_colorbar = 89
-        elif nc91a==True: dcc_settings_colorbar = 90
-        elif nc92a==True: dcc_settings_colorbar = 91
-        elif nc93a==True: dcc_settings_colorbar = 92   
+        #logic for colorbar (first active palette button)
+        if True in colorscale_active: dcc_settings_colorbar = colorscale_active.index(True)
         
         #logic for reverse button group
         if btn_reverse_active==True: dcc_settings_colorbar_reverse = True
@@ -4457,9 +4363,8 @@ def init_callbacks(dash_app):
                 #Input('btn-popover-map-download-land', 'n_clicks'),               
                 ],
                 State("my-series","data"), 
-                State('geomap_figure', 'figure'),
                 prevent_initial_call=True,)
-    def callback_download_dataset_main(n1, n2,n3, series, fig): 
+    def callback_download_dataset_main(n1, n2,n3, series):  
         
         ctx = dash.callback_context 
         trigger = ctx.triggered[0]["prop_id"].split(".")[0]
@@ -4471,13 +4376,14 @@ def init_callbacks(dash_app):
         link = master_config[series].get("link") 
             
         #subset master dataset to selected series, and sort by year, then country
-        df = pop.loc[(pop['dataset_raw'] == series)].sort_values(by=['year', 'country'])      
+        df = d.get_pop_slice(pop, pop_index, series).sort_values(by=['year', 'country'])      
         
         # make it pretty
         df['m49_un_a3'] = df['m49_un_a3'].astype(str).str.zfill(3) 
         df['United Nations m49 country code'] = df['m49_un_a3']        
-        df = df.rename(columns={'value':series_label}) 
-        df = df.drop(columns=['dataset_raw', 'm49_un_a3', 'continent'])        
+        value_col = d.get_value_column(master_config[series].get("var_type")) #discrete series export their classes, everything else the number
+        df = df.rename(columns={value_col:series_label})
+        df = df.drop(columns=['dataset_raw', 'country_id', 'm49_un_a3', 'continent', 'value_cat' if value_col == 'value_num' else 'value_num'])        
                         
         #merge in source information     
         df['Source'] = source+" "+link
@@ -4498,20 +4404,6 @@ def init_callbacks(dash_app):
         elif trigger == 'btn-popover-map-download-json':          
             filename = "WORLD_ATLAS_2.0 "+series_label+".json"        
             return send_data_frame(df.to_json, filename, orient='table', index=False)
-        
-        elif trigger == 'btn-popover-map-download-pdf':
-            year='blah'
-            f = go.Figure(fig)        
-            f.update_layout(
-                #title={'text':'WORLD ATLAS 2.0 - '+series_label+' in '+year,'font':{'size':36,'color':'black'},'x':0,'xref':'container', 'xanchor':'left','pad':{'b':0,'t':40,'l':40,'r':0}, 'y':1, 'yref':'container', 'yanchor':'auto'},
-                #annotations=[{'text':'Source: '+source,'font':{'size':14,'color':'black'},'x':0,'xref':'paper', 'xanchor':'left','y':0, 'yref':'paper', 'yanchor':'auto'}],
-                #xaxis={'title':{'text':'This chart was generated at https://worldatlas.org based on dataset: '+source+'. Originally sourced from '+link , 'font':{'size':22}}},
-                height=600,
-                width=4096,            
-                )
-            path = "tmp/WORLD_ATLAS_2.0 "+series_label+" ["+year+"].pdf" 
-            plotly.io.write_image(fig=f, file=path, engine="kaleido")
-            return send_file(path)
 
 
     #Download dataset BAR
@@ -4528,9 +4420,9 @@ def init_callbacks(dash_app):
                 ],              
                 State('my-series-bar','data'),
                 State('my-year-bar','data'),
-                State('bar-graph', 'figure'),  
+                State('bar-graph-dropdown-countrieselector', 'value'),  
                 prevent_initial_call=True,)
-    def callback_download_dataset_bar(n1,n2,n3,n4,n5,n6,n7, myseries_bar, myyear_bar, fig):   
+    def callback_download_dataset_bar(n1,n2,n3,n4,n5,n6,n7, myseries_bar, myyear_bar, countries):   
         
         ctx = dash.callback_context 
         trigger = ctx.triggered[0]["prop_id"].split(".")[0]
@@ -4542,20 +4434,21 @@ def init_callbacks(dash_app):
         link = master_config[series].get("link")         
         
         #subset master dataset to selected series and selected year
-        df = pop.loc[(pop['dataset_raw'] == series) & (pop['year'] == year)].sort_values('country')   
+        df = d.get_pop_slice(pop, pop_index, series, year).sort_values('country')   
         
         # make it pretty
         df['m49_un_a3'] = df['m49_un_a3'].astype(str).str.zfill(3) 
         df['United Nations m49 country code'] = df['m49_un_a3']
-        df = df.rename(columns={'value':series_label})   
-        df = df.drop(columns=['dataset_raw', 'm49_un_a3', 'continent'])     
+        value_col = d.get_value_column(master_config[series].get("var_type")) #discrete series export their classes, everything else the number
+        df = df.rename(columns={value_col:series_label})
+        df = df.drop(columns=['dataset_raw', 'country_id', 'm49_un_a3', 'continent', 'value_cat' if value_col == 'value_num' else 'value_num'])     
 
         #merge in source information 
         df['Source'] = source+" "+link
         
-        # nest function for returning chart
+        # nest function for returning chart (rebuilt server side, same as the bar modal draws it)
         def chart(extension):
-            f = go.Figure(fig)        
+            f = create_chart_bar(d.get_series_and_year(pop, pop_index, str(year), series, False), series, countries)        
             f.update_layout(
                 title={'text':'WORLD ATLAS 2.0 - '+series_label+' in '+str(year),'font':{'size':36,'color':'black'},'x':0,'xref':'container', 'xanchor':'left','pad':{'b':0,'t':40,'l':40,'r':0}, 'y':1, 'yref':'container', 'yanchor':'auto'},
                 #annotations=[{'text':'Source: '+source,'font':{'size':14,'color':'black'},'x':0,'xref':'paper', 'xanchor':'left','y':0, 'yref':'paper', 'yanchor':'auto'}],
@@ -4604,10 +4497,9 @@ def init_callbacks(dash_app):
                 Input('btn-popover-line-download-svg', 'n_clicks'),
                 ],              
                 State('my-series-line','data'), 
-                State('line-graph', 'figure'),
                 State('line-graph-dropdown-countries', 'value'),
                 prevent_initial_call=True,)
-    def callback_download_dataset_line(n1,n2,n3,n4,n5,n6,n7, series, fig, countries):   
+    def callback_download_dataset_line(n1,n2,n3,n4,n5,n6,n7, series, countries):   
         
         ctx = dash.callback_context 
         trigger = ctx.triggered[0]["prop_id"].split(".")[0]
@@ -4631,20 +4523,23 @@ def init_callbacks(dash_app):
             width=1920
         
         #subset master dataset to selected series and selected year
-        df = pop.loc[(pop['dataset_raw'] == series)].sort_values(['year','country'])   
+        df = d.get_pop_slice(pop, pop_index, series).sort_values(['year','country'])   
         
         # make it pretty
         df['m49_un_a3'] = df['m49_un_a3'].astype(str).str.zfill(3) 
         df['United Nations m49 country code'] = df['m49_un_a3']
-        df = df.rename(columns={'value':series_label})   
-        df = df.drop(columns=['dataset_raw', 'm49_un_a3', 'continent'])   
+        value_col = d.get_value_column(master_config[series].get("var_type")) #discrete series export their classes, everything else the number
+        df = df.rename(columns={value_col:series_label})
+        df = df.drop(columns=['dataset_raw', 'country_id', 'm49_un_a3', 'continent', 'value_cat' if value_col == 'value_num' else 'value_num'])   
         
         #merge in source information 
         df['Source'] = source+" "+link
         
-        # nest function to help return charts
+        # nest function to help return charts (rebuilt server side, same as the line modal draws it)
         def chart(extension):
-            f = go.Figure(fig)        
+            dfl = d.get_pop_slice(pop, pop_index, series).sort_values(by="country", ascending=True)
+            dfl["year"] = dfl["year"].astype(int)
+            f = create_chart_line(dfl, series, countries)        
             f.update_layout(
                 title={'text':'WORLD ATLAS 2.0 - '+series_label,'font':{'size':title_font,'color':'black'},'x':0,'xref':'container', 'xanchor':'left','pad':{'b':0,'t':40,'l':40,'r':0}, 'y':1, 'yref':'container', 'yanchor':'auto'},            
                 xaxis={'title':{'text':'Source: This chart was generated at https://worldatlas.org based on dataset: '+source+'. Originally sourced from '+link , 'font':{'size':footer_font}}},
@@ -4696,10 +4591,11 @@ def init_callbacks(dash_app):
                 State('my-pizza-sunburst','data'),
                 State('my-toppings-sunburst','data'),
                 State('my-year-sunburst','data'),
-                State('sunburst-graph', 'figure'),
+                State("my-settings_colorbar_store", 'data'),
+                State("my-settings_colorbar_reverse_store", 'data'),
                 ],
                 prevent_initial_call=True,)
-    def callback_download_dataset_sunburst(n1,n2,n3,n4,n5,n6,n7, pizza, toppings, year, fig ):   
+    def callback_download_dataset_sunburst(n1,n2,n3,n4,n5,n6,n7, pizza, toppings, year, colorbar_style, colorbar_reverse ):   
         #logger.info("download dataset sunburst callback:\npizza %r\ntoppings %r\nyear %r",pizza, toppings, year)
         
         ctx = dash.callback_context 
@@ -4731,22 +4627,20 @@ def init_callbacks(dash_app):
         series_label='WORLD_ATLAS_2.0 '+pizza+' VS '+toppings
         
         #build data frames from master
-        dfx = pop[(pop['dataset_raw']==x) & (pop['year']==year)].rename(columns={"value":x})        
-        dfx[x] = dfx[x].astype(float)
+        dfx = d.get_pop_slice(pop, pop_index, x, year).rename(columns={"value_num":x})        
             
-        dfy = pop[(pop['dataset_raw']==y) & (pop['year']==year)].rename(columns={"value":y})
-        dfy[y] = dfy[y].astype(float)
+        dfy = d.get_pop_slice(pop, pop_index, y, year).rename(columns={"value_num":y})
             
         # merge dataframes on common countries
-        common_countries = reduce(np.intersect1d,(dfx['country'].values,dfy['country'].values))
-        dfx = dfx[dfx['country'].isin(common_countries)]
-        dfy = dfy[dfy['country'].isin(common_countries)]
-        df = pd.merge(dfx,dfy[['country',y]],on='country', how='left')
+        common_countries = reduce(np.intersect1d,(dfx['country_id'].values,dfy['country_id'].values))
+        dfx = dfx[dfx['country_id'].isin(common_countries)]
+        dfy = dfy[dfy['country_id'].isin(common_countries)]
+        df = pd.merge(dfx,dfy[['country_id',y]],on='country_id', how='left')
         
         # make pretty   
         df['m49_un_a3'] = df['m49_un_a3'].astype(str).str.zfill(3) 
         df['United Nations m49 country code'] = df['m49_un_a3']
-        df = df.drop(columns=['dataset_raw', 'continent', 'm49_un_a3'])    
+        df = df.drop(columns=['dataset_raw', 'country_id', 'continent', 'm49_un_a3'])    
         df = df.rename(columns={x:pizza, y:toppings})    
         
         #merge in source information 
@@ -4755,8 +4649,7 @@ def init_callbacks(dash_app):
         
         # prepare nested func to return chart
         def chart(extension):
-            print('in function test')
-            f = go.Figure(fig)        
+            f = create_chart_sunburst(x, y, str(year), get_sunburst_colorscale(colorbar_style, colorbar_reverse)) #rebuilt server side       
             f.update_layout(
                 title={'text':title,'font':{'size':title_font,'color':'black'},'x':0,'xref':'container', 'xanchor':'left','pad':{'b':0,'t':40,'l':40,'r':0}, 'y':1, 'yref':'container', 'yanchor':'auto'},
                 annotations=[
@@ -4813,10 +4706,10 @@ def init_callbacks(dash_app):
                 State('my-yseries-bubble', 'data'),
                 State('my-zseries-bubble', 'data'),
                 State('my-year-bubble', 'data'),
-                State('bubble-graph','figure'),
+                State("chklist-bubble-log", "value"),
                 #State('my-year-bar','data'),
                 prevent_initial_call=True,)
-    def callback_download_dataset_bubble(n1,n2,n3,n4,n5,n6,n7, x, y, z, year, fig ):   
+    def callback_download_dataset_bubble(n1,n2,n3,n4,n5,n6,n7, x, y, z, year, chklist_log_state ):   
         logger.info("download dataset bubble graph callback:\nx %r\ny %r\nz %r\nyear %r",x, y, z, str(year))
         
         ctx = dash.callback_context 
@@ -4827,9 +4720,9 @@ def init_callbacks(dash_app):
         
         
         #Build 3 dataframes as precursor to chart data
-        if x != None: dfx = pop[(pop['dataset_raw']==x) & (pop['year']==year)].rename(columns={"value":x})   
-        if y != None: dfy = pop[(pop['dataset_raw']==y) & (pop['year']==year)].rename(columns={"value":y})
-        if z != None: dfz = pop[(pop['dataset_raw']==z) & (pop['year']==year)].rename(columns={"value":z})
+        if x != None: dfx = d.get_pop_slice(pop, pop_index, x, year).rename(columns={"value_num":x})   
+        if y != None: dfy = d.get_pop_slice(pop, pop_index, y, year).rename(columns={"value_num":y})
+        if z != None: dfz = d.get_pop_slice(pop, pop_index, z, year).rename(columns={"value_num":z})
             
         #we're gonna need logic for every input combination
         
@@ -4840,18 +4733,18 @@ def init_callbacks(dash_app):
         
         # x y only
         elif x!=None and y!=None and z==None:
-            common_countries = reduce(np.intersect1d,(dfx['country'].values,dfy['country'].values))
-            dfx = dfx[dfx['country'].isin(common_countries)]
-            dfy = dfy[dfy['country'].isin(common_countries)]
-            dfa = pd.merge(dfx,dfy[['country',y]],on='country', how='left')
+            common_countries = reduce(np.intersect1d,(dfx['country_id'].values,dfy['country_id'].values))
+            dfx = dfx[dfx['country_id'].isin(common_countries)]
+            dfy = dfy[dfy['country_id'].isin(common_countries)]
+            dfa = pd.merge(dfx,dfy[['country_id',y]],on='country_id', how='left')
             print("xy")
             
         # x z only
         elif x!=None and y==None and z!=None:    
-            common_countries = reduce(np.intersect1d,(dfx['country'].values, dfz['country'].values))
-            dfx = dfx[dfx['country'].isin(common_countries)]        
-            dfz = dfz[dfz['country'].isin(common_countries)]
-            dfa = pd.merge(dfx,dfz[['country',z]],on='country', how='left')
+            common_countries = reduce(np.intersect1d,(dfx['country_id'].values, dfz['country_id'].values))
+            dfx = dfx[dfx['country_id'].isin(common_countries)]        
+            dfz = dfz[dfz['country_id'].isin(common_countries)]
+            dfa = pd.merge(dfx,dfz[['country_id',z]],on='country_id', how='left')
             print("xz")
             
         # y only    
@@ -4861,10 +4754,10 @@ def init_callbacks(dash_app):
         
         # y z only
         elif x==None and y!=None and z!=None:
-            common_countries = reduce(np.intersect1d,(dfy['country'].values, dfz['country'].values))        
-            dfy = dfy[dfy['country'].isin(common_countries)]
-            dfz = dfz[dfz['country'].isin(common_countries)]
-            dfa = pd.merge(dfy,dfz[['country',z]],on='country', how='left')
+            common_countries = reduce(np.intersect1d,(dfy['country_id'].values, dfz['country_id'].values))        
+            dfy = dfy[dfy['country_id'].isin(common_countries)]
+            dfz = dfz[dfz['country_id'].isin(common_countries)]
+            dfa = pd.merge(dfy,dfz[['country_id',z]],on='country_id', how='left')
             print("yz")
             
         # z only    
@@ -4876,16 +4769,16 @@ def init_callbacks(dash_app):
         else:
         
             #find the unique list of countries that are present in all 3 datasets
-            common_countries = reduce(np.intersect1d,(dfx['country'].values,dfy['country'].values, dfz['country'].values))
+            common_countries = reduce(np.intersect1d,(dfx['country_id'].values,dfy['country_id'].values, dfz['country_id'].values))
             
             #strip out non common countries from the 3 datasets before merging
-            dfx = dfx[dfx['country'].isin(common_countries)]
-            dfy = dfy[dfy['country'].isin(common_countries)]
-            dfz = dfz[dfz['country'].isin(common_countries)]
+            dfx = dfx[dfx['country_id'].isin(common_countries)]
+            dfy = dfy[dfy['country_id'].isin(common_countries)]
+            dfz = dfz[dfz['country_id'].isin(common_countries)]
             
             #merge the dataframes on country    
-            dfa = pd.merge(dfx,dfy[['country',y]],on='country', how='left')
-            dfa = pd.merge(dfa,dfz[['country',z]],on='country', how='left')
+            dfa = pd.merge(dfx,dfy[['country_id',y]],on='country_id', how='left')
+            dfa = pd.merge(dfa,dfz[['country_id',z]],on='country_id', how='left')
             
         # prepare final data frame for download
         
@@ -4898,7 +4791,7 @@ def init_callbacks(dash_app):
         #dfa['Continent'] = dfa['continent']
         dfa['m49_un_a3'] = dfa['m49_un_a3'].astype(str).str.zfill(3) 
         dfa['United Nations m49 country code'] = dfa['m49_un_a3']
-        dfa = dfa.drop(columns=['continent','m49_un_a3', 'dataset_raw'])    
+        dfa = dfa.drop(columns=['country_id', 'continent','m49_un_a3', 'dataset_raw'])    
         dfa = dfa.sort_values(by=['country'])  
         
         #chart vars
@@ -4919,9 +4812,10 @@ def init_callbacks(dash_app):
         footer_font=12
         
         
-        # prepare nested func to return chart
+        # prepare nested func to return chart (rebuilt server side, same as the bubble modal draws it)
         def chart(extension):        
-            f = go.Figure(fig)        
+            logs = chklist_log_state if chklist_log_state != None else []
+            f = create_chart_bubble(x, y, z, year, 'x' in logs, 'y' in logs, 'z' in logs)        
             f.update_layout(
                 title={'text':title,'font':{'size':title_font,'color':'black'},'x':0,'xref':'container', 'xanchor':'left','pad':{'b':0,'t':40,'l':40,'r':0}, 'y':1, 'yref':'container', 'yanchor':'auto'},
                 annotations=[
@@ -4991,13 +4885,13 @@ def init_callbacks(dash_app):
                     
         if trigger == 'btn-downloads-all-data':
             
-            #sort master dataset
-            df = pop.sort_values(by=['Series','year', 'country'])  
+            #give the master dataset its country columns back (by integer key, see d.join_countries) and sort
+            df = d.join_countries(pop, pop_index["countries"]).sort_values(by=['dataset_raw','year', 'country'])  
             
             # make it pretty
             df['m49_un_a3'] = df['m49_un_a3'].astype(str).str.zfill(3) 
             df['United Nations m49 country code'] = df['m49_un_a3'] 
-            df = df.drop(columns=['m49_un_a3', 'region_un', 'region_wb', 'continent'])   
+            df = df.drop(columns=['country_id', 'm49_un_a3', 'continent'])   
             #print(len(df))
             
             path = "./tmp/WORLD_ATLAS_alldata.zip"
@@ -5009,16 +4903,14 @@ def init_callbacks(dash_app):
             # return if no country selected
             if countrieselection == None or countrieselection == []: return None, ''
 
-            #sort master dataset favouring country first
-            df = pop.sort_values(by=['country','Series', 'year']) 
+            #query it based on selected countries (on the integer country key), then join the country columns back and sort favouring country first
+            ids = d.get_country_ids(pop_index["countries"], countrieselection)
+            df = d.join_countries(pop.loc[pop['country_id'].isin(ids)], pop_index["countries"]).sort_values(by=['country','dataset_raw', 'year']) 
 
             # make it pretty and strip 
             df['m49_un_a3'] = df['m49_un_a3'].astype(str).str.zfill(3) 
             df['United Nations m49 country code'] = df['m49_un_a3'] 
-            df = df.drop(columns=['m49_un_a3', 'region_un', 'region_wb', 'continent'])  
-
-            #query it based on selected countries
-            df = df.loc[df['country'].isin(countrieselection)]
+            df = df.drop(columns=['country_id', 'm49_un_a3', 'continent'])  
 
             # return dataframe as zipped csv
             path = "./tmp/WORLD_ATLAS_custom_query_by_region.zip"
@@ -5030,16 +4922,14 @@ def init_callbacks(dash_app):
             # return if no series selected
             if seriesSelection == None or seriesSelection == []: return None,''
             
-            #sort master dataset favouring country first
-            df = pop.sort_values(by=['Series','country', 'year']) 
+            #grab each selected series by its row offsets (no scan of the master dataset), then sort favouring series first
+            df = pd.concat([d.get_pop_slice(pop, pop_index, series) for series in seriesSelection], ignore_index=True)
+            df = df.sort_values(by=['dataset_raw','country', 'year']) 
 
             # make it pretty and strip 
             df['m49_un_a3'] = df['m49_un_a3'].astype(str).str.zfill(3) 
             df['United Nations m49 country code'] = df['m49_un_a3'] 
-            df = df.drop(columns=['m49_un_a3', 'region_un', 'region_wb', 'continent'])  
-
-            #query it based on selected countries
-            df = df.loc[df['Series'].isin(seriesSelection)]
+            df = df.drop(columns=['country_id', 'm49_un_a3', 'continent'])  
 
             # return dataframe as zipped csv
             path = "./tmp/WORLD_ATLAS_custom_query_by_series.zip"
@@ -5051,16 +4941,19 @@ def init_callbacks(dash_app):
             # return if no series selected
             if yearSelection == None or yearSelection == []: return None,''
             
-            #sort master dataset favouring year first
-            df = pop.sort_values(by=['year','Series', 'country']) 
+            #query it based on selected years: every series+year block for those years, by row offsets (no scan of the master dataset)
+            years = set(int(year) for year in yearSelection)
+            blocks = sorted(offsets for (series, year), offsets in pop_index["series_year"].items() if year in years)
+            if len(blocks) == 0: return None,''
+
+            #join the country columns back and sort favouring year first
+            df = d.join_countries(pd.concat([pop.iloc[start:stop] for start, stop in blocks], ignore_index=True), pop_index["countries"])
+            df = df.sort_values(by=['year','dataset_raw', 'country']) 
 
             # make it pretty and strip 
             df['m49_un_a3'] = df['m49_un_a3'].astype(str).str.zfill(3) 
             df['United Nations m49 country code'] = df['m49_un_a3'] 
-            df = df.drop(columns=['m49_un_a3', 'region_un', 'region_wb', 'continent'])  
-
-            #query it based on selected countries
-            df = df.loc[df['year'].isin(yearSelection)]  ##cast to int??
+            df = df.drop(columns=['country_id', 'm49_un_a3', 'continent'])  
 
             # return dataframe as zipped csv
             path = "./tmp/WORLD_ATLAS_custom_query_by_year.zip"
@@ -5075,18 +4968,6 @@ def init_callbacks(dash_app):
 
 
 
-    #year slider callback 
-    @dash_app.callback(                      
-        Output("timeslider-hidden-div", "children"),    
-        Input("year-slider", "value"),    
-        prevent_initial_call=True,
-    )
-    def callback_year_slider_change(year_index):
-        #This callback must be separate as year slider is created from main callback, so this acts as a trigger for the main
-        #logger.info("CALLBACK: Time slider change. year input change detected. Selected year index is %r, marks are %r", year_index) 
-        return "dummy"
-
-
     #Bar graph modal
     @dash_app.callback(
         [
@@ -5150,17 +5031,17 @@ def init_callbacks(dash_app):
                 source = master_config[series].get("source")        
                 link = master_config[series].get("link") 
                 bar_graph_title = series_label+" in "+year  
-                df = d.get_series_and_year(pop, year, series, False)   
+                df = d.get_series_and_year(pop, pop_index, year, series, False)   
         
         # case: entry from map mode (use series store and year from slider)    
         elif trigger == 'bar-button':
             
-            year = str(d.get_years(pop.loc[(pop['dataset_raw'] == series)])[yearid])            
+            year = str(d.get_years(year_catalogue, series)[yearid])            
             series_label = master_config[series].get("dataset_label")         
             source = master_config[series].get("source")        
             link = master_config[series].get("link") 
             bar_graph_title = series_label+" in "+year  
-            df = d.get_series_and_year(pop, year, series, False)   #select the series and year from pop data, and sort it descending                 
+            df = d.get_series_and_year(pop, pop_index, year, series, False)   #select the series and year from pop data, and sort it descending                 
             
         # case: entry from dataset selection 
         elif trigger == 'bar-graph-dropdown-dataset':        
@@ -5174,8 +5055,7 @@ def init_callbacks(dash_app):
             link = master_config[series].get("link") 
             
             #select the series (expensive)       
-            df = d.get_series(pop, series, False)
-            df['value'] = df['value'].astype(float)            
+            df = d.get_series(pop, pop_index, series, False)
             
             #set to the most current year
             year = np.max(pd.unique(df["year"]))
@@ -5190,7 +5070,7 @@ def init_callbacks(dash_app):
                 #else it will be reset automatically by the drop down when it's not in the new list   
             
             #now subset to the most recent year        
-            df = df[(df["year"] == year)].sort_values(by="value", ascending=False)    
+            df = df[(df["year"] == year)].sort_values(by="value_num", ascending=False)    
             
             #update title
             bar_graph_title = series_label+" in "+str(year) 
@@ -5201,7 +5081,7 @@ def init_callbacks(dash_app):
             # case: map entry so use map data
             if dropdown_dataset == None or dropdown_dataset == '': 
                 if dropdown_year == None or dropdown_year == '':
-                    year = d.get_years(pop.loc[(pop['dataset_raw'] == series)])[yearid]
+                    year = d.get_years(year_catalogue, series)[yearid]
                 else:
                     year = dropdown_year
                 series_label = master_config[series].get("dataset_label")         
@@ -5215,7 +5095,7 @@ def init_callbacks(dash_app):
                 series_label = master_config[series].get("dataset_label")         
                 source = master_config[series].get("source")        
                 link = master_config[series].get("link")    
-                df = d.get_series(pop, series, False)          
+                df = d.get_series(pop, pop_index, series, False)          
                 
                 if dropdown_year == None or dropdown_year == '':
                     year = np.max(pd.unique(df["year"]))
@@ -5224,7 +5104,7 @@ def init_callbacks(dash_app):
                 bar_graph_title = series_label+" in "+str(year)     
             
             #select the series and year from pop data, and sort it descending
-            df = d.get_series_and_year(pop, str(year), series, False)               
+            df = d.get_series_and_year(pop, pop_index, str(year), series, False)               
             
         elif trigger == 'bar-graph-dropdown-year':          
             
@@ -5235,7 +5115,7 @@ def init_callbacks(dash_app):
             #determine which year to use
             if dropdown_year == None:
                 #year has been cleared, set to most recent            
-                years = np.sort(pd.unique(pd.DataFrame(pop[(pop['dataset_raw']==series)], columns=['year'])['year'].astype(int)))
+                years = d.get_year_array(year_catalogue, series)
                 year = str(years[-1])
             else:
                 year = str(dropdown_year)        
@@ -5247,7 +5127,7 @@ def init_callbacks(dash_app):
             bar_graph_title = series_label+" in "+year        
             
             #select the series and year from pop data, and sort it descending
-            df = d.get_series_and_year(pop, year, series, False)    
+            df = d.get_series_and_year(pop, pop_index, year, series, False)    
         
         # case: all conditions 
             
@@ -5278,7 +5158,7 @@ def init_callbacks(dash_app):
    
         # build dropdown list for available years
         dropdown_years=[]
-        years = np.sort(pd.unique(pd.DataFrame(pop[(pop['dataset_raw']==series)], columns=['year'])['year'].astype(int)))    
+        years = d.get_year_array(year_catalogue, series)    
         for i in range(0,len(years)):
                 dropdown_years.append({'label': years[i], 'value': years[i]})   
             
@@ -5358,10 +5238,9 @@ def init_callbacks(dash_app):
         graph_title = series_label
             
         # select the series from pop data (all years)
-        df = pop[(pop["dataset_raw"] == series)].sort_values(by="country", ascending=True)
+        df = d.get_pop_slice(pop, pop_index, series).sort_values(by="country", ascending=True)
             
-        # cast numeric values to floats
-        df["value"] = df["value"].astype(float)
+        # cast years to int (values are already float in value_num)
         df["year"] = df["year"].astype(int)
         
         # Build dropdown list for countries
@@ -5529,45 +5408,45 @@ def init_callbacks(dash_app):
             
         # x only
         elif dropdown_choicesX != None and dropdown_choicesY == None and dropdown_choicesZ == None:   
-            dfx = np.sort(pd.unique(pd.DataFrame(pop[(pop['dataset_raw']==dropdown_choicesX)], columns=['year'])['year'].astype(int)))
+            dfx = d.get_year_array(year_catalogue, dropdown_choicesX)
             years = dfx
             for i in range(0,len(years)):
                 dropdownyear.append({'label': years[i], 'value': years[i]}) 
         
         # x y only
         elif dropdown_choicesX != None and dropdown_choicesY != None and dropdown_choicesZ == None:
-            dfx = np.sort(pd.unique(pd.DataFrame(pop[(pop['dataset_raw']==dropdown_choicesX)], columns=['year'])['year'].astype(int)))
-            dfy = np.sort(pd.unique(pd.DataFrame(pop[(pop['dataset_raw']==dropdown_choicesY)], columns=['year'])['year'].astype(int)))
+            dfx = d.get_year_array(year_catalogue, dropdown_choicesX)
+            dfy = d.get_year_array(year_catalogue, dropdown_choicesY)
             years = reduce(np.intersect1d,(dfx,dfy))
             for i in range(0,len(years)):
                 dropdownyear.append({'label': years[i], 'value': years[i]})  
         
         # x z only
         elif dropdown_choicesX != None and dropdown_choicesY == None and dropdown_choicesZ != None:
-            dfx = np.sort(pd.unique(pd.DataFrame(pop[(pop['dataset_raw']==dropdown_choicesX)], columns=['year'])['year'].astype(int)))        
-            dfz = np.sort(pd.unique(pd.DataFrame(pop[(pop['dataset_raw']==dropdown_choicesZ)], columns=['year'])['year'].astype(int)))
+            dfx = d.get_year_array(year_catalogue, dropdown_choicesX)        
+            dfz = d.get_year_array(year_catalogue, dropdown_choicesZ)
             years = reduce(np.intersect1d,(dfx,dfz))      
             for i in range(0,len(years)):
                 dropdownyear.append({'label': years[i], 'value': years[i]})  
         
         # y only
         elif dropdown_choicesX == None and dropdown_choicesY != None and dropdown_choicesZ == None:    
-            dfy = np.sort(pd.unique(pd.DataFrame(pop[(pop['dataset_raw']==dropdown_choicesY)], columns=['year'])['year'].astype(int)))
+            dfy = d.get_year_array(year_catalogue, dropdown_choicesY)
             years = dfy
             for i in range(0,len(years)):
                 dropdownyear.append({'label': years[i], 'value': years[i]})
         
         # y z only
         elif dropdown_choicesX == None and dropdown_choicesY != None and dropdown_choicesZ != None:         
-            dfy = np.sort(pd.unique(pd.DataFrame(pop[(pop['Series']==dropdown_choicesY)], columns=['year'])['year'].astype(int)))
-            dfz = np.sort(pd.unique(pd.DataFrame(pop[(pop['Series']==dropdown_choicesZ)], columns=['year'])['year'].astype(int)))       
+            dfy = d.get_year_array(year_catalogue, dropdown_choicesY)
+            dfz = d.get_year_array(year_catalogue, dropdown_choicesZ)       
             years = reduce(np.intersect1d,(dfy,dfz))        
             for i in range(0,len(years)):
                 dropdownyear.append({'label': years[i], 'value': years[i]})
         
         # z only
         elif dropdown_choicesX == None and dropdown_choicesY == None and dropdown_choicesZ != None:
-            dfz = np.sort(pd.unique(pd.DataFrame(pop[(pop['Series']==dropdown_choicesZ)], columns=['year'])['year'].astype(int)))
+            dfz = d.get_year_array(year_catalogue, dropdown_choicesZ)
             years = dfz
             for i in range(0,len(years)):
                 dropdownyear.append({'label': years[i], 'value': years[i]})
@@ -5577,9 +5456,9 @@ def init_callbacks(dash_app):
             #query master dataset based on the 3 choices and produce a unique list of years for each (i.e. the years data is available for each set)
             print("Dropdown choices are: ",dropdown_choicesX, dropdown_choicesY, dropdown_choicesZ)
             
-            dfx = np.sort(pd.unique(pd.DataFrame(pop[(pop['dataset_raw']==dropdown_choicesX)], columns=['year'])['year'].astype(int)))
-            dfy = np.sort(pd.unique(pd.DataFrame(pop[(pop['dataset_raw']==dropdown_choicesY)], columns=['year'])['year'].astype(int)))
-            dfz = np.sort(pd.unique(pd.DataFrame(pop[(pop['dataset_raw']==dropdown_choicesZ)], columns=['year'])['year'].astype(int)))
+            dfx = d.get_year_array(year_catalogue, dropdown_choicesX)
+            dfy = d.get_year_array(year_catalogue, dropdown_choicesY)
+            dfz = d.get_year_array(year_catalogue, dropdown_choicesZ)
             
             print("Length of year arrays dfx, dfy, dfz :",len(dfx), len(dfy), len(dfz))
             
@@ -5680,13 +5559,8 @@ def init_callbacks(dash_app):
         dropdownToppings=[]
         for i in range(0,len(dd)): dropdownToppings.append({'label': dd[i].get("dataset_label"), 'value': dd[i].get("dataset_raw")})
                 
-        #If no dcc store states returned for colorbar, set to defaults
-        if colorbar_style == None: colorbar_style = INIT_COLOR_PALETTE        
-        if colorbar_reverse == None: colorbar_reverse = INIT_COLOR_PALETTE_REVERSE
-            
         #Fashion sunburst colour input as a string in the form "blue" or "blue_r" for reverse
-        if colorbar_reverse == False: colorbar_sb = geomap_colorscale[int(colorbar_style)]
-        else: colorbar_sb = geomap_colorscale[int(colorbar_style)]+"_r"      
+        colorbar_sb = get_sunburst_colorscale(colorbar_style, colorbar_reverse)
 
         # tweak this to autoselect a quantitative series
         if trigger == "sunburst-button":
@@ -5698,7 +5572,7 @@ def init_callbacks(dash_app):
             # if no second series
             if color == None:
                 # check availble yrs and set to most recent, plus set the store year value
-                availyrs = np.sort(pd.unique(pd.DataFrame(pop[(pop['Series']==series)], columns=['year'])['year'].astype(int)))
+                availyrs = d.get_year_array(year_catalogue, series)
                 #logger.info("Sunny busty Button push, avail yrs for this dataset are %r", availyrs)
                 year = str(availyrs[-1])
                 store_year = year
@@ -5707,8 +5581,8 @@ def init_callbacks(dash_app):
                 #find intersect years 
                 x = series
                 y = color                 
-                dfx = np.sort(pd.unique(pd.DataFrame(pop[(pop['dataset_raw']==x)], columns=['year'])['year'].astype(int)))
-                dfy = np.sort(pd.unique(pd.DataFrame(pop[(pop['dataset_raw']==y)], columns=['year'])['year'].astype(int)))
+                dfx = d.get_year_array(year_catalogue, x)
+                dfy = d.get_year_array(year_catalogue, y)
                 years = reduce(np.intersect1d,(dfx,dfy))
                 #logger.info("Intersect availble years with %r and %r is %r",x,y,years)            
                 year = str(years[-1])
@@ -5736,7 +5610,7 @@ def init_callbacks(dash_app):
             if store_toppings == None:
                 color = None
                 #logger.info("No second datset found, setting to most recent year")
-                year = str(np.sort(pd.unique(pd.DataFrame(pop[(pop['dataset_raw']==series)], columns=['year'])['year'].astype(int)))[-1])        
+                year = str(d.get_year_array(year_catalogue, series)[-1])        
             
             else:        
                 
@@ -5745,8 +5619,8 @@ def init_callbacks(dash_app):
                 #find intersect years 
                 x = series
                 y = color
-                dfx = np.sort(pd.unique(pd.DataFrame(pop[(pop['dataset_raw']==x)], columns=['year'])['year'].astype(int)))
-                dfy = np.sort(pd.unique(pd.DataFrame(pop[(pop['dataset_raw']==y)], columns=['year'])['year'].astype(int)))
+                dfx = d.get_year_array(year_catalogue, x)
+                dfy = d.get_year_array(year_catalogue, y)
                 years = reduce(np.intersect1d,(dfx,dfy))
                 #logger.info("Intersect availble years with %r and %r is %r",x,y,years)
                 
@@ -5774,8 +5648,8 @@ def init_callbacks(dash_app):
             x = series
             y = ddv_toppings
             
-            dfx = np.sort(pd.unique(pd.DataFrame(pop[(pop['dataset_raw']==x)], columns=['year'])['year'].astype(int)))
-            dfy = np.sort(pd.unique(pd.DataFrame(pop[(pop['dataset_raw']==y)], columns=['year'])['year'].astype(int)))
+            dfx = d.get_year_array(year_catalogue, x)
+            dfy = d.get_year_array(year_catalogue, y)
             years = reduce(np.intersect1d,(dfx,dfy))
             #logger.info("Intersect availble years with %r and %r is %r",x,y,years)
             
@@ -5822,7 +5696,7 @@ def init_callbacks(dash_app):
         State("year-slider", "value"),  
         State("year-slider", "marks"),
         State('my-settings_json_store', 'data'),
-        State("geomap_figure", "figure"),
+        State("my-map-colorscale", "data"),
         State("my-settings_colorbar_reverse_store", 'data'),
         State("my-url-series", 'data'),
         State('url','href'),  
@@ -5832,7 +5706,7 @@ def init_callbacks(dash_app):
         prevent_initial_call=True,
     )
     #@cache.memoize(timeout=CACHE_TIMEOUT)
-    def callback_toggle_modal_globe(globe_trigger, n1, n2, n3, n4, is_open, series, yearid, yeardict, settings_json, map_data, colorbar_reverse, url_series, href, url_view, url_year):
+    def callback_toggle_modal_globe(globe_trigger, n1, n2, n3, n4, is_open, series, yearid, yeardict, settings_json, map_colorscale, colorbar_reverse, url_series, href, url_view, url_year):
         
         #first check triggers and context 
         ctx = dash.callback_context 
@@ -5851,7 +5725,7 @@ def init_callbacks(dash_app):
                 year = url_year
                 series = api_dict_label_to_raw[url_series]            
                 
-        else: year = str(d.get_years(pop.loc[(pop['dataset_raw'] == series)])[yearid])
+        else: year = str(d.get_years(year_catalogue, series)[yearid])
         
         # set variables      
         series_label = master_config[series].get("dataset_label")
@@ -5863,22 +5737,13 @@ def init_callbacks(dash_app):
         high_res = False    
         
         #Store continuous colorscale from map data and reverse if necessary    
-        try:
-            continuous_colorscale = map_data['data'][0]['colorscale'] #a list of colours e.g. [1.1111, #hexcolour] (does not reverse)
-        except KeyError as error:
+        if map_colorscale == None:
             print("Breaking out of globe callback. Map not ready")
             raise PreventUpdate()
+        continuous_colorscale = map_colorscale #a list of colours e.g. [1.1111, #hexcolour] (does not reverse)
         
-        #Check if needs to be reversed from DCC store
+        #Check if needs to be reversed from DCC store. The colour engine flips the colours itself (the colorscale is never modified)
         if colorbar_reverse == None: colorbar_reverse = INIT_COLOR_PALETTE_REVERSE
-            
-        #If not default, then reverse the colorscale (only thet second element of each element)
-        if colorbar_reverse == False:
-            #deep copy the array (prevents problems with assigning data)
-            csr = copy.deepcopy(continuous_colorscale)        
-            #reverse the colorscale
-            csr = csr[::-1]      
-            for i in range(0,len(csr)): continuous_colorscale[i][1] = csr[i][1]  
         
         if trigger == 'modal-globe-jelly':  jellybean = True        
         if trigger == 'modal-globe-ne50m':  high_res = True
@@ -5889,16 +5754,16 @@ def init_callbacks(dash_app):
         url = root + api_dict_raw_to_label[series] + '/'+str(year)+'/globe'
                 
         #subset df
-        df = pop[(pop["year"] == int(year)) & (pop["dataset_raw"] == series)].copy()  
+        df = d.get_pop_slice(pop, pop_index, series, int(year)).copy()  
         
         #update json for the two main resolution scenarios
         if not high_res:
-            gj_land = d.update_3d_geo_data_JSON(df, geojson_globe_land_ne110m, continuous_colorscale, jellybean, var_type, discrete_colorscale) 
-            gj_ocean = d.update_3d_geo_data_JSON(df, geojson_globe_ocean_ne110m, continuous_colorscale, jellybean, var_type, discrete_colorscale)
+            gj_land = d.update_3d_geo_data_JSON(df, GLOBE_GEOMETRY["land_ne110m"], GLOBE_FEATURE_INDEX["land_ne110m"], continuous_colorscale, colorbar_reverse, jellybean, var_type, discrete_colorscale)
+            gj_ocean = d.update_3d_geo_data_JSON(df, GLOBE_GEOMETRY["ocean_ne110m"], GLOBE_FEATURE_INDEX["ocean_ne110m"], continuous_colorscale, colorbar_reverse, jellybean, var_type, discrete_colorscale)
         
         else:
-            gj_land = d.update_3d_geo_data_JSON(df, geojson_globe_land_ne50m, continuous_colorscale, jellybean, var_type, discrete_colorscale) 
-            gj_ocean = d.update_3d_geo_data_JSON(df, geojson_globe_ocean_ne50m, continuous_colorscale, jellybean, var_type, discrete_colorscale)
+            gj_land = d.update_3d_geo_data_JSON(df, GLOBE_GEOMETRY["land_ne50m"], GLOBE_FEATURE_INDEX["land_ne50m"], continuous_colorscale, colorbar_reverse, jellybean, var_type, discrete_colorscale)
+            gj_ocean = d.update_3d_geo_data_JSON(df, GLOBE_GEOMETRY["ocean_ne50m"], GLOBE_FEATURE_INDEX["ocean_ne50m"], continuous_colorscale, colorbar_reverse, jellybean, var_type, discrete_colorscale)
         
         #create globe
         globe = create_chart_globe(gj_land, gj_ocean) 
@@ -5935,7 +5800,7 @@ def init_callbacks(dash_app):
         State("year-slider", "value"),  
         State("year-slider", "marks"),
         State('my-settings_json_store', 'data'),
-        State("geomap_figure", "figure"),
+        State("my-map-colorscale", "data"),
         State("my-settings_colorbar_reverse_store", 'data'),
         State('url','href'),  
         State("my-url-series", 'data'),
@@ -5944,7 +5809,7 @@ def init_callbacks(dash_app):
         ], 
         prevent_initial_call=True,
     )
-    def callback_toggle_modal_jigsaw(jigsaw_trigger, n1, n2, n3, is_open, series, yearid, yeardict, settings_json, map_data, colorbar_reverse,href, url_series, url_view, url_year):
+    def callback_toggle_modal_jigsaw(jigsaw_trigger, n1, n2, n3, is_open, series, yearid, yeardict, settings_json, map_colorscale, colorbar_reverse,href, url_series, url_view, url_year):
         
         #first check triggers and context 
         ctx = dash.callback_context 
@@ -5963,7 +5828,7 @@ def init_callbacks(dash_app):
                 year = url_year
                 series = api_dict_label_to_raw[url_series]  
         
-        else: year = str(d.get_years(pop.loc[(pop['dataset_raw'] == series)])[yearid])
+        else: year = str(d.get_years(year_catalogue, series)[yearid])
         
         #Gather variables we need    
         series_label = master_config[series].get("dataset_label")
@@ -5973,30 +5838,20 @@ def init_callbacks(dash_app):
         jellybean = False         
             
         #determine colorscale and whether it is reverse/normal
-        colorscale = map_data['data'][0]['colorscale'] #an list of colours e.g. [1.1111, #hexcolour] (does not reverse)
+        if map_colorscale == None:
+            print("Breaking out of jigsaw callback. Map not ready")
+            raise PreventUpdate()
+        colorscale = map_colorscale #an list of colours e.g. [1.1111, #hexcolour] (does not reverse)
         
         #default
         if colorbar_reverse == None:  colorbar_reverse = INIT_COLOR_PALETTE_REVERSE        
         
-        #Logic to reverse colorscale. It seems counterintuitive. Don't ask, this is fucky logic but it works. It's because I can't control underlying map color array
-        #it could be to do is all my dev was done on the initial color setting being false, which means I built the logic on the color array I return from map around that, which was originally already reversed.
-        if colorbar_reverse == False:
-            #print("REVERSING COLORSCALE!!")
-            #deep copy the array (prevents problems with assigning data)
-            csr = copy.deepcopy(colorscale)        
-            #reverse the colorscale
-            csr = csr[::-1]      
-            for i in range(0,len(csr)):
-                colorscale[i][1] = csr[i][1] 
-        
-        #make a deep copy of the json data 
-        if settings_json is None: gj = copy.deepcopy(geojson_LOWRES)
-            
-        else:
-            #logger.info("Area51 callback: dcc store for geojson found, loading")        
-            if int(settings_json) == 0: gj = copy.deepcopy(geojson_LOWRES)           
-            elif int(settings_json)==1: gj = copy.deepcopy(geojson_MEDRES)          
-            elif int(settings_json)==2: gj = copy.deepcopy(geojson_HIRES)
+        #Logic to reverse colorscale. It seems counterintuitive. It's because I can't control underlying map color array, the colours
+        #from the map are the other way round to the colour engine (d.get_color_lut), so it's only flipped when reverse is set. The colorscale is never modified.
+        
+        #border resolution (the shared geometry, create_chart_geobar builds its own feature data on top)
+        if settings_json is None: geometry = GEOMETRY_RESOLUTIONS[0]
+        else: geometry = GEOMETRY_RESOLUTIONS[int(settings_json)]
         
         if trigger == 'modal-geobar-jelly': jellybean = True           
         
@@ -6006,7 +5861,7 @@ def init_callbacks(dash_app):
         url = root + api_dict_raw_to_label[series] + '/'+str(year)+'/jigsaw'        
 
         # build figure  
-        geobar = create_chart_geobar(series, year, colorscale, gj, jellybean)        
+        geobar = create_chart_geobar(series, year, colorscale, colorbar_reverse, geometry, jellybean)        
         
         # keep modal open in these conditions
         if trigger == 'modal-geobar-jelly': is_open = not is_open 
@@ -6105,7 +5960,7 @@ def init_callbacks(dash_app):
         # build dropdown list of unique countries  
         
         # Find the unique countries for this dataset (all years) and sort 
-        dd = np.sort(pd.unique(pop["country"])) #numpy array     
+        dd = np.sort(countries['country'].to_numpy()) #numpy array (every country in the dimension table has data)     
         
         #refresh list of country labels and vals for the dropdown
         dropdown_countries=[]
@@ -6114,8 +5969,8 @@ def init_callbacks(dash_app):
 
         # build dropdown list of unique series
         
-        # Find the unique series for this dataset (all years) and sort 
-        dd = np.sort(pd.unique(pop["dataset_raw"])) 
+        # every series in the master dataset, sorted (from the offsets index, no scan)
+        dd = sorted(pop_index["series"]) 
         
         #drop first 10 rows as they are horrible
         dd = dd[17:]
@@ -6127,8 +5982,8 @@ def init_callbacks(dash_app):
 
         # build dropdown list of unique years
         
-        # Find the unique series for this dataset (all years) and sort 
-        dd = np.sort(pd.unique(pop["year"])) 
+        # every year with data in any series (precomputed at startup from the year catalogue)
+        dd = YEARS 
 
         #refresh list of year labels for the dropdown
         dropdown_years=[]
@@ -6157,6 +6012,28 @@ def init_callbacks(dash_app):
         return is_open, series, None, ''
 
 
+    # fill a navbar category with its dataset items the first time it is opened (see js_callback_clientside_navbar)
+    @dash_app.callback(
+        Output({"type": "navcat-menu", "index": MATCH}, 'children'),
+        Input({"type": "navcat-request", "index": MATCH}, 'data'),
+        prevent_initial_call=True
+        )
+    def callback_navbar_items(request):
+        if request != True: raise PreventUpdate()
+        return get_navbar_items(dash.callback_context.inputs_list[0]["id"]["index"])
+
+
+    # fill the static content of a modal the first time it opens (see js_callback_clientside_modal_content)
+    @dash_app.callback(
+        Output({"type": "modal-content", "modal": MATCH, "part": ALL}, 'children'),
+        Input({"type": "modal-request", "modal": MATCH}, 'data'),
+        prevent_initial_call=True
+        )
+    def callback_modal_content(request):
+        if request != True: raise PreventUpdate()
+        return [get_modal_content(o["id"]["modal"], o["id"]["part"]) for o in dash.callback_context.outputs_list]
+
+
     # clear the search box after any search or nav menu selection
     @dash_app.callback(
         Output("nav-search-menu", 'value'),
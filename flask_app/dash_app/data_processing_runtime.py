@@ -1,16 +1,36 @@
 # This file contains all helper functions required by main app at run-time
 
 import json
+import pickle
+import hashlib
+import gzip
 import pandas as pd
 import numpy as np
-import matplotlib as mpl #colour
-import copy
 import time
 from PIL import ImageColor
 import os
-from datetime import datetime, timedelta
-from azure.storage.blob import BlobServiceClient, generate_blob_sas, BlobSasPermissions, BlobClient, ContainerClient
+import glob
+import traceback
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+import sys
 
+# shared storage backend (azure or local lake) lives with the data pipeline scripts
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'data')))
+from storage import get_storage
+
+try:
+    import fcntl #file locking so only one gunicorn worker builds the master stats snapshot (not available on windows)
+except ImportError:
+    fcntl = None
+
+
+MASTER_STATS_SNAPSHOT_FORMAT = 1 #bump when type_pop_values/type_pop_countries/build_pop_index change what goes in the master stats snapshot, so old snapshots are rebuilt
+COLOR_LUT_SIZE = 1024 #entries per compiled colorscale (finer than the 8 bit colour steps between neighbouring stops)
+_color_luts = {} #compiled colorscales, see get_color_lut
 
 def get_list_of_dataset_labels_and_raw(master_config,var_type):
 
@@ -101,56 +121,349 @@ def read_master_config(set_key_list, account_name, account_key, container_name,
 
 def read_blob(account_name, account_key, container_name, filepath, data_format, return_format):
     # A generic function for reading files from blob
+    # Everything goes through the local blob cache (see get_cached_blob) and is parsed from local disk
     print("Attempting to read file:",filepath,"from Azure blob container:",container_name)
     
-    
-    
     if data_format == 'json':
         # presently all json files are returned as json
-        constr = 'DefaultEndpointsProtocol=https;AccountName=' + account_name + ';AccountKey=' + account_key + ';EndpointSuffix=core.windows.net'
-        blob_service_client = BlobServiceClient.from_connection_string(constr)
-        container_client = blob_service_client.get_container_client(container_name)
-        blob_client = container_client.get_blob_client(filepath)
-        streamdownloader = blob_client.download_blob()
-        file = json.loads(streamdownloader.readall())
+        local_path, etag = get_cached_blob(account_name, account_key, container_name, filepath)
+        with open(local_path, 'rb') as f:
+            file = json.load(f)
         return file
     
     elif data_format == 'parquet' and return_format == 'dataframe':
         # read parquet, return dataframe
-        #generate a shared access signature for the file
-        sas_i = generate_blob_sas(account_name = account_name,
-                                     container_name = container_name,
-                                     blob_name = filepath,  # statistics/master_stats.parquet
-                                     account_key=account_key,
-                                     permission=BlobSasPermissions(read=True),
-                                     expiry=datetime.utcnow() + timedelta(hours=1))
-
-        #build sas URL using new sas sig
-        sas_url = 'https://' + account_name+'.blob.core.windows.net/' + container_name + '/' + filepath + '?' + sas_i            
-        df = pd.read_parquet(sas_url)
+        local_path, etag = get_cached_blob(account_name, account_key, container_name, filepath)
+        df = read_parquet_local(local_path)
         return df
     
     elif data_format == 'csv' and return_format == 'dataframe':
-        #read csv, return parquet
-        
-        #generate a shared access signature for the file
-        sas_i = generate_blob_sas(account_name = account_name,
-                                     container_name = container_name,
-                                     blob_name = filepath,  # statistics/master_stats.parquet
-                                     account_key=account_key,
-                                     permission=BlobSasPermissions(read=True),
-                                     expiry=datetime.utcnow() + timedelta(hours=1))
-
-        #build sas URL using new sas sig
-        sas_url = 'https://' + account_name+'.blob.core.windows.net/' + container_name + '/' + filepath + '?' + sas_i
-        df = pd.read_csv(sas_url)
+        #read csv, return dataframe
+        local_path, etag = get_cached_blob(account_name, account_key, container_name, filepath)
+        df = pd.read_csv(local_path)
         return df
  
     else:
         print('ERROR trying to open file on blob')
         
+
+def get_cached_blob(account_name, account_key, container_name, filepath):
+    # Local on-disk blob cache so restarts don't re-download hundreds of MB from Azure.
+    # Each blob is kept at <ATLAS_BLOB_CACHE_DIR>/<container>/<filepath> with its etag and last modified time in a .meta.json beside it.
+    # Online: conditional download (If-None-Match etag), so an unchanged blob costs one 304 round trip and is then read from local disk.
+    # If Azure can't be reached but we have a cached copy, we warn and use it (crash recovery shouldn't depend on blob bandwidth).
+    # Offline (ATLAS_OFFLINE=1): never touch Azure, just use the cache (error if the file was never cached).
+    # Returns (local file path, etag)
+    
+    cache_dir = os.getenv("ATLAS_BLOB_CACHE_DIR", "tmp/blob_cache")
+    download_concurrency = int(os.getenv("ATLAS_DOWNLOAD_CONCURRENCY", "4")) # parallel ranged GETs per blob (only kicks in for big blobs like master_stats.parquet)
+    offline = os.getenv("ATLAS_OFFLINE", "0").lower() in ["1", "true", "yes"]
+    
+    local_path = os.path.join(cache_dir, container_name, filepath)
+    meta_path = local_path + '.meta.json'
+    
+    # what have we got cached?
+    meta = None
+    if os.path.exists(local_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+    
+    if offline:
+        if meta == None: raise FileNotFoundError("Offline mode: " + filepath + " is not in the blob cache at " + cache_dir)
+        print("Offline mode, using cached copy of", filepath)
+        return local_path, meta["etag"].strip('"')
+    
+    storage = get_storage(account_name, account_key)
+    
+    # local lake backend, the file is already on disk so there's nothing to cache
+    lake_path = storage.local_path(container_name, filepath)
+    if lake_path != None:
+        return lake_path, storage.get_properties(container_name, filepath)["etag"].strip('"')
+    
+    # new or changed blob gets streamed to disk (temp file then rename, so other workers/threads never read half a file)
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    tmp_suffix = '.tmp' + str(os.getpid()) + '_' + str(threading.get_ident())
+    
+    try:
+        with open(local_path + tmp_suffix, 'wb') as f:
+            props = storage.download_to_file(container_name, filepath, f, etag=meta["etag"] if meta != None else None, max_concurrency=download_concurrency)
+    
+    except Exception as error:
+        if os.path.exists(local_path + tmp_suffix): os.remove(local_path + tmp_suffix)
+        if meta == None: raise
+        print("WARNING could not revalidate", filepath, "with Azure, using cached copy. Error:", repr(error))
+        return local_path, meta["etag"].strip('"')
+    
+    if props == None:
+        os.remove(local_path + tmp_suffix)
+        print("Blob cache hit (not modified):", filepath)
+        return local_path, meta["etag"].strip('"')
+    
+    os.replace(local_path + tmp_suffix, local_path)
+    
+    meta = {"etag": props["etag"], "last_modified": props["last_modified"]}
+    with open(meta_path + tmp_suffix, 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + tmp_suffix, meta_path)
+    
+    print("Blob cached:", filepath, "etag", meta["etag"])
+    return local_path, meta["etag"].strip('"')
+
+
+def read_parquet_local(path):
+    # read a parquet file straight off local disk into arrow (memory mapped, so no intermediate python bytes copy) then into pandas
+    table = pq.read_table(path, memory_map=True)
+    return table.to_pandas()
+
+
+def load_in_parallel(jobs, max_workers):
+    # Run a dict of startup load jobs {name: (function, args)} concurrently on a bounded thread pool.
+    # Blob downloads are network bound (and parquet/json parsing mostly releases the GIL) so threads give us a decent speedup on cold start.
+    # Prints the time taken for each artifact and the total. If any job raises, or returns None (e.g. read_blob with a bad format),
+    # we finish the rest then raise a RuntimeError listing every failed artifact, so the app never boots half loaded.
+    # Returns dict {name: result}.
+    
+    print("Loading", len(jobs), "artifacts with", max_workers, "threads...")
+    tic = time.perf_counter()
+    
+    def timed(func, args):
+        t0 = time.perf_counter()
+        result = func(*args)
+        return result, time.perf_counter() - t0
+    
+    results = {}
+    failures = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="loader") as pool:
+        futures = {name: pool.submit(timed, jobs[name][0], jobs[name][1]) for name in jobs}
+        for name in futures:
+            try:
+                result, seconds = futures[name].result()
+            except Exception as error:
+                print("FAILED to load", name, ":", repr(error))
+                traceback.print_exc()
+                failures[name] = repr(error)
+                continue
+            if result is None:
+                print("FAILED to load", name, ": nothing returned")
+                failures[name] = "nothing returned"
+                continue
+            print("Loaded", name, "in", round(seconds, 2), "seconds")
+            results[name] = result
+    
+    print("Loaded", len(results), "of", len(jobs), "artifacts in", round(time.perf_counter() - tic, 2), "seconds")
+    
+    if len(failures) > 0:
+        raise RuntimeError("Failed to load startup artifacts: " + ", ".join(name + " (" + failures[name] + ")" for name in failures))
+    
+    return results
+
+
+def read_master_stats(account_name, account_key, container_name, filepath, countries_filepath, master_config, snapshot_dir):
+    # Read master stats via a local memory-mapped Arrow IPC (Feather v2) snapshot.
+    # The first gunicorn worker to boot downloads the parquet, types and sorts it (see type_pop_values/build_pop_index)
+    # and writes it uncompressed to snapshot_dir. Every worker then memory-maps that file, so they all share the same
+    # physical pages (OS page cache) instead of each holding its own 1GB copy of pop. This is what lets us run N workers on one VM.
+    # The parquet comes through the blob cache, and the snapshot file name carries its etag, so a new master stats upload in titanium gets a new snapshot.
+    # The name also carries MASTER_STATS_SNAPSHOT_FORMAT, so a deploy that changes the snapshot schema doesn't map a stale file built by the old code.
+    # The country dimension table (see type_pop_countries) is snapshotted right beside it.
+    # Returns (pop, countries), pop already sorted by (dataset_raw, year, country_id), so call build_pop_index(pop, countries, presorted=True).
+    
+    os.makedirs(snapshot_dir, exist_ok=True)
+    local_path, etag = get_cached_blob(account_name, account_key, container_name, filepath)
+    snapshot_path = os.path.join(snapshot_dir, os.path.basename(filepath).replace('.parquet', '') + '.v' + str(MASTER_STATS_SNAPSHOT_FORMAT) + '.' + etag + '.arrow')
+    countries_path = snapshot_path.replace('.arrow', '.countries.arrow')
+    
+    # one worker builds, the others block on the lock and then just map the finished file
+    with open(snapshot_path + '.lock', 'w') as lock:
+        if fcntl != None: fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if not os.path.exists(snapshot_path):
+                print("Building master stats snapshot:", snapshot_path)
+                pop = read_parquet_local(local_path)
+                pop = type_pop_values(pop, master_config)
+                pop, countries = type_pop_countries(pop, account_name, account_key, container_name, countries_filepath)
+                pop, pop_index = build_pop_index(pop, countries)
+                write_arrow_snapshot(countries, countries_path) # (pop is written last, its file existing means both are done)
+                write_arrow_snapshot(pop, snapshot_path)
+                del pop, pop_index, countries
+                
+                # clean out snapshots from older versions of the blob
+                for old in glob.glob(os.path.join(snapshot_dir, os.path.basename(filepath).replace('.parquet', '') + '.*.arrow')):
+                    if old != snapshot_path and old != countries_path:  
+                        try: 
+                            os.remove(old)
+                            if os.path.exists(old + '.lock'): os.remove(old + '.lock')
+                        except OSError as error: print("Could not remove old snapshot", old, error)
+        finally:
+            if fcntl != None: fcntl.flock(lock, fcntl.LOCK_UN)
     
+    return read_arrow_snapshot(snapshot_path), read_arrow_snapshot(countries_path)
+
+
+def type_pop_countries(pop, account_name, account_key, container_name, countries_filepath):
+
+    # Titanium master stats carries a small integer country_id instead of repeated country/continent/region columns, and the country
+    # dimension (country_id, m49_un_a3, country, su_a3, continent, region_un, region_wb) is its own blob. country_id is the row position in it.
+    # If we've been handed an older master stats file that still has the country columns, split the dimension out here (once, at load).
+
+    if 'country_id' in pop.columns:
+        local_path, etag = get_cached_blob(account_name, account_key, container_name, countries_filepath)
+        countries = read_parquet_local(local_path).sort_values('country_id').reset_index(drop=True)
+        return pop, countries
+
+    print('Country key not found in master stats, building the country dimension from the country columns...')
+
+    columns = [c for c in ['m49_un_a3', 'country', 'su_a3', 'continent', 'region_un', 'region_wb'] if c in pop.columns]
+    codes, uniques = pd.factorize(pop['m49_un_a3'], sort=True)
+    ids, first_rows = np.unique(codes, return_index=True)
+
+    countries = pop.iloc[first_rows[ids >= 0]][columns].astype(str).reset_index(drop=True)
+    countries.insert(0, 'country_id', np.arange(len(countries), dtype='uint16'))
+
+    pop = pop[codes >= 0].drop(columns=columns)
+    pop.insert(0, 'country_id', codes[codes >= 0].astype('uint16'))
+
+    return pop, countries
+
+
+def join_countries(df, countries):
+
+    # Give a slice of pop its country columns back from the dimension table (m49_un_a3, country, continent), by integer key.
+    # country_id is the row position in countries, so this is a take, no join. Columns come out in the old master stats order.
+
+    ids = df['country_id'].to_numpy()
+    df = df.copy()
+    df.insert(1, 'm49_un_a3', countries['m49_un_a3'].to_numpy()[ids])
+    df.insert(2, 'country', countries['country'].to_numpy()[ids])
+    df['continent'] = countries['continent'].to_numpy()[ids]
+    return df
+
+
+def get_country_ids(countries, names):
+    # country_id of each country name (-1 if unknown), for filtering pop by key instead of comparing names
+    lookup = dict(zip(countries['country'].tolist(), range(len(countries))))
+    return [lookup.get(name, -1) for name in names]
+
+
+def write_arrow_snapshot(df, path):
+    # write df as an uncompressed Arrow IPC (Feather v2) file so it can be memory-mapped zero-copy.
+    # Floats are written with NaN kept as NaN (not arrow nulls) so they map straight back into numpy without a copy.
+    # Written to a temp file then renamed, so a reader never sees a half written snapshot.
+    
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for col in df.columns:
+        if df[col].dtype.kind == 'f':
+            table = table.set_column(table.schema.get_field_index(col), col, pa.array(df[col].to_numpy(), from_pandas=False))
+    
+    tmp_path = path + '.tmp' + str(os.getpid())
+    feather.write_feather(table, tmp_path, compression='uncompressed')
+    os.replace(tmp_path, path)
+    
+
+def read_arrow_snapshot(path):
+    # memory-map an Arrow IPC snapshot and wrap it as a pandas df. split_blocks stops pandas consolidating
+    # columns into new 2D blocks, so numeric columns stay backed by the mapped file (read only, so never mutate pop in place).
+    
+    table = feather.read_table(path, memory_map=True)
+    return table.to_pandas(split_blocks=True)
+
+
+def get_blob_etag(account_name, account_key, container_name, filepath):
+    # current etag of a blob, without downloading it (one HEAD request, or the blob cache meta when offline)
+    
+    if os.getenv("ATLAS_OFFLINE", "0").lower() in ["1", "true", "yes"]:
+        meta_path = os.path.join(os.getenv("ATLAS_BLOB_CACHE_DIR", "tmp/blob_cache"), container_name, filepath) + '.meta.json'
+        with open(meta_path) as f:
+            return json.load(f)["etag"].strip('"')
+    
+    return get_storage(account_name, account_key).get_properties(container_name, filepath)["etag"].strip('"')
+
+
+def get_state_version(etags, *params):
+    # version key for the startup state snapshot: the etags of every titanium input blob, plus anything else that changes
+    # the derived state (e.g. slider font settings). A new upload to titanium changes an etag, so the old snapshot is never read.
     
+    h = hashlib.sha1()
+    for name in sorted(etags):
+        h.update((name + '=' + str(etags[name]) + ';').encode('utf-8'))
+    for param in params:
+        h.update((str(param) + ';').encode('utf-8'))
+    return h.hexdigest()[:16]
+
+
+def read_state_snapshot(snapshot_dir, name, version):
+    # Load a piece of fully built startup state (config dicts, geojson, offsets index, navbar etc.) written by write_state_snapshot.
+    # Dicts/geometry are pickled (fast compact binary, much quicker to load than parsing json and rebuilding dicts in python loops).
+    # Returns None if there is no snapshot for this version (or it can't be read), in which case the caller rebuilds and writes one.
+    
+    path = os.path.join(snapshot_dir, 'state_' + name + '.' + version + '.pkl')
+    if not os.path.exists(path): return None
+    
+    try:
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        
+        # tables and arrays are kept beside the pickle as memory-mapped arrow/npy files
+        for key in state.get("_arrow_tables", []):
+            state[key] = read_arrow_snapshot(path.replace('.pkl', '.' + key + '.arrow'))
+        for key in state.get("_numpy_arrays", []):
+            state[key] = np.load(path.replace('.pkl', '.' + key + '.npy'), mmap_mode='r')
+        state.pop("_arrow_tables", None)
+        state.pop("_numpy_arrays", None)
+        
+        print("Loaded startup state snapshot:", path)
+        return state
+    
+    except Exception as error:
+        print("WARNING could not read startup state snapshot", path, "rebuilding. Error:", repr(error))
+        return None
+
+
+def write_state_snapshot(snapshot_dir, name, version, state):
+    # Write a dict of startup state for read_state_snapshot. Dataframe values go to Arrow (see write_arrow_snapshot), numpy arrays to .npy
+    # (both memory-mapped on read, so workers share one copy), everything else is pickled.
+    # Temp file then rename, so if several workers race to write the same version they just overwrite each other with identical files.
+    # Snapshots from older versions are removed.
+    
+    os.makedirs(snapshot_dir, exist_ok=True)
+    path = os.path.join(snapshot_dir, 'state_' + name + '.' + version + '.pkl')
+    
+    state = dict(state)
+    state["_arrow_tables"] = []
+    state["_numpy_arrays"] = []
+    for key in list(state.keys()):
+        if isinstance(state[key], pd.DataFrame):
+            write_arrow_snapshot(state[key], path.replace('.pkl', '.' + key + '.arrow'))
+            state["_arrow_tables"].append(key)
+            del state[key]
+        elif isinstance(state[key], np.ndarray):
+            array_path = path.replace('.pkl', '.' + key + '.npy')
+            with open(array_path + '.tmp' + str(os.getpid()), 'wb') as f:
+                np.save(f, state[key])
+            os.replace(array_path + '.tmp' + str(os.getpid()), array_path)
+            state["_numpy_arrays"].append(key)
+            del state[key]
+    
+    tmp_path = path + '.tmp' + str(os.getpid())
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    print("Wrote startup state snapshot:", path)
+    
+    for old in glob.glob(os.path.join(snapshot_dir, 'state_' + name + '.*')):
+        if not os.path.basename(old).startswith('state_' + name + '.' + version + '.'):
+            try: os.remove(old)
+            except OSError as error: print("Could not remove old state snapshot", old, error)
+
+
+def build_geometry_asset(geojson):
+    # Serialise a geojson once into a compact, gzipped, content-versioned asset for the /geometry/ endpoint.
+    # The etag is a hash of the content, so every worker (and every restart on the same data) gets the same URL,
+    # which lets browsers and nginx cache each border resolution once per data version.
+
+    raw = json.dumps(geojson, separators=(',', ':')).encode('utf-8')
+    return {"etag": hashlib.sha1(raw).hexdigest()[:16], "gzip": gzip.compress(raw, 9), "size": len(raw)}
+
 
 def create_api_lookup_dicts(master_config):
     
@@ -189,57 +502,259 @@ def create_api_lookup_dicts(master_config):
     return api_dict_raw_to_label, api_dict_label_to_raw
 
 
+def type_pop_values(pop, master_config):
+
+    # Titanium master stats carries typed value columns: value_num (float64) for everything numeric, and value_cat
+    # (dictionary encoded category) for the classes of discrete series and any other value that isn't a number. The app reads these directly so we never parse strings per request.
+    # If we've been handed an older master stats file with only the string 'value' column, build the typed columns here (once, at load).
+
+    if 'value_num' in pop.columns and 'value_cat' in pop.columns: return pop
+
+    print('Typed value columns not found in master stats, building value_num/value_cat from string values...')
+
+    discrete_series = [i for i in master_config if master_config[i].get("var_type") == "discrete"]
+    discrete_mask = pop['dataset_raw'].isin(discrete_series).to_numpy()
+
+    value_num = pd.to_numeric(pop['value'].astype(str).str.replace(",", "", regex=False), errors='coerce').astype('float64')
+    non_numeric = (value_num.isna() & pop['value'].notna() & ~pop['value'].astype(str).isin(['nan', 'None', ''])).to_numpy()
+    value_cat = pop['value'].astype(str).where(discrete_mask | non_numeric).astype('category')
+
+    # keep value_num in the old value position (4) and value_cat right after it
+    position = pop.columns.get_loc('value')
+    pop = pop.drop(columns=['value'])
+    pop.insert(position, 'value_num', value_num.to_numpy())
+    pop.insert(position+1, 'value_cat', pd.Categorical(value_cat))
+
+    return pop
+
+
+def get_value_column(var_type):
+
+    # discrete series carry their classes in value_cat, every other var_type is numeric in value_num
+    if var_type == "discrete": return 'value_cat'
+    return 'value_num'
+
+
+def build_pop_index(pop, countries, presorted=False):
+
+    # Sort the master stats df ONCE at load by (dataset_raw, year, country_id) so every series, and every series+year,
+    # sits in a contiguous block of rows. We then record the start/stop row offsets of each block in two dicts.
+    # This means callbacks can grab a series (or series+year) with pop.iloc[start:stop] in O(1) instead of
+    # scanning all ~15M rows of the categorical column with a boolean mask on every click.
+    # Returns the sorted df (with a fresh RangeIndex) and the offsets dict. The unsorted df can be thrown away.
+    # The offsets dict also carries the country dimension table, so get_pop_slice can give slices their country columns.
+
+    # (pass presorted=True for a snapshot that was already sorted by this function, so we don't copy a mapped df)
+    if presorted == False: pop = pop.sort_values(['dataset_raw', 'year', 'country_id'], kind='stable', ignore_index=True)
+
+    # integer codes for the series (no-op cast if already categorical) and the raw years
+    series_codes = pop['dataset_raw'].astype('category').cat.codes.to_numpy()
+    years = pop['year'].to_numpy()
+
+    # row positions where either the series or the year changes = block boundaries
+    if len(pop.index) > 0:
+        changes = np.flatnonzero((series_codes[1:] != series_codes[:-1]) | (years[1:] != years[:-1])) + 1
+        starts = np.concatenate(([0], changes))
+        stops = np.concatenate((changes, [len(pop.index)]))
+    else:
+        starts = stops = np.array([], dtype=np.int64)
+
+    block_series = pop['dataset_raw'].to_numpy()[starts]
+    block_years = years[starts]
+
+    series_offsets = {}
+    series_year_offsets = {}
+    for series, year, start, stop in zip(block_series, block_years, starts.tolist(), stops.tolist()):
+        series_year_offsets[(series, int(year))] = (start, stop)
+
+        # series blocks are contiguous too, so just stretch the stop offset as we walk the years
+        if series in series_offsets: series_offsets[series] = (series_offsets[series][0], stop)
+        else: series_offsets[series] = (start, stop)
+
+    pop_index = {"series":series_offsets, "series_year":series_year_offsets, "countries":countries}
+
+    return pop, pop_index
+
+
+def get_pop_slice(pop, pop_index, series, year=None):
+
+    # Return the contiguous block of rows for a series (all years), or a series+year if year is given.
+    # This is a positional slice of pop (no scan), with the country columns joined back on by integer key (see join_countries).
+    # Unknown series/year returns an empty df with the same columns (same as the old boolean mask did).
+
+    if year is None:
+        offsets = pop_index["series"].get(series)
+    else:
+        try:
+            offsets = pop_index["series_year"].get((series, int(year)))
+        except (TypeError, ValueError):
+            offsets = None
+
+    if offsets is None: return join_countries(pop.iloc[0:0], pop_index["countries"])
+
+    return join_countries(pop.iloc[offsets[0]:offsets[1]], pop_index["countries"])
+
+
+
+def build_value_cube(pop, pop_index):
+
+    # Dense value cube for the multi-series charts (bubble, sunburst), built once at startup.
+    # One row per (series, year) block of pop, in pop_index order, so a series' years are consecutive rows with no padding for years
+    # it doesn't have. One column per country_id (positions in the country dimension table).
+    # values: float32, NaN where there is no number. mask: True where pop has an observation for that series/year/country.
+    # Lining series up by country is then just picking rows (see get_cube_frame), no merges, intersections or string compares per request.
+
+    blocks = sorted(pop_index["series_year"].items(), key=lambda item: item[1][0])
+    rows = {key: i for i, (key, offsets) in enumerate(blocks)}
+    lengths = np.array([offsets[1] - offsets[0] for key, offsets in blocks], dtype=np.int64)
+    row_ids = np.repeat(np.arange(len(blocks), dtype=np.int32), lengths)
+
+    countries = pop_index["countries"]
+    country_ids = pop['country_id'].to_numpy()
+
+    values = np.full((len(blocks), len(countries)), np.nan, dtype=np.float32)
+    mask = np.zeros((len(blocks), len(countries)), dtype=bool)
+    values[row_ids, country_ids] = pop['value_num'].to_numpy(dtype=np.float32)
+    mask[row_ids, country_ids] = True
+
+    return {"values": values, "mask": mask, "rows": rows, "countries": countries}
+
+
+def get_cube_frame(cube, series_list, year):
+
+    # Line up several series for one year: a df of the countries with an observation in EVERY given series (m49_un_a3, country, continent)
+    # plus one float column per series (named by the series). Just row slices of the value cube, aligned by country id.
+
+    try:
+        rows = [cube["rows"].get((series, int(year))) for series in series_list]
+    except (TypeError, ValueError):
+        rows = [None]
+    if None in rows: return pd.DataFrame(columns=['m49_un_a3', 'country', 'continent'] + list(series_list))
+
+    present = np.logical_and.reduce(cube["mask"][rows], axis=0)
+    df = cube["countries"][['country_id', 'm49_un_a3', 'country', 'continent']][present].reset_index(drop=True)
+    for series, row in zip(series_list, rows):
+        df[series] = cube["values"][row, present]
+    return df
+
+
+def build_year_frames(pop, pop_index, year_catalogue, series):
+
+    # Every year of a (numeric) series as one compact payload for the clientside year scrubber (see js_callback_clientside_year_scrub).
+    # The countries in the series are sent once (m49 codes for the geojson join, names for the hover), then per year (in slider order)
+    # just the country positions and values, and whether the hover should drop decimals (same rule as create_map_geomap).
+    # The browser builds the trace for a year from this, so moving the year slider needs no server request.
+
+    offsets = pop_index["series"].get(series)
+    if offsets is None: return None
+
+    block = pop.iloc[offsets[0]:offsets[1]] # sorted by year, then country_id
+    years = block['year'].to_numpy()
+    ids = block['country_id'].to_numpy()
+    values = block['value_num'].to_numpy(dtype=np.float64)
+
+    # first row per (year, country), same as the drop_duplicates on the map path
+    keep = np.ones(len(block), dtype=bool)
+    keep[1:] = (years[1:] != years[:-1]) | (ids[1:] != ids[:-1])
+    years, ids, values = years[keep], ids[keep], values[keep]
+
+    present, positions = np.unique(ids, return_inverse=True)
+    countries = pop_index["countries"]
+
+    frames = []
+    for year in get_year_array(year_catalogue, series):
+        start, stop = np.searchsorted(years, [year, year + 1])
+        v = values[start:stop]
+        frames.append({"i": positions[start:stop].tolist(),
+                       "v": [None if np.isnan(x) else x for x in v.tolist()],
+                       "large": bool(np.any(~np.isnan(v)) and np.nanmean(v) > 1000000)})
+
+    return {"years": get_year_array(year_catalogue, series).tolist(),
+            "locations": countries['m49_un_a3'].to_numpy()[present].tolist(),
+            "names": countries['country'].to_numpy()[present].tolist(),
+            "frames": frames}
+
         
-def check_year(pop, series, year):
-           
-    # get unique years from series
-    #print("Testing. check_year function. Pop series year ",pop,series,year)
-    df = pop.loc[(pop['dataset_raw'] == series)]
-    
-    # convert to list
-    years = pd.DataFrame(pd.unique(df["year"]), columns=["value"])['value'].tolist()
+def build_year_catalogue(pop_index, INIT_year_SLIDER_FONTSIZE, INIT_year_SLIDER_FONTCOLOR):
+
+    # Build the per-series year catalogue ONCE at startup from the pop offsets index (no scans of pop required).
+    # For each series we keep: a sorted numpy array of years, the {slider index: year} dict the callbacks expect,
+    # the reverse {year: slider index} lookup, and the ready-made (styled and thinned) year slider marks.
+    # get_years, check_year, get_year_slider_index and get_year_slider_marks are then just dictionary reads.
+
+    series_years = {}
+    for series, year in pop_index["series_year"]:
+        series_years.setdefault(series, []).append(year)
+
+    year_catalogue = {}
+    for series in series_years:
+        years = sorted(series_years[series])
+        year_catalogue[series] = {"years":np.array(years, dtype=np.int64),
+                                  "year_dict":{i: years[i] for i in range(0, len(years))},
+                                  "year_index":{years[i]: i for i in range(0, len(years))},
+                                  "marks":create_year_slider_marks(years, INIT_year_SLIDER_FONTSIZE, INIT_year_SLIDER_FONTCOLOR),
+                                  }
+
+    return year_catalogue
+
+
+def check_year(year_catalogue, series, year):
            
-    # return bool if year found
-    return int(year) in years
+    # return bool if year found for this series
+    #print("Testing. check_year function. series year ",series,year)
+    if series not in year_catalogue: return False
+    try:
+        return int(year) in year_catalogue[series]["year_index"]
+    except (TypeError, ValueError):
+        return False
     
 
-def get_years(df):
-    # strip out years from dataset and return as dictionary (for control input)
-    df = df.sort_values('year')
-    years = pd.DataFrame(pd.unique(df["year"]), columns=["value"])
-    years = years["value"].to_dict()
-    #print(years)
-    return years
+def get_years(year_catalogue, series):
+    # return the years for this series as dictionary {slider index: year} (for control input). Read only, don't mutate it.
+    if series not in year_catalogue: return {}
+    return year_catalogue[series]["year_dict"]
+
+
+def get_year_array(year_catalogue, series):
+    # return sorted numpy array of years for this series (used for intersecting years across series in the chart modals)
+    if series not in year_catalogue: return np.array([], dtype=np.int64)
+    return year_catalogue[series]["years"]
 
 
-def get_year_slider_index(pop, series, year):
+def get_year_slider_index(year_catalogue, series, year):
     
-    #obtain relevant years for this series
-    yr_slider = get_years(pop.loc[(pop['dataset_raw'] == series)])
-        
-    if len(yr_slider) > 0:
-        for index in range(len(yr_slider)):  
-            if yr_slider[index] == year: return index
+    # lookup slider index of this year for this series
+    if series not in year_catalogue: return -1
+    yr_index = year_catalogue[series]["year_index"]
+    try:
+        if int(year) in yr_index: return yr_index[int(year)]
+    except (TypeError, ValueError):
+        pass
             
     #otherwise return most recent    
-    return len(yr_slider)-1
+    return len(yr_index)-1
+
+
+def get_year_slider_marks(year_catalogue, series):    
+    
+    # return a copy of the prebuilt slider marks for this series (callers set the selected year bold, so never hand out the cached dict)
+    if series not in year_catalogue: return {}
+    marks = year_catalogue[series]["marks"]
+    return {i: {"label": marks[i]["label"], "style": dict(marks[i]["style"])} for i in marks}
 
 
-def get_year_slider_marks(series, pop, INIT_year_SLIDER_FONTSIZE, INIT_year_SLIDER_FONTCOLOR, year_slider_selected):    
+def create_year_slider_marks(years, INIT_year_SLIDER_FONTSIZE, INIT_year_SLIDER_FONTCOLOR):    
     
-    #obtain relevant years for this series and update slider
-    year_slider_marks = get_years(pop.loc[(pop['dataset_raw'] == series)])
+    # build styled year slider marks from a sorted list of years (called once per series by build_year_catalogue)
     
     # add styling to year slider        
-    year_slider_marks2 = {
+    year_slider_marks = {
                     i: {
-                        "label": year_slider_marks[i],
+                        "label": years[i],
                         "style": {"fontSize": INIT_year_SLIDER_FONTSIZE, 'color':INIT_year_SLIDER_FONTCOLOR, 'fontWeight': 'normal'},
                     }
-                    for i in range(0, len(year_slider_marks))
+                    for i in range(0, len(years))
                 }   
-    
-    year_slider_marks=year_slider_marks2     
      
     # shorten year labels if needed
     
@@ -317,212 +832,185 @@ def get_year_slider_marks(series, pop, INIT_year_SLIDER_FONTSIZE, INIT_year_SLID
     return year_slider_marks
 
 
-def get_series_and_year(df, year, series, ascending):
+def get_series_and_year(df, pop_index, year, series, ascending):
     #print("Get series. year %r, series %r, ascending %r", year, series, ascending)
     
-    #Subset main dataframe for this series and year as a shallow copy (so we can cast value to Float)
-    d = copy.copy(df[(df["year"] == int(year)) & (df["dataset_raw"] == series)]) #This could be a memory leak, or at least seems inefficient.
-    
-    d['value'] = d['value'].astype(float) 
+    #Subset main dataframe for this series and year (contiguous slice via the index, already a new df with the country columns joined on)
+    d = get_pop_slice(df, pop_index, series, year)
     
     # dropping ALL duplicate values (THIS SHOULDNT BE NEEDED BUT SOME DATASETS MAY BE A LITTLE CORRUPTED. E.g 'Annual mean levels of fine particulate matter in cities, urban population (micrograms per cubic meter)'
-    d = d.drop_duplicates(subset ="m49_un_a3")
+    d = d.drop_duplicates(subset ="country_id")
 
-    d = d.sort_values('value', ascending=ascending)
+    d = d.sort_values('value_num', ascending=ascending)
     return d
 
-def get_series(df, series, ascending):
+def get_series(df, pop_index, series, ascending):
     #print("Get series. Series %r, ascending %r", series, ascending)
-    d = copy.copy(df[(df["dataset_raw"] == series)])
+    d = get_pop_slice(df, pop_index, series)
     d['year'] = d['year'].astype(int)
-    d['value'] = d['value'].astype(float)
-    d = d.sort_values('value', ascending=ascending)
+    d = d.sort_values('value_num', ascending=ascending)
     return d
 
-def update_3d_geo_data_JSON(df, geojson, colorscale, jellybean, var_type, discrete_colorscale):
+class FrozenDict(dict):
+    # Read-only dict for the geometry shared by every request (and thread) in a worker. Still a dict, so plotly, pydeck and json
+    # serialise it as normal. Renderers build overlays on top instead e.g. dict(feature, properties={...}), see update_3d_geo_data_JSON
+    
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("shared geometry is read-only, build an overlay on top of it instead")
+    
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _read_only
+    
+    # immutable, so copies can be the object itself (plotly deep copies trace props, this makes embedding geometry free)
+    def __copy__(self): return self
+    def __deepcopy__(self, memo): return self
+    def __reduce__(self): return (FrozenDict, (dict(self),))
+
+
+def freeze_geojson(obj):
+    # recursively freeze a parsed geojson: dicts become FrozenDicts and lists (features, coordinates) become tuples
+    if isinstance(obj, dict): return FrozenDict({k: freeze_geojson(v) for k, v in obj.items()})
+    if isinstance(obj, list): return tuple(freeze_geojson(v) for v in obj)
+    return obj
+
+
+def build_feature_index(geojson, key, countries):
+    # Precomputed join index for a geometry set: the m49 code and country_id of every feature by position (-1 if the code isn't a country
+    # in the data). key is the feature property holding the m49 code ('UN_A3' for the map geojson, 'sr_un_a3' for the globe)
+    ids_by_code = dict(zip(countries['m49_un_a3'].tolist(), range(len(countries))))
+    codes = [feature['properties'].get(key) for feature in geojson['features']]
+    country_ids = [ids_by_code.get(code, -1) for code in codes]
+    return {"key": key, "codes": codes, "country_ids": country_ids}
+
+
+def get_rows_by_country(df, columns):
+    # one pass over a series slice: country_id -> tuple of the given column values (first row per country), for joining to geojson features
+    df = df.drop_duplicates('country_id')
+    return dict(zip(df['country_id'].tolist(), zip(*[df[c].tolist() for c in columns])))
+
+
+def update_3d_geo_data_JSON(df, geojson, feature_index, colorscale, colorscale_reverse, jellybean, var_type, discrete_colorscale):
     # This is used for the globe to help it mimic the main map colours etc.
-    #update a copy of the geojson data to include series specific data from the passed in dataframe (subset) including label names, and colours
+    #return a new geojson with series specific data from the passed in dataframe (subset) including label names, and colours.
+    #The base geojson is shared, only the per feature value/properties are new (the geometry is never copied), see build_feature_index
         
     #FIRST DO THE COLOUR INTERPOLATION
     
-    #fix for removing note and source columns
-    df['fix1'] = "dummmy"
-    df['fix2'] = "dummy"
-    
     #For continuous data we'll do linear color interpolation based on the extracted colorscale from the main map
     if var_type == "continuous" or var_type == "ratio" or var_type == "quantitative":
     
-        #cast values to float
-        df['value'] = df['value'].astype(float)  
-        
-        #drop values below zero (they cannot be displayed on current choropleth style)
-        df = df[df.value > 0]  
-        
-        #transform the data values to log10 (zeros introduced where log not computed)
-        df['value_log10'] = np.log10(df['value'], out=np.zeros_like(df['value']), where=(df['value']!=0))        
-        
-        #now drop any rows with zero vals (or it will be affected by subsequent colour interpolation logic)
-        df = df[df.value_log10 != 0]       
-        
-        #translate data range to positive
-        mn = np.min(df["value_log10"])
-        mx = np.max(df["value_log10"])
-        if mn < 0.0:            
-            #print("Color correction, translating log vals")
-            df['value_log10'] = df['value_log10'] + abs(mn)
-        
-        #now calculate the 0-1 ratio (normalise)
-        df['f-log'] = df['value_log10'] / np.max(df["value_log10"]) #i.e. what proportion is it of the max   
-        
-        #get colorscale array from mapdata (this is variable length and can switch to RGB from Hex)
-        #colorscale = map_data['data'][0]['colorscale'] #an list of colours e.g. [1.1111, #hexcolour]   
-        
-        if colorscale[0][1][0] != "#":
-            #i.e. we have an RGB color array (happens after settings are changed), so convert to hex
-            #print("RGB color array found in map data. Converting to hex")
-            for i in range(0,len(colorscale)):              
-                red = extractRed(colorscale[i][1])
-                green = extractGreen(colorscale[i][1])
-                blue = extractBlue(colorscale[i][1])
-                hx = '#{:02x}{:02x}{:02x}'.format(red, green , blue)
-                #print(red, green, blue, hx)
-                colorscale[i][1] = hx #replace rgb string with hex string
-        
-        #print(df['f-log'])
-        #print(colorscale)
-        
-        #based on the value for each row, obtain the two colours and mixing to interpolate between them!
-        df['c1'] = df.apply(lambda row : extractColorPositions(colorscale, row['f-log'])[0], axis =1).astype(str)
-        df['c2'] = df.apply(lambda row : extractColorPositions(colorscale, row['f-log'])[1], axis =1).astype(str)
-        df['mix'] = df.apply(lambda row : extractColorPositions(colorscale, row['f-log'])[2], axis =1).astype(float)
+        #colour every row in one vectorised pass (log10 scale, values <= 0 can't be displayed so those rows are dropped). See colorize
+        keep, rgb = colorize(df['value_num'].to_numpy(), colorscale, "log", colorscale_reverse)
+        df = df[keep].copy()
         
-        #get hex val by linear interpolation between c1, c2, mix for each row, and also convert this into the component RGB vals (for deck.gl)
-        df['hex'] = df.apply(lambda row : colorFader(row['c1'], row['c2'], row['mix']), axis =1) #linear interpolation between two hex colours
-        
-        df['r'] = df.apply(lambda row : ImageColor.getcolor(row['hex'], "RGB")[0], axis =1).astype(str) #return the red (index 0 of tuple) from the RGB tuble returned by getcolor 
-        df['g'] = df.apply(lambda row : ImageColor.getcolor(row['hex'], "RGB")[1], axis =1).astype(str) #return the greeen (index 0 of tuple) from the RGB tuble returned by getcolor 
-        df['b'] = df.apply(lambda row : ImageColor.getcolor(row['hex'], "RGB")[2], axis =1).astype(str) #return the blue (index 0 of tuple) from the RGB tuble returned by getcolor 
-          
-        #print(df.columns)
-        #print(colorscale)
+        #component RGB vals as strings (for deck.gl)
+        df['r'] = rgb[:, 0].astype(str)
+        df['g'] = rgb[:, 1].astype(str)
+        df['b'] = rgb[:, 2].astype(str)
     
     #For discrete data, set colour scales based on global lookup
     elif var_type == "discrete":                
         
-        #mimic the same df structure as the continuous dataset, so the logic further below works (creating dummy columns)
-        df['value_log10'] = "dummy"
-        df['f-log'] = "dummy"
-        df['c1'] = "dummy"
-        df['c2'] = "dummy"
-        df['mix'] = "dummy"
-        df['hex'] = "dummy"  
-        
-        #obtain array of discrete categories
-        discrete_cats = pd.unique(df['value'])
-       
-        #loop through unique discrete categories and set the hex value based on discrete colour scale lookup
-        for i in range(0,len(discrete_cats)):                    
-            df.loc[df['value']==discrete_cats[i], 'hex'] = discrete_colorscale[i][0][1]
+        #colour each row by its category (categories in order of appearance, same as the main map), in one vectorised pass
+        rgb = colorize_discrete(df['value_cat'], discrete_colorscale)
         
-        #Convert the hex value to separate R/G/B values as cols, as this data is needed by pdeck to render the globe        
-        df['r'] = df.apply(lambda row : ImageColor.getcolor(row['hex'], "RGB")[0], axis =1).astype(str) #return the red (index 0 of tuple) from the RGB tuble returned by getcolor 
-        df['g'] = df.apply(lambda row : ImageColor.getcolor(row['hex'], "RGB")[1], axis =1).astype(str) #return the greeen (index 0 of tuple) from the RGB tuble returned by getcolor 
-        df['b'] = df.apply(lambda row : ImageColor.getcolor(row['hex'], "RGB")[2], axis =1).astype(str) #return the blue (index 0 of tuple) from the RGB tuble returned by getcolor 
+        #Separate R/G/B values as cols, as this data is needed by pdeck to render the globe
+        df = df.copy()
+        df['r'] = rgb[:, 0].astype(str)
+        df['g'] = rgb[:, 1].astype(str)
+        df['b'] = rgb[:, 2].astype(str)
     
     
     #NOW ADD COLOUR AND SERIES SPECIFIC DATA TO GEOJSON
     
-    #deep copy globe geojson
-    gj = copy.deepcopy(geojson)
-   
+    #discrete series show their class, everything else the number
+    value_col = get_value_column(var_type)
+    
+    #value and colour for each country, keyed by country_id (one pass over the df instead of a scan per feature)
+    rows = get_rows_by_country(df, [value_col, 'r', 'g', 'b'])
+    
     #loop through all 1300 geojson features and set the value based on current series
-    for i in range(0, len(gj['features'])):
-        try:                               
-            
-            #At this point, check if country name/val None (i.e. no data in DF), and grab the country name for the properties of the JSON, and set the value to 0            
-            #if no data exists for a country in this series, store the country name from json, set val to 0, and set a nice grey colour so it displays on jigsaw
-            if gj['features'][i]['properties']['sr_un_a3'] not in df["m49_un_a3"].values:
-                #print(gj['features'][i]['properties']['BRK_NAME'])
-                #gj['features'][i]['COUNTRY'] = gj['features'][i]['properties']['BRK_NAME'] #grab country name from json              
-                gj['features'][i]['value'] = "no data"                    
-                
-                #Colour ocean blue
-                if gj['features'][i]['COUNTRY'] == "Ocean" or gj['features'][i]['COUNTRY'] == "Caspian Sea":
-                    gj['features'][i]['properties']['red'] = "134" #ocean blue
-                    gj['features'][i]['properties']['green'] = "181"
-                    gj['features'][i]['properties']['blue'] = "209"
-                
-                #Colour all other features missing data as grey
-                else:
-                    gj['features'][i]['properties']['red'] = "224" #grey
-                    gj['features'][i]['properties']['green'] = "224"
-                    gj['features'][i]['properties']['blue'] = "224"
-                
-            else:  
-                #set value of current series to this row item in json               
-                gj['features'][i]['value'] = df[df["m49_un_a3"]==gj['features'][i]['properties']['sr_un_a3']].iloc[0,4] #set geojson property to the value of the series for that country
-                
-                #colour the feature for this country based on the interpolated colours
-                #print("\n Df cols. Need to know for red green blue bitch", df.columns)
-                if jellybean == False:                    
-                    gj['features'][i]['properties']['red']= df[df["m49_un_a3"]==gj['features'][i]['properties']['sr_un_a3']].iloc[0,14] #column index for red (these are added in in the code above)
-                    gj['features'][i]['properties']['green']= df[df["m49_un_a3"]==gj['features'][i]['properties']['sr_un_a3']].iloc[0,15]
-                    gj['features'][i]['properties']['blue']= df[df["m49_un_a3"]==gj['features'][i]['properties']['sr_un_a3']].iloc[0,16]
-         
-        except IndexError as error:
-            print("Globe: Exception thrown attempting to build custom dict from json (expected)")
-         
-    
-    return gj
-
-def colorFader(c1,c2,mix=0): 
-    #fade (linear interpolate) from color c1 (at mix=0) to c2 (mix=1)
-    #c1 and c2 are hex colours, mix variable is a float point between 0 and 1, and colour will be interpolated and a hex colour will be returned
-    c1=np.array(mpl.colors.to_rgb(c1))
-    c2=np.array(mpl.colors.to_rgb(c2))
-    return mpl.colors.to_hex((1-mix)*c1 + mix*c2)
-   
-def extractRed(rgb_str):
-    #rip out the red    
-    r = rgb_str.split(",")
-    red = r[0].strip("rgb() ") #select red val from the array, and remove zeros    
-    return int(red)
+    features = []
+    for feature, country_id in zip(geojson['features'], feature_index['country_ids']):
+        properties = dict(feature['properties'])
+        row = rows.get(country_id)
+        
+        #if no data exists for a country in this series, set a nice grey colour so it displays on jigsaw (ocean stays blue)
+        if row is None:
+            value = "no data"
+            if feature.get('COUNTRY') == "Ocean" or feature.get('COUNTRY') == "Caspian Sea":
+                properties['red'], properties['green'], properties['blue'] = "134", "181", "209" #ocean blue
+            else:
+                properties['red'], properties['green'], properties['blue'] = "224", "224", "224" #grey
+        
+        #set value of current series, and colour the feature for this country based on the interpolated colours
+        else:
+            value = row[0]
+            if jellybean == False: properties['red'], properties['green'], properties['blue'] = row[1], row[2], row[3]
+        
+        features.append(dict(feature, properties=properties, value=value))
+    
+    return dict(geojson, features=features)
 
+def parse_color(color):
+    # '#rrggbb' or 'rgb(r, g, b)' colour string (both turn up in plotly colorscales) to an (r, g, b) tuple of ints
+    return ImageColor.getrgb(color.strip())[:3]
 
-def extractGreen(rgb_str):
-    #rip out the green    
-    g = rgb_str.split(",")
-    green = g[1].strip() #select red val from the array, and remove zeros    
-    return int(green)
-    
-def extractBlue(rgb_str):
-    #rip out the blue
-    b = rgb_str.split(",")
-    blue = b[2].strip("() ") #select red val from the array, and remove zeros    
-    return int(blue)
 
-def extractColorPositions(colorscale, val):
-    #this function takes the given colour array and a value, and returns the respective c1, c2, mix vars needed for linear colour interpolation
+def get_color_lut(colorscale, reverse=True):
+    # Compile a plotly colorscale e.g. [[0.0, '#000004'], ..., [1.0, '#fcffa4']] into a COLOR_LUT_SIZE x 3 lookup table of RGB (uint8),
+    # linearly interpolated between the stops. Built once per colorscale and cached for the life of the worker.
+    # reverse flips the colours (not the stop positions), which is how the globe and jigsaw have always matched the main map.
 
-    colorscale_r = copy.deepcopy(colorscale)
-    
-    #reverse colorscale
-    for i in range(0, len(colorscale)):        
-        colorscale_r[(len(colorscale)-1)-i][1] = colorscale[i][1]
-    
-    colorscale = copy.deepcopy(colorscale_r)
-    
-    #Find the val position in the colour scale, store the two colours and the mix level to interpolate between them based on val
-    for i in range(0, len(colorscale)-1):    
-        
-        if val <= colorscale[i+1][0]:
-            c1 = colorscale[i][1]
-            c2 = colorscale[i+1][1]
-            mix = (val - colorscale[i][0]) / (colorscale[i+1][0] - colorscale[i][0])    
-            #print(c1)
-            #print(c2)
-            #print(mix)
-            return c1, c2, mix
-    return   
+    key = (tuple((float(stop[0]), str(stop[1])) for stop in colorscale), reverse)
+    lut = _color_luts.get(key)
+    if lut is None:
+        positions = np.array([float(stop[0]) for stop in colorscale])
+        colors = np.array([parse_color(stop[1]) for stop in colorscale], dtype=np.float64)
+        if reverse: colors = colors[::-1]
+        x = np.linspace(0.0, 1.0, COLOR_LUT_SIZE)
+        lut = np.round(np.stack([np.interp(x, positions, colors[:, c]) for c in range(3)], axis=1)).astype(np.uint8)
+        _color_luts[key] = lut
+    return lut
+
+
+def get_color_fractions(values, mode="log"):
+    # Normalise an array of values to 0-1 for colour lookup. Returns (mask of the values that can be coloured, their 0-1 fractions)
+    # log: log10 of the positive values (values <= 0 and log10 == 0 are dropped, as always), translated to start at 0 if any are negative, / max
+    # linear: value / max
+
+    values = np.asarray(values, dtype=np.float64)
+
+    if mode == "linear":
+        keep = np.isfinite(values)
+        f = values[keep]
+    else:
+        keep = values > 0
+        f = np.log10(values, out=np.zeros_like(values), where=keep)
+        keep = keep & (f != 0)
+        f = f[keep]
+        if len(f) > 0 and np.min(f) < 0.0: f = f + abs(np.min(f))
+
+    mx = np.max(f) if len(f) > 0 else 0
+    if mx > 0: f = f / mx
+    else: f = np.zeros_like(f)
+    return keep, f
+
+
+def map_colors(fractions, lut):
+    # 0-1 fractions to an N x 3 array of RGB (uint8) in one lookup
+    fractions = np.nan_to_num(np.clip(fractions, 0.0, 1.0))
+    return lut[np.rint(fractions * (len(lut) - 1)).astype(np.intp)]
+
+
+def colorize(values, colorscale, mode="log", reverse=True):
+    # Colour engine for the globe and jigsaw: values (array) to (mask of values kept, N x 3 RGB uint8 for the kept values)
+    keep, f = get_color_fractions(values, mode)
+    return keep, map_colors(f, get_color_lut(colorscale, reverse))
 
 
+def colorize_discrete(categories, discrete_colorscale, missing=(224, 224, 224)):
+    # Colour categories (pandas series) with the discrete colour scale, in order of first appearance. Missing categories are grey.
+    cats = pd.unique(categories.dropna())
+    palette = np.array([parse_color(discrete_colorscale[i][0][1]) for i in range(len(cats))] + [missing], dtype=np.uint8)
+    codes = pd.Categorical(categories, categories=cats).codes #-1 (the last palette entry) where missing
+    return palette[codes]
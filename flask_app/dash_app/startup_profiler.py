@@ -0,0 +1,103 @@
+# Startup profiler. Records where the boot time goes (module level loads in app.py, init_dashboard, create_dash_layout, init_callbacks)
+# For each phase we record wall time, the increase in peak RSS (resident memory) and bytes read (disk + network, from /proc/self/io)
+# Usage: sp.begin("name") ... sp.end("name"), or "with sp.phase('name'):" for short blocks. Phases can nest.
+# sp.finish() logs a summary and writes the JSON report to ATLAS_STARTUP_PROFILE (default tmp/startup_profile.json). See /benchmark_boot.py
+
+import os
+import json
+import time
+import threading
+import logging
+from contextlib import contextmanager
+
+try:
+    import resource # not on windows
+except ImportError:
+    resource = None
+
+logger = logging.getLogger("atlas")
+
+_boot_start = time.time()
+_open_phases = {}
+_phases = []
+_final = None # report frozen at sp.finish() (end of boot)
+_lock = threading.Lock()
+
+
+def _sample():
+    # (wall time, peak rss in bytes, bytes read so far) for this process
+    peak_rss = 0
+    if resource != None: peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 # KB on linux
+
+    bytes_read = 0
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('rchar:'): bytes_read = int(line.split()[1]) # every read() incl. sockets, so blob downloads count too
+    except OSError:
+        pass
+
+    return time.time(), peak_rss, bytes_read
+
+
+_boot_sample = _sample()
+
+
+def begin(name):
+    with _lock:
+        _open_phases[name] = _sample()
+
+
+def end(name):
+    finished = _sample()
+    with _lock:
+        started = _open_phases.pop(name, None)
+        if started == None: return
+        _phases.append({"phase": name,
+                        "start_s": round(started[0] - _boot_start, 3),
+                        "wall_s": round(finished[0] - started[0], 3),
+                        "peak_rss_delta_mb": round((finished[1] - started[1]) / 1e6, 1),
+                        "bytes_read_mb": round((finished[2] - started[2]) / 1e6, 1)})
+
+
+@contextmanager
+def phase(name):
+    begin(name)
+    try:
+        yield
+    finally:
+        end(name)
+
+
+def report():
+    # the startup profile as a dict (ready for json). Once boot has finished this is the frozen report.
+    if _final != None: return _final
+    now = _sample()
+    with _lock:
+        phases = list(_phases)
+    return {"pid": os.getpid(),
+            "total_s": round(now[0] - _boot_start, 3),
+            "peak_rss_mb": round(now[1] / 1e6, 1),
+            "bytes_read_mb": round((now[2] - _boot_sample[2]) / 1e6, 1),
+            "phases": phases}
+
+
+def finish():
+    # log the startup profile and write it to disk as json
+    global _final
+    profile = report()
+    _final = profile
+
+    logger.info("Startup profile: %.2fs total, peak RSS %.0fMB, %.0fMB read", profile["total_s"], profile["peak_rss_mb"], profile["bytes_read_mb"])
+    for p in profile["phases"]:
+        logger.info("  %-40s %8.2fs %10.1fMB rss %10.1fMB read", p["phase"], p["wall_s"], p["peak_rss_delta_mb"], p["bytes_read_mb"])
+
+    path = os.getenv("ATLAS_STARTUP_PROFILE", "tmp/startup_profile.json")
+    try:
+        if os.path.dirname(path) != '': os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(profile, f, indent=2)
+    except OSError as error:
+        logger.warning("Could not write startup profile to %s: %s", path, error)
+
+    return profile
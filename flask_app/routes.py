@@ -1,6 +1,8 @@
 """Routes for parent Flask app."""
 from flask import current_app as flask_app
 from flask import render_template
+from flask import jsonify
+from .dash_app import startup_profiler
 
 
 @flask_app.route("/dashapp")
@@ -11,3 +13,8 @@ def dash():
         template="home-template",        
     )
 
+
+@flask_app.route("/startup-profile")
+def startup_profile():
+    """Boot time profile of this worker (json)."""
+    return jsonify(startup_profiler.report())